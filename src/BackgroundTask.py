@@ -0,0 +1,71 @@
+import time
+
+
+class BackgroundTask:
+    # Runs one heavy computation at a time for a dashboard output in a shared executor, so the
+    # server keeps answering while it runs. Each start() bumps the generation: a job that hasn't
+    # begun yet is cancelled and the result of one already running is discarded when it finishes.
+    # Starts are debounced, the job is only submitted once its inputs stayed the same for delay seconds.
+
+    def __init__(self, executor, delay=0.5):
+        self.executor = executor
+        self.delay = delay
+        self.generation = 0
+        self.key = None
+        self.future = None
+        self.pending = None  # (function, args, time the debounce ends) not submitted yet
+        self.result = None
+        self.error = None
+
+    # Schedule function(*args) for key, unless that key is already scheduled, running or done
+    def start(self, key, function, *args):
+        if key == self.key:
+            return self.generation
+        self.generation += 1
+        self.key = key
+        if self.future is not None:
+            self.future.cancel()
+        self.future = None
+        self.result = None
+        self.error = None
+        self.pending = (function, args, time.monotonic() + self.delay)
+        return self.generation
+
+    def run(self, generation, function, args):
+        # superseded while queued, don't bother
+        if generation != self.generation:
+            return None
+        return function(*args)
+
+    # 'waiting' (debouncing), 'running', 'done' or 'failed' for the latest start, submitting the job once
+    # its debounce has passed. Results of older generations never show up here.
+    def poll(self):
+        if self.pending is not None:
+            function, args, due = self.pending
+            if time.monotonic() < due:
+                return 'waiting'
+            self.pending = None
+            self.future = self.executor.submit(self.run, self.generation, function, args)
+
+        if self.future is None:
+            return 'failed' if self.error is not None else 'done'
+        if not self.future.done():
+            return 'running'
+
+        try:
+            self.result = self.future.result()
+        except Exception as e:
+            self.error = e
+        self.future = None
+        return 'failed' if self.error is not None else 'done'
+
+    # Forget the current job, e.g. when the output has nothing to compute
+    def cancel(self):
+        self.generation += 1
+        self.key = None
+        if self.future is not None:
+            self.future.cancel()
+        self.future = None
+        self.pending = None
+        self.result = None
+        self.error = None
@@ -0,0 +1,93 @@
+import numpy as np
+
+# Boundaries are cached as packed binary rings: every ring's (Longitude, Latitude) points as float32 pairs
+# one after another, int32 offsets where each ring starts (with the total point count at the end), and
+# int32 parts where each polygon's rings start, its exterior first then its holes.
+# Reading them back needs numpy only, no shapefile or geometry library.
+
+
+# Polygons of a shapely Polygon or MultiPolygon, each a list of (n, 2) ring arrays, exterior first
+def geometry_polygons(geometry):
+    polygons = geometry.geoms if hasattr(geometry, 'geoms') else [geometry]
+    return [
+        [np.asarray(polygon.exterior.coords)[:, :2]] + [np.asarray(ring.coords)[:, :2] for ring in polygon.interiors]
+        for polygon in polygons
+    ]
+
+
+def pack_polygons(polygons):
+    rings = [ring for polygon in polygons for ring in polygon]
+    coords = np.concatenate(rings).astype('float32') if rings else np.empty((0, 2), dtype='float32')
+    offsets = np.cumsum([0] + [len(ring) for ring in rings]).astype('int32')
+    parts = np.cumsum([0] + [len(polygon) for polygon in polygons]).astype('int32')
+    return coords.tobytes(), offsets.tobytes(), parts.tobytes()
+
+
+def unpack_rings(coords, offsets):
+    return np.frombuffer(coords, dtype='float32').reshape(-1, 2), np.frombuffer(offsets, dtype='int32')
+
+
+# Ring arrays of packed coordinates, for plotting
+def split_rings(coords, offsets):
+    return [coords[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+# GeoJSON MultiPolygon of a packed boundary, coordinates rounded to decimals to keep the payload small
+def geojson_geometry(coords, offsets, parts, decimals=4):
+    coords, offsets = unpack_rings(coords, offsets)
+    rings = [np.round(ring.astype('float64'), decimals).tolist() for ring in split_rings(coords, offsets)]
+    parts = np.frombuffer(parts, dtype='int32')
+    return {
+        'type': 'MultiPolygon',
+        'coordinates': [rings[start:end] for start, end in zip(parts[:-1], parts[1:])],
+    }
+
+
+# Which points fall inside the rings, by even-odd ray casting against every edge at once.
+# Holes and separate parts need no special handling: a point inside a hole crosses one extra ring.
+# Points are tested max_pairs / edges at a time to bound the point x edge arrays.
+def points_in_rings(latitudes, longitudes, coords, offsets, max_pairs=4000000):
+    latitudes = np.asarray(latitudes, dtype='float64')
+    longitudes = np.asarray(longitudes, dtype='float64')
+    inside = np.zeros(len(latitudes), dtype=bool)
+    if not len(coords) or not len(latitudes):
+        return inside
+
+    # each point's edge runs to the next point of its ring, the last point back to the first
+    following = np.arange(1, len(coords) + 1)
+    following[offsets[1:] - 1] = offsets[:-1]
+    x1, y1 = coords[:, 0].astype('float64'), coords[:, 1].astype('float64')
+    x2, y2 = x1[following], y1[following]
+    # horizontal edges never cross a horizontal ray
+    crossing = y1 != y2
+    x1, y1, x2, y2 = x1[crossing], y1[crossing], x2[crossing], y2[crossing]
+    slope = (x2 - x1) / (y2 - y1)
+
+    step = max(1, max_pairs // max(len(x1), 1))
+    for start in range(0, len(latitudes), step):
+        py = latitudes[start:start + step, None]
+        px = longitudes[start:start + step, None]
+        spans = (y1 > py) != (y2 > py)
+        crosses = spans & (px < x1 + (py - y1) * slope)
+        inside[start:start + step] = crosses.sum(axis=1) % 2 == 1
+    return inside
+
+
+# Name of the boundary containing each point, None outside all of them. boundaries holds
+# (name, packed coords, packed offsets, (min_lon, min_lat, max_lon, max_lat)); a point inside
+# several takes the first. The bounding box check leaves only nearby points for the ring test.
+def assign_points(latitudes, longitudes, boundaries):
+    latitudes = np.asarray(latitudes, dtype='float64')
+    longitudes = np.asarray(longitudes, dtype='float64')
+    names = np.full(len(latitudes), None, dtype=object)
+    for name, coords, offsets, (min_lon, min_lat, max_lon, max_lat) in boundaries:
+        candidates = np.flatnonzero(
+            (names == None) & (latitudes >= min_lat) & (latitudes <= max_lat)  # noqa: E711
+            & (longitudes >= min_lon) & (longitudes <= max_lon)
+        )
+        if not len(candidates):
+            continue
+        coords, offsets = unpack_rings(coords, offsets)
+        inside = points_in_rings(latitudes[candidates], longitudes[candidates], coords, offsets)
+        names[candidates[inside]] = name
+    return names
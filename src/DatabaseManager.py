@@ -1,20 +1,482 @@
 import sqlite3
 import csv
+import glob
+import hashlib
 import os
+import time
+import zipfile
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from Boundaries import assign_points, geometry_polygons, pack_polygons
+from FileCleaner import ZIP_SEPARATOR
+
+# Python type for each typed column, everything else stays text
+COLUMN_TYPES = {
+    "Latitude": float,
+    "Longitude": float,
+    "Arithmetic Mean": float,
+    "1st Max Value": float,
+    "1st Max Hour": lambda value: int(float(value)),
+    "AQI": lambda value: int(float(value)),
+}
+
+
+# Date column of a table, AQIdata uses Date and the site tables use Date Local
+def date_column(table_name):
+    return 'Date' if table_name == 'AQIdata' else 'Date Local'
+
+
+# Natural key of a table: one AQI value per CBSA per day, one reading per site per day
+def natural_key(table_name):
+    if table_name == 'AQIdata':
+        return ["CBSA Code", "Date"]
+    return ["Latitude", "Longitude", "Date Local"]
+
+
+# Columns a data preview page is sorted and sought on after State: CBSA then date or date then CBSA,
+# followed by the rest of the natural key so every row has a unique position.
+# The loader indexes these and the dashboard pages on them.
+def page_key(table_name, order='cbsa'):
+    name_column = 'CBSA' if table_name == 'AQIdata' else 'CBSA Name'
+    date = date_column(table_name)
+    rest = [col for col in natural_key(table_name) if col != date]
+    return ([name_column, date] if order == 'cbsa' else [date, name_column]) + rest
+
+
+# State part of a CBSA name, 'Philadelphia-Camden-Wilmington, PA-NJ-DE-MD' -> 'PA-NJ-DE-MD'
+def cbsa_state(cbsa_name):
+    if cbsa_name is None:
+        return None
+    return cbsa_name.split(', ')[-1]
+
+
+# Parse and type-convert the rows of one cleaned CSV, skipping rows that don't fit the columns
+def read_csv_rows(csv_file, columns):
+    converters = [COLUMN_TYPES.get(col, str) for col in columns]
+    with open(csv_file, 'r', newline='') as csvfile:
+        csvreader = csv.reader(csvfile)
+        next(csvreader)  # Skip header row
+        for row in csvreader:
+            # Trim whitespace and check length
+            row = [col.strip() for col in row]
+            if len(row) != len(columns):
+                print(f"Skipping row with incorrect column count ({len(row)}): {row}")
+                continue  # Skip invalid rows
+            try:
+                yield tuple(convert(col) for convert, col in zip(converters, row))
+            except ValueError as e:
+                print(f"Skipping row {row}: {e}")
+
+
+# Parse a whole cleaned CSV, runs inside a worker process so it must stay module level
+def parse_csv_file(csv_file, columns):
+    start = time.perf_counter()
+    rows = list(read_csv_rows(csv_file, columns))
+    return rows, time.perf_counter() - start
+
+
+# (size, mtime_ns) of a source, for a zip member the uncompressed size and the archive's mtime
+def source_stat(path):
+    if ZIP_SEPARATOR in path:
+        archive, member = path.split(ZIP_SEPARATOR, 1)
+        with zipfile.ZipFile(archive) as zf:
+            size = zf.getinfo(member).file_size
+        return size, os.stat(archive).st_mtime_ns
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+# SHA-1 of a file's contents, read in 1 MB blocks. Zip members use the CRC-32 the archive
+# already stores, so checking them never has to decompress anything.
+def file_hash(path):
+    if ZIP_SEPARATOR in path:
+        archive, member = path.split(ZIP_SEPARATOR, 1)
+        with zipfile.ZipFile(archive) as zf:
+            return f'crc32:{zf.getinfo(member).CRC:08x}'
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
 
 class DatabaseManager:
-    def __init__(self, db_name='air.db'):
+    # Column order of the cleaned site-level CSVs (temperature and pollutant tables)
+    SITE_COLUMNS = ["Latitude", "Longitude", "Date Local", "Arithmetic Mean", "1st Max Value", "1st Max Hour",
+                    "Address", "CBSA Name"]
+    # Column order of the cleaned AQI CSVs
+    AQI_COLUMNS = ["CBSA", "CBSA Code", "Date", "AQI", "Category", "Defining Parameter"]
+
+    # table name -> (directory, cleaned file prefix, columns).
+    # AQIdata goes first so the site tables can pick up CBSA codes while they load.
+    TABLE_SOURCES = {
+        'AQIdata': ('data/daily_aqi', 'aqi', AQI_COLUMNS),
+        'temperatures': ('data/daily_temp', 'temp', SITE_COLUMNS),
+        'ozone': ('data/daily_ozone', 'ozone', SITE_COLUMNS),
+        'pm2.5': ('data/daily_pm2.5', 'pm25', SITE_COLUMNS),
+        'pm10': ('data/daily_pm10', 'pm10', SITE_COLUMNS),
+        'no2': ('data/daily_no2', 'no2', SITE_COLUMNS),
+        'so2': ('data/daily_so2', 'so2', SITE_COLUMNS),
+        'co': ('data/daily_co', 'co', SITE_COLUMNS),
+    }
+
+    # A site-day has one row per monitor (POC) and sample duration in the EPA files. The site tables keep
+    # one reading per site-day: the one ranking first by highest 1st Max Value, then highest Arithmetic Mean,
+    # then earliest 1st Max Hour, so the same reading wins whatever order the rows arrive in.
+    SITE_READING_ORDER = ['"1st Max Value" DESC', '"Arithmetic Mean" DESC', '"1st Max Hour" ASC']
+
+    # Cleaned CSVs from this year onwards are loaded, later years are picked up as they appear
+    FIRST_YEAR = 2017
+
+    # Rows handed to executemany at a time
+    BATCH_SIZE = 50000
+
+    # Rows staged before each merge into the real table, each merge is also a resumable checkpoint.
+    # Large enough that a yearly file is normally merged with a single statement.
+    CHECKPOINT_ROWS = 1000000
+
+    # PRAGMAs used while bulk loading, the previous values are restored afterwards.
+    # WAL keeps committed checkpoints intact if the loader process dies mid-file.
+    LOAD_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -262144,  # negative is KiB, 256 MB page cache
+        'temp_store': 'MEMORY',
+    }
+
+    # A day counts as an exceedance day in the rollups when its highest reading is above the table's
+    # threshold: AQI over 100 (unhealthy for sensitive groups), the NAAQS level for each pollutant in
+    # its file units, and 90 F for temperatures.
+    EXCEEDANCE_THRESHOLDS = {
+        'AQIdata': 100,
+        'temperatures': 90,
+        'ozone': 0.070,  # ppm
+        'pm2.5': 35,  # ug/m3
+        'pm10': 150,  # ug/m3
+        'no2': 100,  # ppb
+        'so2': 75,  # ppb
+        'co': 9,  # ppm
+    }
+
+    # Boundary shapefiles cached by refresh_boundaries: kind -> (path, name column, label column,
+    # code column, simplify tolerance in degrees). State names are the postal abbreviations the State
+    # columns hold and CBSA names match the CBSA columns, labels are the display names.
+    BOUNDARY_SOURCES = {
+        'state': ('tl_2023_us_state/tl_2023_us_state.shp', 'STUSPS', 'NAME', 'GEOID', 0.01),
+        'cbsa': ('tl_2023_us_cbsa/tl_2023_us_cbsa.shp', 'NAME', 'NAME', 'GEOID', 0.005),
+    }
+
+    # Orderings of the dashboard's paginated data preview, see page_key
+    PAGE_ORDERS = ['cbsa', 'date']
+
+    # site table -> column prefix in the cbsa_daily wide table
+    WIDE_COLUMNS = {
+        'temperatures': 'Temperature',
+        'so2': 'SO2',
+        'ozone': 'Ozone',
+        'pm10': 'PM10',
+        'pm2.5': 'PM25',
+        'no2': 'NO2',
+        'co': 'CO',
+    }
+
+    # normalized=True stores the data as integer-keyed site/CBSA dimensions and fact tables,
+    # with views under the original table names
+    def __init__(self, db_name='air.db', normalized=False):
         # Initialize DatabaseManager with SQLite db named air.
         self.db_name = db_name
+        self.normalized = normalized
         # Connect to SQLite db
         print(f"Connecting to SQLite database: {self.db_name}")
         self.conn = sqlite3.connect(db_name)
+        # State is derived in SQL while merging, with the same split the dashboard uses
+        self.conn.create_function('cbsa_state', 1, cbsa_state, deterministic=True)
         # Need a pointer to move through db
         self.cursor = self.conn.cursor()
+        # set when new CBSA codes arrive, site rows loaded before them get backfilled
+        self.cbsa_codes_changed = False
+        # tables that had rows merged or deleted, their location_lookup rows get rebuilt
+        self.changed_tables = set()
+        # rows/sec per table from the most recent load
+        self.load_stats = {}
+        # source file -> error for files that failed in the most recent load, they are skipped until they change
+        self.load_failures = {}
+        self.run_at = None
+        # set by create_monitor_tables when SQLite has the rtree module
+        self.has_rtree = False
 
     # Define schema for temperature table and AQI table in the SQLite db.
     def create_schema(self):
+        self.check_layout()
+        if self.normalized:
+            self.create_normalized_schema()
+        else:
+            self.create_row_tables()
+
+        # CBSA name -> code, collected from AQIdata and used to fill "CBSA Code" on the site tables
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cbsa_codes (
+                CBSA TEXT PRIMARY KEY,
+                "CBSA Code" TEXT
+            )
+        ''')
+
+        # load throughput history, one row per table per load_all_data run
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS load_stats (
+                run_at TEXT,
+                table_name TEXT,
+                rows INTEGER,
+                seconds REAL,
+                rows_per_sec REAL
+            )
+        ''')
+
+        # years of a table loaded, reloaded or emptied since the last rollup refresh. Rows go in with the
+        # data they cover, so a load interrupted before its refresh leaves them for the next run.
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_pending (
+                table_name TEXT,
+                year INTEGER,
+                PRIMARY KEY (table_name, year)
+            ) WITHOUT ROWID
+        ''')
+
+        # ingestion manifest, one row per source file with its fingerprint and committed row count
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_manifest (
+                path TEXT PRIMARY KEY,
+                table_name TEXT,
+                year INTEGER,
+                size INTEGER,
+                mtime_ns INTEGER,
+                sha1 TEXT,
+                rows INTEGER,
+                status TEXT,
+                updated_at TEXT
+            )
+        ''')
+
+        # distinct (table, State, CBSA) combinations, the dashboard dropdowns read these instead of the tables
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS location_lookup (
+                table_name TEXT,
+                State TEXT,
+                CBSA TEXT,
+                PRIMARY KEY (table_name, State, CBSA)
+            ) WITHOUT ROWID
+        ''')
+
+        self.create_rollup_tables()
+        self.create_wide_tables()
+        self.create_monitor_tables()
+        self.create_boundary_tables()
+
+        print("Tables created: temperatures, AQIdata, ozone, pm2.5, pm10, no2, so2, co")
+
+        # commit transaction, save state
+        self.conn.commit()
+
+        # the normalized layout gets its keys and derived columns from the fact tables and views
+        if not self.normalized:
+            self.add_derived_columns()
+            self.create_natural_keys()
+
+    # Materialized summaries kept up to date by refresh_rollups. level is 'cbsa' or 'state' and area is
+    # the CBSA name or the state. n/total are the reading count and sum so means re-aggregate exactly,
+    # max is the highest daily max reading (AQI for AQIdata).
+    def create_rollup_tables(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_daily (
+                table_name TEXT,
+                level TEXT,
+                area TEXT,
+                State TEXT,
+                day TEXT,
+                n INTEGER,
+                total REAL,
+                mean REAL,
+                max REAL,
+                PRIMARY KEY (table_name, level, area, day)
+            ) WITHOUT ROWID
+        ''')
+
+        # monthly ('YYYY-MM') and yearly ('YYYY') stats over the daily means, percentiles are nearest-rank
+        for rollup_table, period_column in (('rollup_monthly', 'month'), ('rollup_yearly', 'year')):
+            self.cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {rollup_table} (
+                    table_name TEXT,
+                    level TEXT,
+                    area TEXT,
+                    State TEXT,
+                    {period_column} TEXT,
+                    days INTEGER,
+                    mean REAL,
+                    max REAL,
+                    p50 REAL,
+                    p90 REAL,
+                    exceedance_days INTEGER,
+                    PRIMARY KEY (table_name, level, area, {period_column})
+                ) WITHOUT ROWID
+            ''')
 
+        # one row per monitoring site per year, the spatial heatmap reads this instead of the site-day rows
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_site_yearly (
+                table_name TEXT,
+                Latitude REAL,
+                Longitude REAL,
+                year TEXT,
+                State TEXT,
+                CBSA TEXT,
+                days INTEGER,
+                total REAL,
+                mean REAL,
+                max REAL,
+                PRIMARY KEY (table_name, Latitude, Longitude, year)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_rollup_site_yearly_state ON rollup_site_yearly (table_name, State, CBSA)'
+        )
+
+        # pairwise sufficient statistics of the daily CBSA means over the days both tables have a value,
+        # per CBSA per year and per state per year. Correlations for any selection are sums of these rows.
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS correlation_stats (
+                level TEXT,
+                area TEXT,
+                State TEXT,
+                year TEXT,
+                table_x TEXT,
+                table_y TEXT,
+                n INTEGER,
+                sx REAL,
+                sy REAL,
+                sxx REAL,
+                syy REAL,
+                sxy REAL,
+                PRIMARY KEY (level, area, year, table_x, table_y)
+            ) WITHOUT ROWID
+        ''')
+
+    # One row per CBSA per day with its AQI and, for each site table, the mean over its sites,
+    # the highest daily max and the number of sites reporting. Replaces merging site rows onto AQIdata.
+    def create_wide_tables(self):
+        measure_columns = ''.join(
+            f'''
+                "{prefix}" REAL,
+                "{prefix} Max" REAL,
+                "{prefix} Sites" INTEGER,'''
+            for prefix in self.WIDE_COLUMNS.values()
+        )
+        self.cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS cbsa_daily (
+                CBSA TEXT,
+                Date TEXT,
+                State TEXT,
+                AQI INTEGER,{measure_columns}
+                PRIMARY KEY (CBSA, Date)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_cbsa_daily_state ON cbsa_daily (State, Date)')
+
+        # mean position of each CBSA's monitoring sites, the combined data's Latitude/Longitude
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cbsa_centroids (
+                CBSA TEXT PRIMARY KEY,
+                Latitude REAL,
+                Longitude REAL,
+                sites INTEGER
+            )
+        ''')
+
+    # One row per monitoring site across the site tables, with each table's latest reading, and an R-tree
+    # over the site positions for bounding-box lookups. SQLite builds without the rtree module skip the
+    # R-tree, lookups then range-scan the (Latitude, Longitude) key instead.
+    def create_monitor_tables(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS monitor_sites (
+                site_id INTEGER PRIMARY KEY,
+                Latitude REAL NOT NULL,
+                Longitude REAL NOT NULL,
+                State TEXT,
+                CBSA TEXT,
+                UNIQUE (Latitude, Longitude)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS monitor_latest (
+                site_id INTEGER,
+                table_name TEXT,
+                Date TEXT,
+                "Arithmetic Mean" REAL,
+                "1st Max Value" REAL,
+                PRIMARY KEY (site_id, table_name)
+            ) WITHOUT ROWID
+        ''')
+        try:
+            self.cursor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS monitor_sites_rtree USING rtree(site_id, min_lat, max_lat, min_lon, max_lon)'
+            )
+            self.has_rtree = True
+        except sqlite3.OperationalError:
+            print("SQLite rtree module not available, monitor lookups will use the coordinate index.")
+            self.has_rtree = False
+
+    # Simplified state and CBSA boundaries as packed binary rings (see Boundaries.py) with their bounding
+    # boxes, the shapefile each kind was built from, and the boundary each monitor site falls in
+    def create_boundary_tables(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS boundaries (
+                kind TEXT,
+                name TEXT,
+                label TEXT,
+                code TEXT,
+                min_lon REAL,
+                min_lat REAL,
+                max_lon REAL,
+                max_lat REAL,
+                coords BLOB,
+                offsets BLOB,
+                parts BLOB,
+                PRIMARY KEY (kind, name)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS boundary_sources (
+                kind TEXT PRIMARY KEY,
+                path TEXT,
+                size INTEGER,
+                mtime_ns INTEGER
+            )
+        ''')
+        # name is NULL for sites outside every boundary, so they aren't tested again
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS site_boundaries (
+                site_id INTEGER,
+                kind TEXT,
+                name TEXT,
+                PRIMARY KEY (site_id, kind)
+            ) WITHOUT ROWID
+        ''')
+
+    # A database keeps the layout it was built with, opening it with the other one is an error
+    def check_layout(self):
+        existing = self.cursor.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'AQIdata'"
+        ).fetchone()
+        if existing is None:
+            return
+        if self.normalized and existing[0] == 'table':
+            raise ValueError(f"{self.db_name} was built with the row layout, open it with normalized=False")
+        if not self.normalized and existing[0] == 'view':
+            raise ValueError(f"{self.db_name} was built with the normalized layout, open it with normalized=True")
+
+    # One wide table per dataset with text dates and repeated site/CBSA columns
+    def create_row_tables(self):
         # temperature table
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS temperatures (
@@ -25,7 +487,9 @@ class DatabaseManager:
                 "1st Max Value" REAL,
                 "1st Max Hour" INTEGER,
                 "Address" TEXT,
-                "CBSA Name" TEXT
+                "CBSA Name" TEXT,
+                "State" TEXT,
+                "CBSA Code" TEXT
             )
         ''')
 
@@ -37,7 +501,8 @@ class DatabaseManager:
                 "Date" TEXT,
                 AQI INTEGER,
                 Category TEXT,
-                "Defining Parameter" TEXT
+                "Defining Parameter" TEXT,
+                "State" TEXT
             )
         ''')
 
@@ -51,7 +516,9 @@ class DatabaseManager:
                 "1st Max Value" REAL,
                 "1st Max Hour" INTEGER,
                 "Address" TEXT,
-                "CBSA Name" TEXT
+                "CBSA Name" TEXT,
+                "State" TEXT,
+                "CBSA Code" TEXT
             )
         ''')
 
@@ -65,7 +532,9 @@ class DatabaseManager:
                 "1st Max Value" REAL,
                 "1st Max Hour" INTEGER,
                 "Address" TEXT,
-                "CBSA Name" TEXT
+                "CBSA Name" TEXT,
+                "State" TEXT,
+                "CBSA Code" TEXT
             )
         ''')
 
@@ -79,7 +548,9 @@ class DatabaseManager:
                 "1st Max Value" REAL,
                 "1st Max Hour" INTEGER,
                 "Address" TEXT,
-                "CBSA Name" TEXT
+                "CBSA Name" TEXT,
+                "State" TEXT,
+                "CBSA Code" TEXT
             )
         ''')
 
@@ -93,7 +564,9 @@ class DatabaseManager:
                 "1st Max Value" REAL,
                 "1st Max Hour" INTEGER,
                 "Address" TEXT,
-                "CBSA Name" TEXT
+                "CBSA Name" TEXT,
+                "State" TEXT,
+                "CBSA Code" TEXT
             )
         ''')
 
@@ -107,7 +580,9 @@ class DatabaseManager:
                 "1st Max Value" REAL,
                 "1st Max Hour" INTEGER,
                 "Address" TEXT,
-                "CBSA Name" TEXT
+                "CBSA Name" TEXT,
+                "State" TEXT,
+                "CBSA Code" TEXT
             )
         ''')
 
@@ -121,247 +596,1041 @@ class DatabaseManager:
                 "1st Max Value" REAL,
                 "1st Max Hour" INTEGER,
                 "Address" TEXT,
-                "CBSA Name" TEXT
+                "CBSA Name" TEXT,
+                "State" TEXT,
+                "CBSA Code" TEXT
             )
         ''')
 
+    # Fact table behind a view in the normalized layout
+    def fact_table(self, table_name):
+        if table_name == 'AQIdata':
+            return 'aqi_facts'
+        return f"{table_name.replace('.', '')}_facts"
 
-        print("Tables created: temperatures, AQIdata, ozone, pm2.5, pm10, no2, so2, co")
+    # Normalized layout: sites and cbsa dimensions with integer keys, fact tables holding
+    # integer ids, epoch-day dates and REAL values, and views with the original column names
+    def create_normalized_schema(self):
+        # CBSA dimension, names are unique; codes are not because renamed CBSAs keep their code
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cbsa (
+                cbsa_id INTEGER PRIMARY KEY,
+                "CBSA Code" INTEGER,
+                "CBSA Name" TEXT NOT NULL UNIQUE,
+                "State" TEXT
+            )
+        ''')
 
-        # commit transaction, save state
-        self.conn.commit()
+        # monitoring site dimension, one row per coordinate
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sites (
+                site_id INTEGER PRIMARY KEY,
+                "Latitude" REAL NOT NULL,
+                "Longitude" REAL NOT NULL,
+                "Address" TEXT,
+                cbsa_id INTEGER REFERENCES cbsa (cbsa_id),
+                UNIQUE ("Latitude", "Longitude")
+            )
+        ''')
 
-    # ! generic method for loading data, reduce code duplication
-    # def load_data(self, table_name, csv_path, columns):
-    #     for year in range(2013, 2024):
-    #         csv_file = f'{csv_path}/cleaned_{table_name}_{year}.csv'
-    #         if os.path.exists(csv_file):
-    #             with open(csv_file, 'r', newline='') as csvfile:
-    #                 csvreader = csv.reader(csvfile)
-    #                 next(csvreader)  # Skip header row
-    #                 for row in csvreader:
-    #                     self.cursor.execute(f'''
-    #                         INSERT OR IGNORE INTO {table_name} ({', '.join(columns)})
-    #                         VALUES ({', '.join('?' for _ in columns)})
-    #                     ''', row)
-    #             print(f"Data loaded into {table_name} table from {csv_file}")
-    #         else:
-    #             print(f"File {csv_file} not found.")
-    #     self.conn.commit()
+        # AQI facts, one row per CBSA per day
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS aqi_facts (
+                cbsa_id INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                aqi INTEGER,
+                category TEXT,
+                defining_parameter TEXT,
+                PRIMARY KEY (cbsa_id, day)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('''
+            CREATE VIEW IF NOT EXISTS AQIdata AS
+            SELECT c."CBSA Name" AS CBSA, CAST(c."CBSA Code" AS TEXT) AS "CBSA Code",
+                   date(f.day + 2440587.5) AS "Date", f.aqi AS AQI, f.category AS Category,
+                   f.defining_parameter AS "Defining Parameter", c."State" AS "State"
+            FROM aqi_facts f JOIN cbsa c ON c.cbsa_id = f.cbsa_id
+        ''')
 
-    # Load data from CSV into temperatures table
-    def load_temperature_data(self):
-        for year in range(2017, 2024):  # Years from 2013 to 2023
-            csv_file = f'data/daily_temp/cleaned_temp_{year}.csv'
-            if os.path.exists(csv_file):
-                with open(csv_file, 'r', newline='') as csvfile:
-                    csvreader = csv.reader(csvfile)
-                    next(csvreader)  # Skip header row
-                    for row in csvreader:
-                        # Insert data into table
-                        self.cursor.execute('''
-                            INSERT OR IGNORE INTO temperatures 
-                            ("Latitude", "Longitude", "Date Local", "Arithmetic Mean", "1st Max Value", "1st Max Hour", 
-                            "Address", "CBSA Name")
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', row)
-                print(f"Data loaded into temperatures table from {csv_file}")
-            else:
-                print(f"File {csv_file} not found.")
+        # site facts, one row per site per day for each temperature/pollutant table
+        for table_name in self.TABLE_SOURCES:
+            if table_name == 'AQIdata':
+                continue
+            fact_table = self.fact_table(table_name)
+            self.cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS "{fact_table}" (
+                    site_id INTEGER NOT NULL,
+                    day INTEGER NOT NULL,
+                    mean REAL,
+                    max_value REAL,
+                    max_hour INTEGER,
+                    PRIMARY KEY (site_id, day)
+                ) WITHOUT ROWID
+            ''')
+            self.cursor.execute(f'''
+                CREATE VIEW IF NOT EXISTS "{table_name}" AS
+                SELECT s."Latitude", s."Longitude", date(f.day + 2440587.5) AS "Date Local",
+                       f.mean AS "Arithmetic Mean", f.max_value AS "1st Max Value", f.max_hour AS "1st Max Hour",
+                       s."Address", c."CBSA Name", c."State", CAST(c."CBSA Code" AS TEXT) AS "CBSA Code"
+                FROM "{fact_table}" f
+                JOIN sites s ON s.site_id = f.site_id
+                JOIN cbsa c ON c.cbsa_id = s.cbsa_id
+            ''')
 
-        self.conn.commit()
+    # Load staged rows into the dimensions and upsert them into the fact table
+    def merge_staging_normalized(self, table_name, staging_name):
+        fact_table = self.fact_table(table_name)
+        # days since 1970-01-01, the views turn them back into ISO dates
+        epoch_day = 'CAST(julianday(s."{}") - 2440587.5 AS INTEGER)'
 
-    # Load data from CSV into AQI table
-    def load_aqi_data(self):
-        for year in range(2017, 2024):  # Years from 2013 to 2023
-            csv_file = f'data/daily_aqi/cleaned_aqi_{year}.csv'
-            if os.path.exists(csv_file):
-                with open(csv_file, 'r', newline='') as csvfile:
-                    csvreader = csv.reader(csvfile)
-                    next(csvreader)  # Skip header row
-                    for row in csvreader:
-                        # Trim whitespace and check length
-                        row = [col.strip() for col in row]  
-                        
-                        if len(row) != 6:
-                            print(f"Skipping row with incorrect column count ({len(row)}): {row}")
-                            continue  # Skip invalid rows
-                        
-                        # Insert data into table
-                        try:
-                            self.cursor.execute('''
-                                INSERT OR IGNORE INTO AQIdata 
-                                (CBSA, "CBSA Code", Date, AQI, Category, "Defining Parameter")
-                                VALUES (?, ?, ?, ?, ?, ?)
-                            ''', row)
-                        except Exception as e:
-                            print(f"Error inserting row {row}: {e}")
-                        # # Insert data into table
-                        # self.cursor.execute('''
-                        #     INSERT OR IGNORE INTO AQIdata 
-                        #     (CBSA, "CBSA Code", Date, AQI, Category, "Defining Parameter")
-                        #     VALUES (?, ?, ?, ?, ?, ?)
-                        # ''', row)
-                print(f"Data loaded into AQIdata table from {csv_file}")
+        if table_name == 'AQIdata':
+            self.cursor.execute(f'''
+                INSERT INTO cbsa ("CBSA Name", "CBSA Code", "State")
+                SELECT DISTINCT s.CBSA, CAST(s."CBSA Code" AS INTEGER), cbsa_state(s.CBSA) FROM "{staging_name}" s WHERE true
+                ON CONFLICT ("CBSA Name") DO UPDATE SET "CBSA Code" = excluded."CBSA Code"
+            ''')
+            self.cursor.execute(f'''
+                INSERT INTO aqi_facts (cbsa_id, day, aqi, category, defining_parameter)
+                SELECT c.cbsa_id, {epoch_day.format('Date')}, s.AQI, s.Category, s."Defining Parameter"
+                FROM "{staging_name}" s JOIN cbsa c ON c."CBSA Name" = s.CBSA WHERE true
+                ON CONFLICT (cbsa_id, day) DO UPDATE SET
+                    aqi = excluded.aqi, category = excluded.category, defining_parameter = excluded.defining_parameter
+            ''')
+        else:
+            self.cursor.execute(f'''
+                INSERT OR IGNORE INTO cbsa ("CBSA Name", "CBSA Code", "State")
+                SELECT DISTINCT s."CBSA Name", CAST(c."CBSA Code" AS INTEGER), cbsa_state(s."CBSA Name")
+                FROM "{staging_name}" s LEFT JOIN cbsa_codes c ON c.CBSA = s."CBSA Name"
+            ''')
+            self.cursor.execute(f'''
+                INSERT OR IGNORE INTO sites ("Latitude", "Longitude", "Address", cbsa_id)
+                SELECT s."Latitude", s."Longitude", MIN(s."Address"), MIN(c.cbsa_id)
+                FROM "{staging_name}" s JOIN cbsa c ON c."CBSA Name" = s."CBSA Name"
+                GROUP BY s."Latitude", s."Longitude"
+            ''')
+            self.cursor.execute(f'''
+                INSERT INTO "{fact_table}" (site_id, day, mean, max_value, max_hour)
+                SELECT si.site_id, {epoch_day.format('Date Local')}, s."Arithmetic Mean", s."1st Max Value", s."1st Max Hour"
+                FROM {self.ranked_staging(table_name, staging_name, join='JOIN sites si ON si."Latitude" = s."Latitude" AND si."Longitude" = s."Longitude"')}
+                ON CONFLICT (site_id, day) DO UPDATE SET
+                    mean = excluded.mean, max_value = excluded.max_value, max_hour = excluded.max_hour
+                WHERE {self.reading_ranks_first(
+                    ['excluded.max_value', 'excluded.mean', 'excluded.max_hour'],
+                    [f'"{fact_table}".max_value', f'"{fact_table}".mean', f'"{fact_table}".max_hour']
+                )}
+            ''')
+        self.cursor.execute(f'DELETE FROM "{staging_name}"')
+
+    # Remove one year of rows from a table before a changed file is reloaded
+    def delete_year(self, table_name, year):
+        self.changed_tables.add(table_name)
+        self.mark_changed_year(table_name, year)
+        if self.normalized:
+            epoch_day = 'CAST(julianday(?) - 2440587.5 AS INTEGER)'
+            self.cursor.execute(
+                f'DELETE FROM "{self.fact_table(table_name)}" WHERE day >= {epoch_day} AND day < {epoch_day}',
+                (f'{year}-01-01', f'{year + 1}-01-01')
+            )
+        else:
+            date_col = date_column(table_name)
+            self.cursor.execute(
+                f'DELETE FROM "{table_name}" WHERE "{date_col}" >= ? AND "{date_col}" < ?',
+                (f'{year}-01-01', f'{year + 1}-01-01')
+            )
+
+    # Columns filled in while merging rather than read from the CSVs, as SQL over the staging row s
+    def derived_columns(self, table_name):
+        if table_name == 'AQIdata':
+            return {"State": 'cbsa_state(s."CBSA")'}
+        return {
+            "State": 'cbsa_state(s."CBSA Name")',
+            "CBSA Code": '(SELECT c."CBSA Code" FROM cbsa_codes c WHERE c.CBSA = s."CBSA Name")',
+        }
+
+    # Databases created before State and CBSA Code existed get the columns added and backfilled
+    def add_derived_columns(self):
+        for table_name in self.TABLE_SOURCES:
+            existing = {row[1] for row in self.cursor.execute(f'PRAGMA table_info("{table_name}")')}
+            missing = [col for col in self.derived_columns(table_name) if col not in existing]
+            if not missing:
+                continue
+
+            name_col = 'CBSA' if table_name == 'AQIdata' else 'CBSA Name'
+            with self.conn:
+                for col in missing:
+                    self.cursor.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" TEXT')
+                self.cursor.execute(f'UPDATE "{table_name}" SET "State" = cbsa_state("{name_col}")')
+                if table_name == 'AQIdata':
+                    self.cursor.execute('''
+                        INSERT OR IGNORE INTO cbsa_codes (CBSA, "CBSA Code")
+                        SELECT DISTINCT CBSA, "CBSA Code" FROM AQIdata
+                    ''')
+            self.cbsa_codes_changed = True
+            print(f"Added {', '.join(missing)} to {table_name}")
+
+    # Fill "CBSA Code" on site rows that were loaded before their CBSA appeared in AQIdata
+    def backfill_cbsa_codes(self):
+        # the normalized layout fills codes on the cbsa dimension as AQIdata merges
+        if self.normalized or not self.cbsa_codes_changed:
+            return
+        with self.conn:
+            for table_name in self.TABLE_SOURCES:
+                if table_name == 'AQIdata':
+                    continue
+                self.cursor.execute(f'''
+                    UPDATE "{table_name}"
+                    SET "CBSA Code" = (SELECT c."CBSA Code" FROM cbsa_codes c WHERE c.CBSA = "{table_name}"."CBSA Name")
+                    WHERE "CBSA Code" IS NULL
+                ''')
+        self.cbsa_codes_changed = False
+
+    # Covering indexes for state/CBSA selections, built after the bulk load so inserts don't maintain them
+    def create_indexes(self):
+        if self.normalized:
+            # a state selection walks cbsa -> sites -> the fact table's (site_id, day) key
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_cbsa_state ON cbsa ("State", "CBSA Name")')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_cbsa_code ON cbsa ("CBSA Code")')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_sites_cbsa ON sites (cbsa_id)')
+            self.conn.commit()
+            self.cursor.execute('PRAGMA optimize')
+            return
+
+        for table_name in self.TABLE_SOURCES:
+            if table_name == 'AQIdata':
+                columns = '"State", "CBSA", "Date", "AQI"'
             else:
-                print(f"File {csv_file} not found.")
+                columns = '"State", "CBSA Name", "Date Local", "Arithmetic Mean"'
+            self.cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{self.index_name(table_name, "state")}" ON "{table_name}" ({columns})'
+            )
+            # the data preview seeks on State plus each page ordering, one index per ordering
+            for order in self.PAGE_ORDERS:
+                columns = ', '.join(f'"{col}"' for col in ['State'] + page_key(table_name, order))
+                self.cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{self.index_name(table_name, "page_" + order)}" '
+                    f'ON "{table_name}" ({columns})'
+                )
+        self.conn.commit()
+        # refresh planner statistics for tables whose indexes changed
+        self.cursor.execute('PRAGMA optimize')
+
+    # Rebuild the location_lookup rows of tables that changed in this run, or that have none yet
+    def refresh_location_lookup(self):
+        with self.conn:
+            for table_name in self.TABLE_SOURCES:
+                has_rows = self.cursor.execute(
+                    'SELECT 1 FROM location_lookup WHERE table_name = ? LIMIT 1', (table_name,)
+                ).fetchone()
+                if has_rows and table_name not in self.changed_tables:
+                    continue
+
+                if self.normalized and table_name == 'AQIdata':
+                    # CBSAs with at least one AQI day, found through the fact table's (cbsa_id, day) key
+                    select = '''
+                        SELECT DISTINCT c."State" AS State, c."CBSA Name" AS CBSA FROM cbsa c
+                        WHERE EXISTS (SELECT 1 FROM aqi_facts f WHERE f.cbsa_id = c.cbsa_id)
+                    '''
+                elif self.normalized:
+                    select = f'''
+                        SELECT DISTINCT c."State" AS State, c."CBSA Name" AS CBSA FROM sites s JOIN cbsa c ON c.cbsa_id = s.cbsa_id
+                        WHERE EXISTS (SELECT 1 FROM "{self.fact_table(table_name)}" f WHERE f.site_id = s.site_id)
+                    '''
+                else:
+                    # covered by the (State, CBSA, ...) index
+                    name_column = 'CBSA' if table_name == 'AQIdata' else 'CBSA Name'
+                    select = f'SELECT DISTINCT "State" AS State, "{name_column}" AS CBSA FROM "{table_name}"'
+
+                self.cursor.execute('DELETE FROM location_lookup WHERE table_name = ?', (table_name,))
+                self.cursor.execute(f'''
+                    INSERT INTO location_lookup (table_name, State, CBSA)
+                    SELECT ?, State, CBSA FROM ({select}) WHERE CBSA IS NOT NULL
+                ''', (table_name,))
+        self.changed_tables.clear()
+
+    # Mark a year of a table for the rollup refresh, in the caller's transaction
+    def mark_changed_year(self, table_name, year):
+        self.cursor.execute('INSERT OR IGNORE INTO rollup_pending (table_name, year) VALUES (?, ?)', (table_name, year))
+
+    # Tables with years waiting for the rollup refresh, from this run or an interrupted earlier one
+    def pending_tables(self):
+        return {table_name for (table_name,) in self.cursor.execute('SELECT DISTINCT table_name FROM rollup_pending')}
+
+    # Years of a table whose rollups need recomputing: the pending ones, or every year
+    # the first time a table is rolled up
+    def rollup_years(self, table_name):
+        years = {year for (year,) in self.cursor.execute(
+            'SELECT year FROM rollup_pending WHERE table_name = ?', (table_name,)
+        )}
+        has_rollups = self.cursor.execute(
+            'SELECT 1 FROM rollup_daily WHERE table_name = ? LIMIT 1', (table_name,)
+        ).fetchone()
+        if not has_rollups:
+            date_col = date_column(table_name)
+            years.update(int(year) for (year,) in self.cursor.execute(
+                f'SELECT DISTINCT substr("{date_col}", 1, 4) FROM "{table_name}"'
+            ) if year)
+        return sorted(years)
+
+    # Recompute the daily, monthly, yearly and site rollups for the years that changed, set-based in SQL
+    def refresh_rollups(self):
+        refreshed_years = set()
+        with self.conn:
+            for table_name in self.TABLE_SOURCES:
+                years = self.rollup_years(table_name)
+                if not years:
+                    continue
+                refreshed_years.update(years)
+                year_params = [str(year) for year in years]
+                year_list = ', '.join('?' for _ in years)
+
+                self.refresh_daily_rollup(table_name, year_list, year_params)
+                self.refresh_period_rollups(table_name, year_list, year_params)
+                if table_name != 'AQIdata':
+                    self.refresh_site_rollup(table_name, year_list, year_params)
+                    self.refresh_monitor_sites(table_name, year_list, year_params)
+                print(f"Rollups refreshed for {table_name} ({', '.join(year_params)})")
+            self.backfill_monitor_sites()
+            self.refresh_correlation_stats(refreshed_years)
+            self.refresh_cbsa_daily(refreshed_years)
+            self.cursor.execute('DELETE FROM rollup_pending')
+
+    # Years a table built from rollup_daily needs recomputed: the refreshed ones, or every year while it is empty
+    def derived_years(self, derived_table, years):
+        years = set(years)
+        if not self.cursor.execute(f'SELECT 1 FROM {derived_table} LIMIT 1').fetchone():
+            years.update(int(year) for (year,) in self.cursor.execute('SELECT DISTINCT substr(day, 1, 4) FROM rollup_daily'))
+        return sorted(years)
+
+    # Recompute the pairwise correlation statistics for years whose daily rollups changed,
+    # or for every year the first time
+    def refresh_correlation_stats(self, years):
+        years = self.derived_years('correlation_stats', years)
+        if not years:
+            return
+        year_params = [str(year) for year in years]
+        year_list = ', '.join('?' for _ in years)
+
+        self.cursor.execute(f'DELETE FROM correlation_stats WHERE year IN ({year_list})', year_params)
+        tables = list(self.TABLE_SOURCES)
+        for i, table_x in enumerate(tables):
+            for table_y in tables[i + 1:]:
+                # each CBSA-day where both tables have a daily mean is one observation
+                self.cursor.execute(f'''
+                    INSERT INTO correlation_stats (level, area, State, year, table_x, table_y, n, sx, sy, sxx, syy, sxy)
+                    SELECT 'cbsa', x.area, MAX(x.State), substr(x.day, 1, 4), ?, ?, COUNT(*),
+                           SUM(x.mean), SUM(y.mean), SUM(x.mean * x.mean), SUM(y.mean * y.mean), SUM(x.mean * y.mean)
+                    FROM rollup_daily x
+                    JOIN rollup_daily y ON y.table_name = ? AND y.level = 'cbsa' AND y.area = x.area AND y.day = x.day
+                    WHERE x.table_name = ? AND x.level = 'cbsa' AND substr(x.day, 1, 4) IN ({year_list})
+                    GROUP BY x.area, substr(x.day, 1, 4)
+                ''', [table_x, table_y, table_y, table_x] + year_params)
+
+        # a state's statistics are the sums over its CBSAs
+        self.cursor.execute(f'''
+            INSERT INTO correlation_stats (level, area, State, year, table_x, table_y, n, sx, sy, sxx, syy, sxy)
+            SELECT 'state', State, State, year, table_x, table_y, SUM(n), SUM(sx), SUM(sy), SUM(sxx), SUM(syy), SUM(sxy)
+            FROM correlation_stats
+            WHERE level = 'cbsa' AND year IN ({year_list}) AND State IS NOT NULL
+            GROUP BY State, year, table_x, table_y
+        ''', year_params)
+        print(f"Correlation statistics refreshed ({', '.join(year_params)})")
+
+    # Pivot the daily CBSA rollups of the refreshed years into cbsa_daily with one grouped pass,
+    # and recompute the CBSA centroids from the site rollup
+    def refresh_cbsa_daily(self, years):
+        years = self.derived_years('cbsa_daily', years)
+        if not years:
+            return
+        year_params = [str(year) for year in years]
+        year_list = ', '.join('?' for _ in years)
+
+        columns = ['CBSA', 'Date', 'State', 'AQI']
+        select = ["area", "day", "MAX(State)", "MAX(CASE WHEN table_name = 'AQIdata' THEN mean END)"]
+        for table_name, prefix in self.WIDE_COLUMNS.items():
+            columns += [prefix, f'{prefix} Max', f'{prefix} Sites']
+            select += [f"MAX(CASE WHEN table_name = '{table_name}' THEN {value} END)" for value in ('mean', 'max', 'n')]
+
+        self.cursor.execute(f'DELETE FROM cbsa_daily WHERE substr(Date, 1, 4) IN ({year_list})', year_params)
+        self.cursor.execute(f'''
+            INSERT INTO cbsa_daily ({', '.join(f'"{col}"' for col in columns)})
+            SELECT {', '.join(select)}
+            FROM rollup_daily
+            WHERE level = 'cbsa' AND substr(day, 1, 4) IN ({year_list})
+            GROUP BY area, day
+        ''', year_params)
+
+        self.cursor.execute('DELETE FROM cbsa_centroids')
+        self.cursor.execute('''
+            INSERT INTO cbsa_centroids (CBSA, Latitude, Longitude, sites)
+            SELECT CBSA, AVG(Latitude), AVG(Longitude), COUNT(*)
+            FROM (SELECT DISTINCT CBSA, Latitude, Longitude FROM rollup_site_yearly WHERE CBSA IS NOT NULL)
+            GROUP BY CBSA
+        ''')
+        print(f"CBSA daily table refreshed ({', '.join(year_params)})")
+
+    # Daily mean/max per CBSA from the table, then per state from the CBSA rows
+    def refresh_daily_rollup(self, table_name, year_list, year_params):
+        date_col = date_column(table_name)
+        if table_name == 'AQIdata':
+            name_col, value_col, max_col = 'CBSA', 'AQI', 'AQI'
+        else:
+            name_col, value_col, max_col = 'CBSA Name', 'Arithmetic Mean', '1st Max Value'
+
+        self.cursor.execute(
+            f'DELETE FROM rollup_daily WHERE table_name = ? AND substr(day, 1, 4) IN ({year_list})',
+            [table_name] + year_params
+        )
+        self.cursor.execute(f'''
+            INSERT INTO rollup_daily (table_name, level, area, State, day, n, total, mean, max)
+            SELECT ?, 'cbsa', "{name_col}", MAX("State"), "{date_col}",
+                   COUNT(*), SUM("{value_col}"), AVG("{value_col}"), MAX("{max_col}")
+            FROM "{table_name}"
+            WHERE substr("{date_col}", 1, 4) IN ({year_list}) AND "{name_col}" IS NOT NULL
+            GROUP BY "{name_col}", "{date_col}"
+        ''', [table_name] + year_params)
+        self.cursor.execute(f'''
+            INSERT INTO rollup_daily (table_name, level, area, State, day, n, total, mean, max)
+            SELECT table_name, 'state', State, State, day, SUM(n), SUM(total), SUM(total) * 1.0 / SUM(n), MAX(max)
+            FROM rollup_daily
+            WHERE table_name = ? AND level = 'cbsa' AND substr(day, 1, 4) IN ({year_list}) AND State IS NOT NULL
+            GROUP BY State, day
+        ''', [table_name] + year_params)
+
+    # Monthly and yearly stats from the daily rollup. Percentiles rank the daily means inside each
+    # period with window functions, exceedance days compare the daily max against the table's threshold.
+    def refresh_period_rollups(self, table_name, year_list, year_params):
+        threshold = self.EXCEEDANCE_THRESHOLDS.get(table_name)
+        for rollup_table, period_column, period in (('rollup_monthly', 'month', 'substr(day, 1, 7)'),
+                                                    ('rollup_yearly', 'year', 'substr(day, 1, 4)')):
+            self.cursor.execute(
+                f'DELETE FROM {rollup_table} WHERE table_name = ? AND substr({period_column}, 1, 4) IN ({year_list})',
+                [table_name] + year_params
+            )
+            self.cursor.execute(f'''
+                INSERT INTO {rollup_table}
+                (table_name, level, area, State, {period_column}, days, mean, max, p50, p90, exceedance_days)
+                SELECT table_name, level, area, MAX(State), period, COUNT(*), SUM(total) * 1.0 / SUM(n), MAX(max),
+                       MIN(CASE WHEN day_rank * 100 >= 50 * period_days THEN mean END),
+                       MIN(CASE WHEN day_rank * 100 >= 90 * period_days THEN mean END),
+                       SUM(max > ?)
+                FROM (
+                    SELECT table_name, level, area, State, {period} AS period, n, total, mean, max,
+                           ROW_NUMBER() OVER (PARTITION BY level, area, {period} ORDER BY mean) AS day_rank,
+                           COUNT(*) OVER (PARTITION BY level, area, {period}) AS period_days
+                    FROM rollup_daily
+                    WHERE table_name = ? AND substr(day, 1, 4) IN ({year_list})
+                )
+                GROUP BY level, area, period
+            ''', [threshold, table_name] + year_params)
+
+    # Per-site yearly totals for the spatial heatmap
+    def refresh_site_rollup(self, table_name, year_list, year_params):
+        self.cursor.execute(
+            f'DELETE FROM rollup_site_yearly WHERE table_name = ? AND year IN ({year_list})',
+            [table_name] + year_params
+        )
+        self.cursor.execute(f'''
+            INSERT INTO rollup_site_yearly (table_name, Latitude, Longitude, year, State, CBSA, days, total, mean, max)
+            SELECT ?, "Latitude", "Longitude", substr("Date Local", 1, 4), MAX("State"), MAX("CBSA Name"),
+                   COUNT(*), SUM("Arithmetic Mean"), AVG("Arithmetic Mean"), MAX("1st Max Value")
+            FROM "{table_name}"
+            WHERE substr("Date Local", 1, 4) IN ({year_list})
+            GROUP BY "Latitude", "Longitude", substr("Date Local", 1, 4)
+        ''', [table_name] + year_params)
+
+    # Add the sites of a table's refreshed years to monitor_sites and its R-tree, and move each site's
+    # latest reading forward when those years hold a later day than the one recorded
+    def refresh_monitor_sites(self, table_name, year_list, year_params):
+        self.cursor.execute(f'''
+            INSERT INTO monitor_sites (Latitude, Longitude, State, CBSA)
+            SELECT Latitude, Longitude, MAX(State), MAX(CBSA) FROM rollup_site_yearly
+            WHERE table_name = ? AND year IN ({year_list})
+            GROUP BY Latitude, Longitude
+            ON CONFLICT (Latitude, Longitude) DO UPDATE SET
+                State = COALESCE(excluded.State, State), CBSA = COALESCE(excluded.CBSA, CBSA)
+        ''', [table_name] + year_params)
+        if self.has_rtree:
+            self.cursor.execute('''
+                INSERT INTO monitor_sites_rtree (site_id, min_lat, max_lat, min_lon, max_lon)
+                SELECT site_id, Latitude, Latitude, Longitude, Longitude FROM monitor_sites
+                WHERE site_id NOT IN (SELECT site_id FROM monitor_sites_rtree)
+            ''')
 
+        # the bare columns come from the row holding each site's MAX date
+        self.cursor.execute(f'''
+            INSERT INTO monitor_latest (site_id, table_name, Date, "Arithmetic Mean", "1st Max Value")
+            SELECT s.site_id, ?, latest.day, latest.mean, latest.max
+            FROM (
+                SELECT "Latitude", "Longitude", MAX("Date Local") AS day, "Arithmetic Mean" AS mean,
+                       "1st Max Value" AS max
+                FROM "{table_name}"
+                WHERE substr("Date Local", 1, 4) IN ({year_list})
+                GROUP BY "Latitude", "Longitude"
+            ) latest
+            JOIN monitor_sites s ON s.Latitude = latest."Latitude" AND s.Longitude = latest."Longitude"
+            WHERE true
+            ON CONFLICT (site_id, table_name) DO UPDATE SET
+                Date = excluded.Date, "Arithmetic Mean" = excluded."Arithmetic Mean",
+                "1st Max Value" = excluded."1st Max Value"
+            WHERE excluded.Date >= monitor_latest.Date
+        ''', [table_name] + year_params)
+
+    # Fill the monitor tables for site tables that have rollups but no monitor rows yet,
+    # e.g. databases built before the monitor tables existed
+    def backfill_monitor_sites(self):
+        for table_name in self.TABLE_SOURCES:
+            if table_name == 'AQIdata':
+                continue
+            has_rows = self.cursor.execute(
+                'SELECT 1 FROM monitor_latest WHERE table_name = ? LIMIT 1', (table_name,)
+            ).fetchone()
+            if has_rows:
+                continue
+            year_params = [row[0] for row in self.cursor.execute(
+                'SELECT DISTINCT year FROM rollup_site_yearly WHERE table_name = ?', (table_name,)
+            )]
+            if year_params:
+                year_list = ', '.join('?' for _ in year_params)
+                self.refresh_monitor_sites(table_name, year_list, year_params)
+
+    # Cache simplified boundaries from each shapefile in BOUNDARY_SOURCES that exists and changed since it
+    # was last cached, then assign monitor sites to them. geopandas is only needed for this one-time step,
+    # everything reading the cache uses numpy. Returns True when any boundaries were rebuilt.
+    def refresh_boundaries(self):
+        rebuilt = False
+        for kind, (path, name_column, label_column, code_column, tolerance) in self.BOUNDARY_SOURCES.items():
+            if not os.path.exists(path):
+                continue
+            size, mtime_ns = source_stat(path)
+            recorded = self.cursor.execute(
+                'SELECT size, mtime_ns FROM boundary_sources WHERE kind = ?', (kind,)
+            ).fetchone()
+            if recorded == (size, mtime_ns):
+                continue
+
+            import geopandas as gpd
+            shapes = gpd.read_file(path).to_crs(epsg=4326)
+            shapes['geometry'] = shapes.geometry.simplify(tolerance, preserve_topology=True)
+            rows = []
+            for name, label, code, geometry in zip(shapes[name_column], shapes[label_column],
+                                                   shapes[code_column], shapes.geometry):
+                if geometry is None or geometry.is_empty:
+                    continue
+                min_lon, min_lat, max_lon, max_lat = geometry.bounds
+                coords, offsets, parts = pack_polygons(geometry_polygons(geometry))
+                rows.append((kind, name, label, code, min_lon, min_lat, max_lon, max_lat, coords, offsets, parts))
+
+            with self.conn:
+                self.cursor.execute('DELETE FROM boundaries WHERE kind = ?', (kind,))
+                self.cursor.executemany('''
+                    INSERT OR REPLACE INTO boundaries
+                    (kind, name, label, code, min_lon, min_lat, max_lon, max_lat, coords, offsets, parts)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                self.cursor.execute(
+                    'INSERT OR REPLACE INTO boundary_sources (kind, path, size, mtime_ns) VALUES (?, ?, ?, ?)',
+                    (kind, path, size, mtime_ns)
+                )
+                self.cursor.execute('DELETE FROM site_boundaries WHERE kind = ?', (kind,))
+            print(f"Cached {len(rows)} simplified {kind} boundaries from {path}")
+            rebuilt = True
+
+        self.assign_site_boundaries()
+        return rebuilt
+
+    # Point-in-polygon assignment of the monitor sites that have no site_boundaries row yet
+    def assign_site_boundaries(self):
+        for kind in self.BOUNDARY_SOURCES:
+            sites = self.cursor.execute('''
+                SELECT s.site_id, s.Latitude, s.Longitude FROM monitor_sites s
+                LEFT JOIN site_boundaries b ON b.site_id = s.site_id AND b.kind = ?
+                WHERE b.site_id IS NULL
+            ''', (kind,)).fetchall()
+            if not sites:
+                continue
+            boundaries = [
+                (name, coords, offsets, (min_lon, min_lat, max_lon, max_lat))
+                for name, coords, offsets, min_lon, min_lat, max_lon, max_lat in self.cursor.execute(
+                    'SELECT name, coords, offsets, min_lon, min_lat, max_lon, max_lat FROM boundaries WHERE kind = ?',
+                    (kind,)
+                )
+            ]
+            if not boundaries:
+                continue
+
+            names = assign_points([site[1] for site in sites], [site[2] for site in sites], boundaries)
+            with self.conn:
+                self.cursor.executemany(
+                    'INSERT OR REPLACE INTO site_boundaries (site_id, kind, name) VALUES (?, ?, ?)',
+                    [(site[0], kind, name) for site, name in zip(sites, names)]
+                )
+
+    # Unique index on each table's natural key, the upsert in merge_staging conflicts on it.
+    # Databases built before the keys existed are de-duplicated first.
+    def create_natural_keys(self):
+        for table_name in self.TABLE_SOURCES:
+            index_name = self.index_name(table_name, 'key')
+            exists = self.cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)
+            ).fetchone()
+            if exists:
+                continue
+
+            key_columns = ', '.join(f'"{col}"' for col in natural_key(table_name))
+            # site tables keep the reading the merge would keep, AQIdata the first row loaded
+            order = 'rowid' if table_name == 'AQIdata' else ', '.join(self.SITE_READING_ORDER + ['rowid'])
+            with self.conn:
+                removed = self.cursor.execute(f'''
+                    DELETE FROM "{table_name}" WHERE rowid NOT IN (
+                        SELECT rowid FROM (
+                            SELECT rowid, ROW_NUMBER() OVER (PARTITION BY {key_columns} ORDER BY {order}) AS reading_rank
+                            FROM "{table_name}"
+                        ) WHERE reading_rank = 1
+                    )
+                ''').rowcount
+                self.cursor.execute(f'CREATE UNIQUE INDEX "{index_name}" ON "{table_name}" ({key_columns})')
+            print(f"Natural key created on {table_name} ({removed} duplicate rows removed)")
+
+    # Count loads that changed rows in PRAGMA user_version, caches of rendered figures are keyed by it
+    def bump_data_version(self):
+        version = self.cursor.execute('PRAGMA user_version').fetchone()[0] + 1
+        self.cursor.execute(f'PRAGMA user_version = {version}')
         self.conn.commit()
 
-    # Load data from CSV into ozone table
-    def load_ozone_data(self):
-        for year in range(2017, 2024):  # Years from 2013 to 2023
-            csv_file = f'data/daily_ozone/cleaned_ozone_{year}.csv'
-            if os.path.exists(csv_file):
-                with open(csv_file, 'r', newline='') as csvfile:
-                    csvreader = csv.reader(csvfile)
-                    next(csvreader)  # Skip header row
-                    for row in csvreader:
-                        # Insert data into table
-                        self.cursor.execute('''
-                            INSERT OR IGNORE INTO ozone 
-                            ("Latitude", "Longitude", "Date Local", "Arithmetic Mean", "1st Max Value", "1st Max Hour", 
-                            "Address", "CBSA Name")
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', row)
-                print(f"Data loaded into ozone table from {csv_file}")
-            else:
-                print(f"File {csv_file} not found.")
+    # Temporarily swap in load-time PRAGMAs, returns the previous values so they can be restored
+    def apply_load_pragmas(self):
+        # journal_mode cannot change inside an open transaction
+        self.conn.commit()
+        previous = {}
+        for pragma, value in self.LOAD_PRAGMAS.items():
+            previous[pragma] = self.cursor.execute(f'PRAGMA {pragma}').fetchone()[0]
+            self.cursor.execute(f'PRAGMA {pragma} = {value}')
+        return previous
 
+    # Put back the PRAGMA values captured by apply_load_pragmas
+    def restore_pragmas(self, previous):
         self.conn.commit()
+        for pragma, value in previous.items():
+            self.cursor.execute(f'PRAGMA {pragma} = {value}')
+
+    # Cleaned CSV files for a table that exist on disk as (year, path), from FIRST_YEAR onwards
+    def csv_files(self, csv_path, prefix):
+        files = []
+        for csv_file in glob.glob(f'{csv_path}/cleaned_{prefix}_*.csv'):
+            year = os.path.basename(csv_file)[len(f'cleaned_{prefix}_'):-len('.csv')]
+            if year.isdigit() and int(year) >= self.FIRST_YEAR:
+                files.append((int(year), csv_file))
+
+        if not files:
+            print(f"No cleaned {prefix} files found in {csv_path}.")
+        return sorted(files)
+
+    # Index names can't contain the dot in pm2.5
+    def index_name(self, table_name, suffix):
+        return f"idx_{table_name.replace('.', '')}_{suffix}"
+
+    # Empty temp table with the same columns as table_name, rows are bulk inserted here before the merge
+    def staging_table(self, table_name, columns):
+        staging_name = f"staging_{table_name.replace('.', '')}"
+        self.cursor.execute(f'''
+            CREATE TEMP TABLE IF NOT EXISTS "{staging_name}" AS
+            SELECT {', '.join(f'"{col}"' for col in columns)} FROM "{table_name}" WHERE 0
+        ''')
+        return staging_name
+
+    # Staged rows of a site table as the FROM of a merge, only the first reading of each site-day by
+    # SITE_READING_ORDER. join is added after the staging rows s, ending in a WHERE so ON CONFLICT parses.
+    def ranked_staging(self, table_name, staging_name, join=''):
+        key_columns = ', '.join(f'"{col}"' for col in natural_key(table_name))
+        return f'''(
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY {key_columns} ORDER BY {', '.join(self.SITE_READING_ORDER)}) AS reading_rank
+            FROM "{staging_name}"
+        ) s {join} WHERE s.reading_rank = 1'''
+
+    # SQL condition that the incoming reading (max value, mean, max hour) ranks before the stored one by
+    # SITE_READING_ORDER, so an upsert only replaces a site-day with a reading that would have won the merge
+    def reading_ranks_first(self, incoming, stored):
+        (new_max, new_mean, new_hour), (old_max, old_mean, old_hour) = incoming, stored
+        return f'({new_max}, {new_mean}, -{new_hour}) > ({old_max}, {old_mean}, -{old_hour})'
+
+    # Set-based upsert of everything in the staging table into table_name, then empty the staging table
+    def merge_staging(self, table_name, staging_name, columns):
+        self.changed_tables.add(table_name)
+        if self.normalized:
+            if table_name == 'AQIdata':
+                self.cursor.execute(f'''
+                    INSERT OR IGNORE INTO cbsa_codes (CBSA, "CBSA Code")
+                    SELECT DISTINCT CBSA, "CBSA Code" FROM "{staging_name}"
+                ''')
+            self.merge_staging_normalized(table_name, staging_name)
+            return
+
+        key_columns = natural_key(table_name)
+        derived = self.derived_columns(table_name)
+        target_columns = columns + list(derived)
+        select_list = ', '.join([f's."{col}"' for col in columns] + list(derived.values()))
+        updates = ', '.join(f'"{col}" = excluded."{col}"' for col in target_columns if col not in key_columns)
+
+        if table_name == 'AQIdata':
+            self.cbsa_codes_changed |= self.cursor.execute(f'''
+                INSERT OR IGNORE INTO cbsa_codes (CBSA, "CBSA Code")
+                SELECT DISTINCT CBSA, "CBSA Code" FROM "{staging_name}"
+            ''').rowcount > 0
+
+        # a WHERE keeps SQLite from parsing ON CONFLICT as part of the SELECT's join
+        if table_name == 'AQIdata':
+            source, condition = f'"{staging_name}" s WHERE true', ''
+        else:
+            source = self.ranked_staging(table_name, staging_name)
+            condition = 'WHERE ' + self.reading_ranks_first(
+                ['excluded."1st Max Value"', 'excluded."Arithmetic Mean"', 'excluded."1st Max Hour"'],
+                [f'"{table_name}"."1st Max Value"', f'"{table_name}"."Arithmetic Mean"', f'"{table_name}"."1st Max Hour"']
+            )
+        self.cursor.execute(f'''
+            INSERT INTO "{table_name}" ({', '.join(f'"{col}"' for col in target_columns)})
+            SELECT {select_list} FROM {source}
+            ON CONFLICT ({', '.join(f'"{col}"' for col in key_columns)}) DO UPDATE SET {updates} {condition}
+        ''')
+        self.cursor.execute(f'DELETE FROM "{staging_name}"')
+
+    # Check a source file against the ingestion manifest.
+    # Returns the row to start loading from, or None when the file is already fully loaded.
+    def plan_file(self, table_name, year, csv_file):
+        size, mtime_ns = source_stat(csv_file)
+        entry = self.cursor.execute(
+            'SELECT size, mtime_ns, sha1, rows, status FROM ingest_manifest WHERE path = ?', (csv_file,)
+        ).fetchone()
+        sha1 = None
+
+        if entry is not None:
+            old_size, old_mtime_ns, old_sha1, rows, status = entry
+            unchanged = old_size == size and old_mtime_ns == mtime_ns
+            if not unchanged:
+                # size or mtime moved, only the hash can tell if the contents really changed
+                sha1 = file_hash(csv_file)
+                unchanged = sha1 == old_sha1
+                if unchanged:
+                    with self.conn:
+                        self.cursor.execute(
+                            'UPDATE ingest_manifest SET size = ?, mtime_ns = ? WHERE path = ?',
+                            (size, mtime_ns, csv_file)
+                        )
 
-    
+            if unchanged and status == 'complete':
+                print(f"Skipping unchanged file {csv_file}")
+                return None
+            if unchanged and status == 'failed':
+                # retried once the file is replaced or fixed
+                print(f"Skipping {csv_file}, it failed to load and hasn't changed since")
+                return None
+            if unchanged:
+                print(f"Resuming {csv_file} from row {rows}")
+                with self.conn:
+                    self.mark_changed_year(table_name, year)
+                return rows
+
+        # new or changed file: drop whatever an older version of it loaded and start from scratch
+        with self.conn:
+            if entry is not None:
+                print(f"File {csv_file} changed, reloading {year} into {table_name}")
+                self.delete_year(table_name, year)
+            self.cursor.execute('''
+                INSERT OR REPLACE INTO ingest_manifest
+                (path, table_name, year, size, mtime_ns, sha1, rows, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, 0, 'loading', ?)
+            ''', (csv_file, table_name, year, size, mtime_ns,
+                  sha1 or file_hash(csv_file), datetime.now().isoformat(timespec='seconds')))
+            self.mark_changed_year(table_name, year)
+        return 0
+
+    # Stage rows from start_row on with BATCH_SIZE executemany calls and merge them into the table
+    # with one upsert per CHECKPOINT_ROWS, returns the number of rows processed. Each merge commits
+    # together with its manifest checkpoint so an interrupted file resumes where it stopped.
+    def insert_rows(self, table_name, columns, rows, csv_file, start_row=0):
+        staging_name = self.staging_table(table_name, columns)
+        insert_sql = f'''
+            INSERT INTO "{staging_name}"
+            ({', '.join(f'"{col}"' for col in columns)})
+            VALUES ({', '.join('?' for _ in columns)})
+        '''
+        checkpoint_sql = 'UPDATE ingest_manifest SET rows = ?, status = ?, updated_at = ? WHERE path = ?'
+        rows = islice(rows, start_row, None)
+        row_count = start_row
+
+        while True:
+            staged = 0
+            with self.conn:
+                while staged < self.CHECKPOINT_ROWS:
+                    batch = list(islice(rows, min(self.BATCH_SIZE, self.CHECKPOINT_ROWS - staged)))
+                    if not batch:
+                        break
+                    self.cursor.executemany(insert_sql, batch)
+                    staged += len(batch)
+
+                if staged:
+                    self.merge_staging(table_name, staging_name, columns)
+                    row_count += staged
+                    self.cursor.execute(checkpoint_sql, (row_count, 'loading', datetime.now().isoformat(timespec='seconds'), csv_file))
+            if staged < self.CHECKPOINT_ROWS:
+                break
+
+        with self.conn:
+            self.cursor.execute(checkpoint_sql, (row_count, 'complete', datetime.now().isoformat(timespec='seconds'), csv_file))
+        return row_count - start_row
+
+    # insert_rows for one source file. A file that fails to read or clean is rolled back, marked failed
+    # in the manifest and recorded in load_failures, so the load goes on with the next file.
+    # Returns the rows loaded, None when the file failed.
+    def load_file(self, table_name, year, columns, rows, csv_file, start_row=0):
+        try:
+            return self.insert_rows(table_name, columns, rows, csv_file, start_row)
+        except Exception as e:
+            self.record_failure(table_name, year, csv_file, e)
+            return None
+
+    def file_failed(self, csv_file):
+        entry = self.cursor.execute('SELECT status FROM ingest_manifest WHERE path = ?', (csv_file,)).fetchone()
+        return entry is not None and entry[0] == 'failed'
+
+    # The failed file's year is emptied, so any other source that supplied that year (the cleaned CSV
+    # a raw file replaces) is set back to loading from row 0 and reloads instead of being skipped as complete.
+    def record_failure(self, table_name, year, csv_file, error):
+        now = datetime.now().isoformat(timespec='seconds')
+        with self.conn:
+            self.delete_year(table_name, year)
+            self.cursor.execute(
+                "UPDATE ingest_manifest SET rows = 0, status = 'failed', updated_at = ? WHERE path = ?",
+                (now, csv_file)
+            )
+            self.cursor.execute(
+                "UPDATE ingest_manifest SET rows = 0, status = 'loading', updated_at = ? "
+                "WHERE table_name = ? AND year = ? AND path != ? AND status != 'failed'",
+                (now, table_name, year, csv_file)
+            )
+        self.load_failures[csv_file] = str(error)
+        print(f"Loading {csv_file} into {table_name} FAILED: {error}")
+
+    # Generic bulk loader: loads new, changed or interrupted CSV files for a table, skips the rest
+    def load_data(self, table_name, csv_path, prefix, columns):
+        table_rows = 0
+        start = time.perf_counter()
+
+        for year, csv_file in self.csv_files(csv_path, prefix):
+            start_row = self.plan_file(table_name, year, csv_file)
+            if start_row is None:
+                continue
+
+            file_rows = self.load_file(table_name, year, columns, read_csv_rows(csv_file, columns), csv_file, start_row)
+            if file_rows is None:
+                continue
+            table_rows += file_rows
+            print(f"Data loaded into {table_name} table from {csv_file} ({file_rows} rows)")
+
+        elapsed = time.perf_counter() - start
+        self.record_load_stats(table_name, table_rows, elapsed)
+
+    # Parse the cleaned CSVs in a process pool while this thread is the only SQLite writer
+    def load_data_parallel(self, workers):
+        jobs = []
+        for table_name, (csv_path, prefix, columns) in self.TABLE_SOURCES.items():
+            for year, csv_file in self.csv_files(csv_path, prefix):
+                start_row = self.plan_file(table_name, year, csv_file)
+                if start_row is not None:
+                    jobs.append((table_name, year, csv_file, columns, start_row))
+        table_rows = {table_name: 0 for table_name in self.TABLE_SOURCES}
+        table_seconds = {table_name: 0.0 for table_name in self.TABLE_SOURCES}
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+            job_iter = iter(jobs)
+
+            # keep a couple of parsed files per worker in flight so memory stays bounded
+            def submit_next():
+                job = next(job_iter, None)
+                if job is not None:
+                    future = executor.submit(parse_csv_file, job[2], job[3])
+                    pending[future] = job
+
+            for _ in range(workers * 2):
+                submit_next()
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    table_name, year, csv_file, columns, start_row = pending.pop(future)
+                    submit_next()
+                    try:
+                        rows, parse_seconds = future.result()
+                    except Exception as e:
+                        self.record_failure(table_name, year, csv_file, e)
+                        continue
+
+                    start = time.perf_counter()
+                    file_rows = self.load_file(table_name, year, columns, rows, csv_file, start_row)
+                    table_seconds[table_name] += time.perf_counter() - start
+                    if file_rows is None:
+                        continue
+                    table_rows[table_name] += file_rows
+                    print(f"Data loaded into {table_name} table from {csv_file} "
+                          f"({file_rows} rows, parsed in {parse_seconds:.2f}s)")
+
+        # writer-side throughput, parsing overlaps across workers
+        for table_name in self.TABLE_SOURCES:
+            self.record_load_stats(table_name, table_rows[table_name], table_seconds[table_name])
+
+    # Print and store rows/sec for a table so load throughput can be tracked across runs
+    def record_load_stats(self, table_name, rows, elapsed):
+        rows_per_sec = rows / elapsed if elapsed > 0 else 0.0
+        print(f"Loaded {rows} rows into {table_name} in {elapsed:.2f}s ({rows_per_sec:,.0f} rows/sec)")
+        self.load_stats[table_name] = {'rows': rows, 'seconds': elapsed, 'rows_per_sec': rows_per_sec}
+
+        with self.conn:
+            self.cursor.execute('''
+                INSERT INTO load_stats (run_at, table_name, rows, seconds, rows_per_sec)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (self.run_at, table_name, rows, elapsed, rows_per_sec))
+
+    # Load data from CSV into temperatures table
+    def load_temperature_data(self):
+        self.load_data('temperatures', *self.TABLE_SOURCES['temperatures'])
+
+    # Load data from CSV into AQI table
+    def load_aqi_data(self):
+        self.load_data('AQIdata', *self.TABLE_SOURCES['AQIdata'])
+
+    # Load data from CSV into ozone table
+    def load_ozone_data(self):
+        self.load_data('ozone', *self.TABLE_SOURCES['ozone'])
 
     # Load data from CSV into PM2.5 table
     def load_pm25_data(self):
-        for year in range(2017, 2024):  # Years from 2013 to 2023
-            csv_file = f'data/daily_pm2.5/cleaned_pm25_{year}.csv'
-            if os.path.exists(csv_file):
-                with open(csv_file, 'r', newline='') as csvfile:
-                    csvreader = csv.reader(csvfile)
-                    next(csvreader)  # Skip header row
-                    for row in csvreader:
-                        # Insert data into table
-                        self.cursor.execute('''
-                            INSERT OR IGNORE INTO "pm2.5" 
-                            ("Latitude", "Longitude", "Date Local", "Arithmetic Mean", "1st Max Value", "1st Max Hour", 
-                            "Address", "CBSA Name")
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', row)
-                print(f"Data loaded into pm2.5 table from {csv_file}")
-            else:
-                print(f"File {csv_file} not found.")
-
-        self.conn.commit()
+        self.load_data('pm2.5', *self.TABLE_SOURCES['pm2.5'])
 
     # Load data from CSV into PM10 table
     def load_pm10_data(self):
-        for year in range(2017, 2024):  # Years from 2013 to 2023
-            csv_file = f'data/daily_pm10/cleaned_pm10_{year}.csv'
-            if os.path.exists(csv_file):
-                with open(csv_file, 'r', newline='') as csvfile:
-                    csvreader = csv.reader(csvfile)
-                    next(csvreader)  # Skip header row
-                    for row in csvreader:
-                        # Insert data into table
-                        self.cursor.execute('''
-                            INSERT OR IGNORE INTO pm10
-                            ("Latitude", "Longitude", "Date Local", "Arithmetic Mean", "1st Max Value", "1st Max Hour", 
-                            "Address", "CBSA Name")
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', row)
-                print(f"Data loaded into pm10 table from {csv_file}")
-            else:
-                print(f"File {csv_file} not found.")
-
-        self.conn.commit()
+        self.load_data('pm10', *self.TABLE_SOURCES['pm10'])
 
     # Load data from CSV into NO2 table
     def load_no2_data(self):
-        for year in range(2017, 2024):  # Years from 2013 to 2023
-            csv_file = f'data/daily_no2/cleaned_no2_{year}.csv'
-            if os.path.exists(csv_file):
-                with open(csv_file, 'r', newline='') as csvfile:
-                    csvreader = csv.reader(csvfile)
-                    next(csvreader)  # Skip header row
-                    for row in csvreader:
-                        # Insert data into table
-                        self.cursor.execute('''
-                            INSERT OR IGNORE INTO no2 
-                            ("Latitude", "Longitude", "Date Local", "Arithmetic Mean", "1st Max Value", "1st Max Hour", 
-                            "Address", "CBSA Name")
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', row)
-                print(f"Data loaded into NO2 table from {csv_file}")
-            else:
-                print(f"File {csv_file} not found.")
-
-        self.conn.commit()
+        self.load_data('no2', *self.TABLE_SOURCES['no2'])
 
     # Load data from CSV into SO2 table
     def load_so2_data(self):
-        for year in range(2017, 2024):  # Years from 2013 to 2023
-            csv_file = f'data/daily_so2/cleaned_so2_{year}.csv'
-            if os.path.exists(csv_file):
-                with open(csv_file, 'r', newline='') as csvfile:
-                    csvreader = csv.reader(csvfile)
-                    next(csvreader)  # Skip header row
-                    for row in csvreader:
-                        # Insert data into table
-                        self.cursor.execute('''
-                            INSERT OR IGNORE INTO so2 
-                            ("Latitude", "Longitude", "Date Local", "Arithmetic Mean", "1st Max Value", "1st Max Hour", 
-                            "Address", "CBSA Name")
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', row)
-                print(f"Data loaded into SO2 table from {csv_file}")
-            else:
-                print(f"File {csv_file} not found.")
-
-        self.conn.commit()
+        self.load_data('so2', *self.TABLE_SOURCES['so2'])
 
     # Load data from CSV into CO table
     def load_co_data(self):
-        for year in range(2017, 2024):  # Years from 2013 to 2023
-            csv_file = f'data/daily_co/cleaned_co_{year}.csv'
-            if os.path.exists(csv_file):
-                with open(csv_file, 'r', newline='') as csvfile:
-                    csvreader = csv.reader(csvfile)
-                    next(csvreader)  # Skip header row
-                    for row in csvreader:
-                        # Insert data into table
-                        self.cursor.execute('''
-                            INSERT OR IGNORE INTO co 
-                            ("Latitude", "Longitude", "Date Local", "Arithmetic Mean", "1st Max Value", "1st Max Hour", 
-                            "Address", "CBSA Name")
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', row)
-                print(f"Data loaded into CO table from {csv_file}")
-            else:
-                print(f"File {csv_file} not found.")
-
-        self.conn.commit()
+        self.load_data('co', *self.TABLE_SOURCES['co'])
 
     # Free resources
     def close_connection(self):
         self.conn.close()
         print("SQLite connection closed.")
 
-    def load_all_data(self):
+    # Schema, load pragmas, indexes and throughput report around one load pass
+    def run_load(self, load):
+        self.run_at = datetime.now().isoformat(timespec='seconds')
+        self.load_stats = {}
+        self.load_failures = {}
+
         # Create schema and load data
         self.create_schema()
-        self.load_temperature_data()
-        self.load_aqi_data()
-        self.load_ozone_data()
-        self.load_pm25_data()
-        self.load_pm10_data()
-        self.load_no2_data()
-        self.load_so2_data()
-        self.load_co_data()
+        previous_pragmas = self.apply_load_pragmas()
+        start = time.perf_counter()
+        try:
+            load()
+            # tables an interrupted earlier load changed without refreshing what derives from them
+            self.changed_tables.update(self.pending_tables())
+            # read before the refreshes below clear it
+            data_changed = bool(self.changed_tables)
+            self.backfill_cbsa_codes()
+            self.create_indexes()
+            self.refresh_location_lookup()
+            self.refresh_rollups()
+            boundaries_changed = self.refresh_boundaries()
+            if data_changed or boundaries_changed:
+                self.bump_data_version()
+        finally:
+            self.restore_pragmas(previous_pragmas)
+
+        total_rows = sum(stats['rows'] for stats in self.load_stats.values())
+        elapsed = time.perf_counter() - start
+        print(f"Loaded {total_rows} rows in {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+        for csv_file, error in self.load_failures.items():
+            print(f"Failed: {csv_file}: {error}")
 
         # Close connection
         self.close_connection()
+        return self.load_stats
+
+    # workers > 1 parses the CSV files in a process pool, the default keeps the serial path
+    def load_all_data(self, workers=1):
+        def load():
+            if workers and workers > 1:
+                self.load_data_parallel(workers)
+            else:
+                self.load_aqi_data()
+                self.load_temperature_data()
+                self.load_ozone_data()
+                self.load_pm25_data()
+                self.load_pm10_data()
+                self.load_no2_data()
+                self.load_so2_data()
+                self.load_co_data()
+
+        return self.run_load(load)
+
+    # Stream each raw EPA file through the FileCleaner rules straight into the staging table, so no
+    # cleaned CSV has to be written and read back. The manifest is keyed by the raw path,
+    # "archive::member" for files read straight out of an EPA zip.
+    # Years that only exist as cleaned CSVs (e.g. the checked-in data) are still loaded from those.
+    def load_raw_data(self, file_cleaner, table_name, kind, csv_path, columns, write_cleaned=False):
+        table_rows = 0
+        start = time.perf_counter()
+        raw_years = set()
+
+        for year, filename, filepath, output_file in file_cleaner.raw_sources(kind):
+            if not year.isdigit() or int(year) < self.FIRST_YEAR:
+                continue
+            start_row = self.plan_file(table_name, int(year), filepath)
+            if start_row is None:
+                # a raw file that failed leaves its year to the cleaned CSV, when there is one
+                if not self.file_failed(filepath):
+                    raw_years.add(int(year))
+                continue
+
+            chunks = file_cleaner.clean_chunks(kind, filepath, output_file if write_cleaned else None)
+            rows = (row for chunk in chunks for row in chunk.itertuples(index=False, name=None))
+            file_rows = self.load_file(table_name, int(year), columns, rows, filepath, start_row)
+            if file_rows is None:
+                continue
+            raw_years.add(int(year))
+            table_rows += file_rows
+            print(f"Data cleaned and loaded into {table_name} table from {filepath} ({file_rows} rows)")
+
+        for year, csv_file in self.csv_files(csv_path, kind):
+            if year in raw_years:
+                continue
+            start_row = self.plan_file(table_name, year, csv_file)
+            if start_row is None:
+                continue
+
+            file_rows = self.load_file(table_name, year, columns, read_csv_rows(csv_file, columns), csv_file, start_row)
+            if file_rows is None:
+                continue
+            table_rows += file_rows
+            print(f"Data loaded into {table_name} table from {csv_file} ({file_rows} rows)")
+
+        elapsed = time.perf_counter() - start
+        self.record_load_stats(table_name, table_rows, elapsed)
+
+    # Fused clean-and-load of every table. Pass write_cleaned=True to keep the cleaned CSVs as a side output.
+    def load_all_raw_data(self, file_cleaner, write_cleaned=False):
+        def load():
+            for table_name, (csv_path, prefix, columns) in self.TABLE_SOURCES.items():
+                self.load_raw_data(file_cleaner, table_name, prefix, csv_path, columns, write_cleaned)
 
+        return self.run_load(load)
 
 if __name__ == '__main__':
     # Create an instance of DatabaseManager
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import sqlite3
+from QueryCache import QueryCache
+
+
+class FigureCache(QueryCache):
+    # Rendered figure HTML fragments keyed by (figure type, table, state, CBSA), shared by every session.
+    # Entries belong to one data version of the database: the loader bumps PRAGMA user_version whenever
+    # a load changes rows, which drops the cached fragments. With a directory the fragments are also
+    # written to disk and survive restarts until the data version changes or the directory outgrows max_bytes.
+
+    def __init__(self, db_name='air.db', max_bytes=64 * 1024 * 1024, directory=None):
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__(db_name, max_bytes)
+
+    # Data version the loader keeps in the database header, replaces the file signature QueryCache uses
+    def database_signature(self):
+        if not os.path.exists(self.db_name):
+            return None
+        conn = sqlite3.connect(self.db_name)
+        try:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+        finally:
+            conn.close()
+
+    # Disk file of a fragment, named by data version and a hash of the key
+    def path_for(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'v{self.db_signature}-{digest}.html')
+
+    # Memory first, then disk; a fragment read from disk is kept in memory too
+    def get(self, key):
+        value = super().get(key)
+        if value is not None or self.directory is None:
+            return value
+
+        try:
+            with open(self.path_for(key), encoding='utf-8') as f:
+                value = f.read()
+        except FileNotFoundError:
+            return None
+        super().put(key, value)
+        return value
+
+    # version is the data version the fragment was built from, read with database_signature() before
+    # the build started. A fragment built while a load changed the data is dropped rather than cached
+    # under the new version.
+    def put(self, key, value, version=None):
+        size = self.size_of(value)
+        with self.lock:
+            self.check_database()
+            if version is not None and version != self.db_signature:
+                return
+            if size <= self.max_bytes:
+                self.insert(key, value, size)
+            if self.directory is None:
+                return
+
+            # write then rename, so a reader never sees half a fragment
+            path = self.path_for(key)
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+                f.write(value)
+            os.replace(f'{path}.tmp', path)
+            self.prune_directory()
+
+    # Remove fragments of other data versions, then the oldest ones while the directory is over max_bytes.
+    # Call with the lock held.
+    def prune_directory(self):
+        current = f'v{self.db_signature}-'
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.html'):
+                continue
+            if not name.startswith(current):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
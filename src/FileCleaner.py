@@ -1,7 +1,81 @@
 import os
+import time
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 
+
+# Clean one file and time it, module level so the process pool can pickle it
+def timed_clean_file(cleaner, kind, filepath, output_file):
+    start = time.perf_counter()
+    rows = cleaner.clean_file(kind, filepath, output_file)
+    return rows, time.perf_counter() - start
+
+
+# Raw sources inside an EPA zip archive are addressed as "<archive path>::<member name>"
+ZIP_SEPARATOR = '::'
+
+
+# File on disk a raw source lives in, the archive itself for a zip member
+def source_path(source):
+    return source.split(ZIP_SEPARATOR, 1)[0]
+
+
+# Open a raw source for reading, streaming zip members straight out of the archive without extracting them
+@contextmanager
+def open_source(source):
+    if ZIP_SEPARATOR not in source:
+        with open(source, 'rb') as f:
+            yield f
+        return
+
+    archive, member = source.split(ZIP_SEPARATOR, 1)
+    with zipfile.ZipFile(archive) as zf, zf.open(member) as f:
+        yield f
+
+
 class FileCleaner:
+    # kind -> (directory attribute, cleaned file prefix, label used in progress messages)
+    CLEANING_SOURCES = {
+        'aqi': ('aqi_directory', 'aqi', 'AQI'),
+        'temp': ('temp_directory', 'temp', 'Temperature'),
+        'ozone': ('ozone_directory', 'ozone', 'Ozone'),
+        'pm25': ('pm25_directory', 'pm25', 'PM2.5'),
+        'pm10': ('pm10_directory', 'pm10', 'PM10'),
+        'no2': ('no2_directory', 'no2', 'NO2'),
+        'so2': ('so2_directory', 'so2', 'SO2'),
+        'co': ('co_directory', 'co', 'CO'),
+    }
+
+    # columns kept from the raw AQI files and the dtype each one is parsed with
+    AQI_COLUMNS = {
+        'CBSA': str,
+        'CBSA Code': str,
+        'Date': str,
+        'AQI': 'float64',
+        'Category': str,
+        'Defining Parameter': str,
+    }
+
+    # columns kept from the raw temperature and pollutant files and the dtype each one is parsed with
+    SITE_COLUMNS = {
+        'Latitude': 'float64',
+        'Longitude': 'float64',
+        'Date Local': str,
+        'Arithmetic Mean': 'float64',
+        '1st Max Value': 'float64',
+        '1st Max Hour': 'float64',
+        'Address': str,
+        'CBSA Name': str,
+    }
+
+    # parsed as floats so missing values survive the read, written back as integers after dropna
+    INTEGER_COLUMNS = ['AQI', '1st Max Hour']
+
+    # rows per chunk, peak memory is bounded by this rather than by the file size
+    CHUNK_SIZE = 200000
+
     def __init__(self, aqi_directory, temp_directory, ozone_directory, pm25_directory, 
                  pm10_directory, no2_directory, so2_directory, co_directory):
         self.aqi_directory = aqi_directory
@@ -14,11 +88,9 @@ class FileCleaner:
         self.co_directory = co_directory
 
 
-    # Basic cleaning function to ensure data types are consistent, remove null values, and remove negative values
+    # Basic cleaning function to remove null values and negative values, vectorized over one chunk.
+    # Data types come from the explicit dtypes the raw files are read with.
     def basic_cleaning(self, df):
-        # Ensure data types are consistent
-        df = df.apply(pd.to_numeric, errors='ignore')
-        
         # Drop rows with any null values
         df = df.dropna()
 
@@ -26,204 +98,167 @@ class FileCleaner:
         if 'Arithmetic Mean' in df.columns:
             # filter the df with boolean Series, evaluates to true if >= 0, keep rows where true
             df = df[df['Arithmetic Mean'] >= 0] # df column 'Arithmetic Mean' condition >= 0
-        
-        return df
 
+        # No nulls left, so the integer columns can drop their float representation
+        for col in self.INTEGER_COLUMNS:
+            if col in df.columns:
+                df = df.astype({col: 'int64'})
 
-    # function to clean AQI CSV files, drop columns
-    def clean_aqi_files(self):
-        for filename in os.listdir(self.aqi_directory):
+        return df
+
+    # Stream a raw file in CHUNK_SIZE pieces, reading only the kept columns with explicit dtypes,
+    # and yield each chunk after basic cleaning
+    def iter_clean_chunks(self, kind, source):
+        columns = self.AQI_COLUMNS if kind == 'aqi' else self.SITE_COLUMNS
+        with open_source(source) as f, pd.read_csv(f, usecols=list(columns), dtype=columns, chunksize=self.CHUNK_SIZE) as reader:
+            for chunk in reader:
+                # usecols keeps file order, put the columns in the order the database expects
+                yield self.basic_cleaning(chunk[list(columns)])
+
+    # A cleaned file is up to date when it is at least as new as the raw file it came from
+    def is_up_to_date(self, filepath, output_file):
+        return os.path.exists(output_file) and os.path.getmtime(output_file) >= os.path.getmtime(source_path(filepath))
+
+
+    # Every raw file of one kind, as (year, filename, raw source, cleaned output path). The CSV members of
+    # daily_<param>_<year>.zip archives are included as "archive::member" sources unless the CSV was extracted.
+    def raw_sources(self, kind):
+        directory_attr, prefix, label = self.CLEANING_SOURCES[kind]
+        directory = getattr(self, directory_attr)
+        if not os.path.isdir(directory):
+            print(f"No {label} directory at {directory}, skipping.")
+            return []
+        filenames = sorted(os.listdir(directory))
+        sources = []
+        for filename in filenames:
             if filename.startswith("cleaned_"):
                 continue  # Skip already cleaned files
             if filename.endswith(".csv"):
-                filepath = os.path.join(self.aqi_directory, filename)
-                year = filename.split('_')[-1].split('.')[0] #extract the year
-                output_file = os.path.join(self.aqi_directory, f'cleaned_aqi_{year}.csv') # save in same directory
-
-                df = pd.read_csv(filepath, low_memory = False)
-                columns_to_drop = ['Defining Site', 'Number of Sites Reporting']
-
-                # Keep only columns that actually exist in the DataFrame
-                existing_columns_to_drop = [col for col in columns_to_drop if col in df.columns]
+                members = [(filename, os.path.join(directory, filename))]
+            elif filename.endswith(".zip"):
+                archive = os.path.join(directory, filename)
+                with zipfile.ZipFile(archive) as zf:
+                    members = [(member, f'{archive}{ZIP_SEPARATOR}{member}') for member in zf.namelist()
+                               if member.endswith(".csv") and os.path.basename(member) not in filenames]
+            else:
+                continue
+            for member, filepath in members:
+                year = member.split('_')[-1].split('.')[0] # extract the year
+                output_file = os.path.join(directory, f'cleaned_{prefix}_{year}.csv') # save in same directory
+                sources.append((year, member, filepath, output_file))
+        return sources
+
+    # Raw files of one kind that still need cleaning, as (filename, raw path, cleaned output path)
+    def raw_files(self, kind):
+        files = []
+        for year, filename, filepath, output_file in self.raw_sources(kind):
+            if self.is_up_to_date(filepath, output_file):
+                print(f"'{output_file}' is up to date, skipping.")
+                continue
+            files.append((filename, filepath, output_file))
+        return files
+
+    # Yield the cleaned chunks of one raw file, also appending them to output_file when one is given.
+    # The output is written under a temporary name first so a crash never leaves a partial file that looks up to date.
+    def clean_chunks(self, kind, filepath, output_file=None):
+        if output_file is None:
+            yield from self.iter_clean_chunks(kind, filepath)
+            return
+
+        columns = self.AQI_COLUMNS if kind == 'aqi' else self.SITE_COLUMNS
+        tmp_file = f'{output_file}.tmp'
+        header = True
+
+        with open(tmp_file, 'w', newline='') as f:
+            for chunk in self.iter_clean_chunks(kind, filepath):
+                chunk.to_csv(f, header=header, index=False)
+                header = False
+                yield chunk
+            if header:
+                # no chunks at all, still write the header
+                pd.DataFrame(columns=list(columns)).to_csv(f, index=False)
+
+        os.replace(tmp_file, output_file)
+
+    # Clean one raw file chunk by chunk into output_file. Returns the number of rows kept.
+    def clean_file(self, kind, filepath, output_file):
+        return sum(len(chunk) for chunk in self.clean_chunks(kind, filepath, output_file))
+
+    # Clean every raw file of one kind, one after another
+    def clean_files(self, kind):
+        label = self.CLEANING_SOURCES[kind][2]
+        for filename, filepath, output_file in self.raw_files(kind):
+            self.clean_file(kind, filepath, output_file)
+            print(f"{label} file '{filename}' cleaned and saved as '{output_file}'.")
 
-                if existing_columns_to_drop:
-                    df.drop(columns=existing_columns_to_drop, inplace=True)
-                else:
-                    print(f"Warning: Columns not found. Skipping column drop.")
-                # columns_to_drop = ["Defining Site", "Number of Sites Reporting"] # specify which columns to drop
-                # df.drop(columns = columns_to_drop, inplace=True) # modify current df
-
-                # Apply basic cleaning
-                df = self.basic_cleaning(df)
-
-                df.to_csv(output_file, index = False)
-                print(f"AQI file '{filename}' cleaned and saved as '{output_file}'. ")
+    # function to clean AQI CSV files, drop columns
+    def clean_aqi_files(self):
+        self.clean_files('aqi')
 
     # function to clean Temperature CSV files, drop columns
     def clean_temp_files(self):
-        for filename in os.listdir(self.temp_directory):
-            if filename.startswith("cleaned_"):
-                continue  # Skip already cleaned files
-            if filename.endswith(".csv"):
-                filepath = os.path.join(self.temp_directory, filename)
-                year = filename.split('_')[-1].split('.')[0] # extract the year
-                output_file = os.path.join(self.temp_directory, f'cleaned_temp_{year}.csv')
-
-                df = pd.read_csv(filepath, low_memory = False)
-                columns_to_drop = ["State Code", "County Code", "Site Num", "Parameter Code", "POC", "Datum", "Parameter Name", 
-                                "Sample Duration", "Pollutant Standard", "Units of Measure", 
-                                "Event Type", "Observation Count", "Observation Percent", "AQI",
-                                "Method Code", "Method Name", "Local Site Name", "State Name", "County Name", "City Name", "Date of Last Change"]
-                df.drop(columns = columns_to_drop, inplace = True)
-
-                # Apply basic cleaning
-                df = self.basic_cleaning(df)
-
-                df.to_csv(output_file, index = False)
-                print(f"Temperature file '{filename}' cleaned and saved as '{output_file}'.")
+        self.clean_files('temp')
 
     # function to clean Ozone CSV files, drop columns
     def clean_ozone_files(self):
-        for filename in os.listdir(self.ozone_directory):
-            if filename.startswith("cleaned_"):
-                continue  # Skip already cleaned files
-            if filename.endswith(".csv"):
-                filepath = os.path.join(self.ozone_directory, filename)
-                year = filename.split('_')[-1].split('.')[0] # extract the year
-                output_file = os.path.join(self.ozone_directory, f'cleaned_ozone_{year}.csv')
-
-                df = pd.read_csv(filepath, low_memory = False)
-                columns_to_drop = ["State Code", "County Code", "Site Num", "Parameter Code", "POC", "Datum", "Parameter Name", 
-                                "Sample Duration", "Pollutant Standard", "Units of Measure", 
-                                "Event Type", "Observation Count", "Observation Percent", "AQI",
-                                "Method Code", "Method Name", "Local Site Name", "State Name", "County Name", "City Name", "Date of Last Change"]
-                df.drop(columns = columns_to_drop, inplace = True)
-
-                # Apply basic cleaning
-                df = self.basic_cleaning(df)
-
-                df.to_csv(output_file, index = False)
-                print(f"Ozone file '{filename}' cleaned and saved as '{output_file}'.")
-    
+        self.clean_files('ozone')
+
     # function to clean pm2.5 CSV files, drop columns
     def clean_pm25_files(self):
-        for filename in os.listdir(self.pm25_directory):
-            if filename.startswith("cleaned_"):
-                continue  # Skip already cleaned files
-            if filename.endswith(".csv"):
-                filepath = os.path.join(self.pm25_directory, filename)
-                year = filename.split('_')[-1].split('.')[0] # extract the year
-                output_file = os.path.join(self.pm25_directory, f'cleaned_pm25_{year}.csv')
-
-                df = pd.read_csv(filepath, low_memory = False)
-                columns_to_drop = ["State Code", "County Code", "Site Num", "Parameter Code", "POC", "Datum", "Parameter Name", 
-                                "Sample Duration", "Pollutant Standard", "Units of Measure", 
-                                "Event Type", "Observation Count", "Observation Percent", "AQI",
-                                "Method Code", "Method Name", "Local Site Name", "State Name", "County Name", "City Name", "Date of Last Change"]
-                df.drop(columns = columns_to_drop, inplace = True)
-
-                # Apply basic cleaning
-                df = self.basic_cleaning(df)
-
-                df.to_csv(output_file, index = False)
-                print(f"PM2.5 file '{filename}' cleaned and saved as '{output_file}'.")
-      
+        self.clean_files('pm25')
+
     # function to clean pm10 CSV files, drop columns
     def clean_pm10_files(self):
-        for filename in os.listdir(self.pm10_directory):
-            if filename.startswith("cleaned_"):
-                continue  # Skip already cleaned files
-            if filename.endswith(".csv"):
-                filepath = os.path.join(self.pm10_directory, filename)
-                year = filename.split('_')[-1].split('.')[0] # extract the year
-                output_file = os.path.join(self.pm10_directory, f'cleaned_pm10_{year}.csv')
-
-                df = pd.read_csv(filepath, low_memory = False)
-                columns_to_drop = ["State Code", "County Code", "Site Num", "Parameter Code", "POC", "Datum", "Parameter Name", 
-                                "Sample Duration", "Pollutant Standard", "Units of Measure", 
-                                "Event Type", "Observation Count", "Observation Percent", "AQI",
-                                "Method Code", "Method Name", "Local Site Name", "State Name", "County Name", "City Name", "Date of Last Change"]
-                df.drop(columns = columns_to_drop, inplace = True)
-
-                # Apply basic cleaning
-                df = self.basic_cleaning(df)
-
-                df.to_csv(output_file, index = False)
-                print(f"PM10 file '{filename}' cleaned and saved as '{output_file}'.")
-      
+        self.clean_files('pm10')
 
     # function to clean NO2 CSV files, drop columns
     def clean_no2_files(self):
-        for filename in os.listdir(self.no2_directory):
-            if filename.startswith("cleaned_"):
-                continue  # Skip already cleaned files
-            if filename.endswith(".csv"):
-                filepath = os.path.join(self.no2_directory, filename)
-                year = filename.split('_')[-1].split('.')[0] # extract the year
-                output_file = os.path.join(self.no2_directory, f'cleaned_no2_{year}.csv')
-
-                df = pd.read_csv(filepath, low_memory = False)
-                columns_to_drop = ["State Code", "County Code", "Site Num", "Parameter Code", "POC", "Datum", "Parameter Name", 
-                                "Sample Duration", "Pollutant Standard", "Units of Measure", 
-                                "Event Type", "Observation Count", "Observation Percent", "AQI",
-                                "Method Code", "Method Name", "Local Site Name", "State Name", "County Name", "City Name", "Date of Last Change"]
-                df.drop(columns = columns_to_drop, inplace = True)
-
-                # Apply basic cleaning
-                df = self.basic_cleaning(df)
-
-                df.to_csv(output_file, index = False)
-                print(f"NO2 file '{filename}' cleaned and saved as '{output_file}'.")
-    
+        self.clean_files('no2')
+
     # function to clean SO2 CSV files, drop columns
     def clean_so2_files(self):
-        for filename in os.listdir(self.so2_directory):
-            if filename.startswith("cleaned_"):
-                continue  # Skip already cleaned files
-            if filename.endswith(".csv"):
-                filepath = os.path.join(self.so2_directory, filename)
-                year = filename.split('_')[-1].split('.')[0] # extract the year
-                output_file = os.path.join(self.so2_directory, f'cleaned_so2_{year}.csv')
-
-                df = pd.read_csv(filepath, low_memory = False)
-                columns_to_drop = ["State Code", "County Code", "Site Num", "Parameter Code", "POC", "Datum", "Parameter Name", 
-                                "Sample Duration", "Pollutant Standard", "Units of Measure", 
-                                "Event Type", "Observation Count", "Observation Percent", "AQI",
-                                "Method Code", "Method Name", "Local Site Name", "State Name", "County Name", "City Name", "Date of Last Change"]
-                df.drop(columns = columns_to_drop, inplace = True)
-
-                # Apply basic cleaning
-                df = self.basic_cleaning(df)
-
-                df.to_csv(output_file, index = False)
-                print(f"SO2 file '{filename}' cleaned and saved as '{output_file}'.")
-    
+        self.clean_files('so2')
+
     # function to clean CO CSV files, drop columns
     def clean_co_files(self):
-        for filename in os.listdir(self.co_directory):
-            if filename.startswith("cleaned_"):
-                continue  # Skip already cleaned files
-            if filename.endswith(".csv"):
-                filepath = os.path.join(self.co_directory, filename)
-                year = filename.split('_')[-1].split('.')[0] # extract the year
-                output_file = os.path.join(self.co_directory, f'cleaned_co_{year}.csv')
-
-                df = pd.read_csv(filepath, low_memory = False)
-                columns_to_drop = ["State Code", "County Code", "Site Num", "Parameter Code", "POC", "Datum", "Parameter Name", 
-                                "Sample Duration", "Pollutant Standard", "Units of Measure", 
-                                "Event Type", "Observation Count", "Observation Percent", "AQI",
-                                "Method Code", "Method Name", "Local Site Name", "State Name", "County Name", "City Name", "Date of Last Change"]
-                df.drop(columns = columns_to_drop, inplace = True)
-
-                # Apply basic cleaning
-                df = self.basic_cleaning(df)
-
-                df.to_csv(output_file, index = False)
-                print(f"CO file '{filename}' cleaned and saved as '{output_file}'.")
-    
-    
-
-    def clean_all_files(self):
+        self.clean_files('co')
+
+    # Clean every raw file in a process pool. A failing file is reported and the rest carry on.
+    # Returns {output_file: error message} for the files that failed.
+    def clean_all_files_parallel(self, workers):
+        jobs = [(kind, filename, filepath, output_file)
+                for kind in self.CLEANING_SOURCES
+                for filename, filepath, output_file in self.raw_files(kind)]
+        failures = {}
+        start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(timed_clean_file, self, kind, filepath, output_file): (kind, filename, output_file)
+                       for kind, filename, filepath, output_file in jobs}
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                kind, filename, output_file = futures[future]
+                label = self.CLEANING_SOURCES[kind][2]
+                try:
+                    rows, seconds = future.result()
+                except Exception as e:
+                    failures[output_file] = str(e)
+                    print(f"[{done}/{len(jobs)}] {label} file '{filename}' FAILED: {e}")
+                    continue
+                print(f"[{done}/{len(jobs)}] {label} file '{filename}' cleaned and saved as '{output_file}' "
+                      f"({rows} rows, {seconds:.1f}s)")
+
+        elapsed = time.perf_counter() - start
+        print(f"\nCleaned {len(jobs) - len(failures)} of {len(jobs)} files in {elapsed:.1f}s with {workers} workers.")
+        for output_file, error in failures.items():
+            print(f"Failed: {output_file}: {error}")
+        return failures
+
+    # workers > 1 cleans the files in a process pool, the default keeps the serial path
+    def clean_all_files(self, workers=1):
+        if workers and workers > 1:
+            return self.clean_all_files_parallel(workers)
+
         print("Cleaning AQI files...")
         self.clean_aqi_files()
 
@@ -249,6 +284,7 @@ class FileCleaner:
         self.clean_co_files()
 
         print("\nAll files cleaned and saved.")
+        return {}
 
 
 # Usage
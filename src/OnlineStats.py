@@ -0,0 +1,140 @@
+import numpy as np
+
+
+class RunningStats:
+    # Count, mean, variance, min and max updated one chunk at a time in constant memory.
+    # Chunks are combined with Chan's parallel formula, so two RunningStats can be merged too.
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the mean
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        chunk = RunningStats()
+        chunk.count = len(values)
+        chunk.mean = values.mean()
+        chunk.m2 = ((values - chunk.mean) ** 2).sum()
+        chunk.min = values.min()
+        chunk.max = values.max()
+        self.merge(chunk)
+
+    def merge(self, other):
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    # sample variance and standard deviation, like pandas (ddof=1)
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class QuantileSketch:
+    # Mergeable approximate quantiles in the style of the KLL sketch. Values go into level 0; a level
+    # that fills up is sorted and every other item (random offset) moves up one level with double the
+    # weight. Memory stays around 3 * k items whatever the stream length, rank error is roughly 1/k.
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    # items a level may hold before it is compacted, lower levels get geometrically less room
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return int(np.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self.compress()
+
+    def merge(self, other):
+        self.count += other.count
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate((self.levels[level], items))
+        self.compress()
+
+    # Compact the lowest full level while the sketch holds more items than all levels allow together
+    def compress(self):
+        while sum(len(items) for items in self.levels) >= sum(self.capacity(level) for level in range(len(self.levels))):
+            for level, items in enumerate(self.levels):
+                if len(items) < self.capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item out stays on this level
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                paired = items[:len(items) - len(keep)]
+                promoted = paired[self.rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+                break
+
+    # Approximate value at each quantile q in [0, 1]
+    def quantiles(self, qs):
+        if not self.count:
+            return [np.nan for _ in qs]
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        total = cumulative[-1]
+        return [values[min(np.searchsorted(cumulative, q * total, side='left'), len(values) - 1)] for q in qs]
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+
+class FixedHistogram:
+    # Counts over fixed, equal-width bins between low and high, values outside go to underflow/overflow.
+    # Histograms with the same bins merge by adding counts.
+
+    def __init__(self, low, high, bins=50):
+        if high <= low:
+            high = low + 1.0  # a single distinct value still gets a bin
+        self.edges = np.linspace(low, high, bins + 1)
+        self.counts = np.zeros(bins, dtype='int64')
+        self.underflow = 0
+        self.overflow = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        self.underflow += int((values < self.edges[0]).sum())
+        self.overflow += int((values > self.edges[-1]).sum())
+        counts, _ = np.histogram(values, bins=self.edges)
+        self.counts += counts
+
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Histograms with different bins cannot be merged.")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
@@ -0,0 +1,114 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+
+class QueryCache:
+    # Process-wide LRU cache of loaded frames and query results, shared by every dashboard session.
+    # Entries are evicted least recently used first once their total size goes over max_bytes, and
+    # the whole cache is dropped when the database file changes. Cached frames are shared, treat them as read-only.
+
+    def __init__(self, db_name='air.db', max_bytes=512 * 1024 * 1024):
+        self.db_name = db_name
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size in bytes), oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.db_signature = self.database_signature()
+
+    # (mtime_ns, size) of the database and its WAL file, a load changes at least one of them
+    def database_signature(self):
+        signature = []
+        for path in (self.db_name, f'{self.db_name}-wal'):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    # Approximate memory held by a cached value
+    def size_of(self, value):
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(index=True, deep=True).sum())
+        if isinstance(value, pd.Series):
+            return int(value.memory_usage(index=True, deep=True))
+        if isinstance(value, (list, tuple)):
+            return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+        return sys.getsizeof(value)
+
+    # Drop every entry if the database changed since the entries were loaded, call with the lock held
+    def check_database(self):
+        signature = self.database_signature()
+        if signature != self.db_signature:
+            if self.entries:
+                print(f"{self.db_name} changed, dropping {len(self.entries)} cached results")
+            self.entries.clear()
+            self.total_bytes = 0
+            self.db_signature = signature
+
+    # Cached value for key, or None on a miss
+    def get(self, key):
+        with self.lock:
+            self.check_database()
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # Store a value and evict least recently used entries until the cache fits its budget again.
+    # Values bigger than the whole budget are not cached at all.
+    def put(self, key, value):
+        size = self.size_of(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self.insert(key, value, size)
+
+    # put without the size check and the lock, call with the lock held
+    def insert(self, key, value, size):
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    # Cached value for key, calling load() and caching its result on a miss.
+    # The load runs outside the lock so one slow query doesn't block the other sessions.
+    def get_or_load(self, key, load):
+        value = self.get(key)
+        if value is None:
+            value = load()
+            self.put(key, value)
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            self.db_signature = self.database_signature()
+
+    # Counters and current size, for logging and the dashboard
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,124 @@
+import heapq
+import numpy as np
+
+# Mean Earth radius used for great-circle distances
+EARTH_RADIUS_KM = 6371.0088
+
+
+# Great-circle distance in km between points given in degrees, vectorized over numpy arrays
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype='float64')) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# Points on the unit sphere, straight-line (chord) distance between them orders the same as great-circle distance
+def unit_vectors(latitudes, longitudes):
+    lat = np.radians(np.asarray(latitudes, dtype='float64'))
+    lon = np.radians(np.asarray(longitudes, dtype='float64'))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+# Chord length on the unit sphere for a great-circle distance in km, and back
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0.0, 1.0))
+
+
+class SiteIndex:
+    # KD-tree over monitoring site coordinates for k-nearest and radius queries.
+    # Sites are stored as 3D unit vectors so distances stay correct across longitudes and near the poles,
+    # the tree lives in flat numpy arrays: each node covers order[start:end] and splits on one axis.
+
+    def __init__(self, latitudes, longitudes, leaf_size=16):
+        self.latitudes = np.asarray(latitudes, dtype='float64')
+        self.longitudes = np.asarray(longitudes, dtype='float64')
+        self.points = unit_vectors(self.latitudes, self.longitudes)
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(self.points))
+        # per node: start, end, left child, right child (-1 for leaves), split axis, split value
+        self.nodes = []
+        if len(self.points):
+            self.build(0, len(self.points))
+
+    def __len__(self):
+        return len(self.points)
+
+    # Split order[start:end] at the median of its widest axis, returns the node number
+    def build(self, start, end):
+        node = len(self.nodes)
+        self.nodes.append([start, end, -1, -1, 0, 0.0])
+        if end - start <= self.leaf_size:
+            return node
+
+        members = self.order[start:end]
+        spread = self.points[members].max(axis=0) - self.points[members].min(axis=0)
+        axis = int(np.argmax(spread))
+        middle = (end - start) // 2
+        partitioned = members[np.argpartition(self.points[members, axis], middle)]
+        self.order[start:end] = partitioned
+        split_value = self.points[partitioned[middle], axis]
+
+        left = self.build(start, start + middle)
+        right = self.build(start + middle, end)
+        self.nodes[node][2:6] = [left, right, axis, split_value]
+        return node
+
+    # Up to k nearest sites to one point within radius_km (no limit when None),
+    # as (site positions, distances in km) sorted nearest first
+    def query(self, latitude, longitude, k=1, radius_km=None):
+        if not len(self.points):
+            return np.empty(0, dtype='int64'), np.empty(0)
+
+        target = unit_vectors([latitude], [longitude])[0]
+        bound = km_to_chord(radius_km) if radius_km is not None else np.inf
+        best = []  # max-heap of (-chord distance, site) holding the k nearest found so far
+        stack = [0]
+
+        while stack:
+            start, end, left, right, axis, split_value = self.nodes[stack.pop()]
+            worst = -best[0][0] if len(best) == k else bound
+            if left < 0:
+                members = self.order[start:end]
+                distances = np.sqrt(((self.points[members] - target) ** 2).sum(axis=1))
+                for site, distance in zip(members, distances):
+                    if distance > bound:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, site))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, site))
+                continue
+
+            # visit the side the point is on last so it is searched first,
+            # the far side only while the splitting plane is closer than the current k-th distance
+            offset = target[axis] - split_value
+            near, far = (left, right) if offset < 0 else (right, left)
+            if abs(offset) <= worst:
+                stack.append(far)
+            stack.append(near)
+
+        best.sort(reverse=True)
+        sites = np.array([site for _, site in best], dtype='int64')
+        chords = np.array([-distance for distance, _ in best])
+        return sites, chord_to_km(chords)
+
+    # k nearest sites for many points, as (n, k) arrays of site positions and distances in km.
+    # Missing neighbours (fewer than k sites inside the radius) are -1 and NaN.
+    def query_many(self, latitudes, longitudes, k=1, radius_km=None):
+        latitudes = np.asarray(latitudes, dtype='float64')
+        longitudes = np.asarray(longitudes, dtype='float64')
+        sites = np.full((len(latitudes), k), -1, dtype='int64')
+        distances = np.full((len(latitudes), k), np.nan)
+        for i, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+            found, found_distances = self.query(latitude, longitude, k, radius_km)
+            sites[i, :len(found)] = found
+            distances[i, :len(found)] = found_distances
+        return sites, distances
+
+    # Every site inside radius_km of a point, nearest first
+    def query_radius(self, latitude, longitude, radius_km):
+        return self.query(latitude, longitude, k=len(self.points), radius_km=radius_km)
@@ -1,10 +1,15 @@
 import sqlite3
 import pandas as pd
+from pandas.api.types import union_categoricals
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np 
 import plotly.express as px 
 import geopandas as gpd
+from SiteIndex import SiteIndex
+from OnlineStats import RunningStats, QuantileSketch, FixedHistogram
+from Boundaries import assign_points, geojson_geometry, split_rings, unpack_rings
+from DatabaseManager import date_column, page_key
 
 class EDA:
 
@@ -25,9 +30,40 @@ class EDA:
         'WI': 'Wisconsin', 'WY': 'Wyoming'
     }
 
-    def __init__(self, db_name='air.db'):
+    # rollup period -> (rollup table, period column), the loader keeps these up to date
+    rollup_periods = {
+        'daily': ('rollup_daily', 'day'),
+        'monthly': ('rollup_monthly', 'month'),
+        'yearly': ('rollup_yearly', 'year'),
+    }
+
+    # table -> variable name in the correlation matrix, in display order
+    correlation_variables = {
+        'AQIdata': 'AQI', 'temperatures': 'Temperature', 'so2': 'SO2', 'ozone': 'Ozone',
+        'pm10': 'PM10', 'pm2.5': 'PM25', 'no2': 'NO2', 'co': 'CO',
+    }
+
+    # columns stored as categoricals and as datetime64 in compact frames
+    compact_categories = ['CBSA', 'CBSA Name', 'CBSA Code', 'State', 'Address', 'Category', 'Defining Parameter']
+    compact_dates = ['Date', 'Date Local']
+
+    # Server-side binning of the spatial heatmap: grid or hexagon size in degrees for each map zoom level,
+    # the most points one figure may carry, and the decimals bin centres are rounded to
+    heatmap_cell_degrees = {4: 0.5, 5: 0.25, 6: 0.1, 7: 0.05, 8: 0.02, 9: 0.01}
+    heatmap_max_points = 2000
+    heatmap_decimals = 3
+
+    # cache is an optional QueryCache shared by every EDA instance that should reuse query results.
+    # compact=True returns load_data, load_data_in_chunks and load_combined_data frames with compact dtypes.
+    def __init__(self, db_name='air.db', cache=None, compact=False):
         
         self.db_name = db_name
+        self.cache = cache
+        self.compact = compact
+        # per-column memory before/after of the last frame compacted
+        self.last_memory_report = None
+        # table name (None for every site) -> (data version, KD-tree over its monitor sites, site ids in tree order)
+        self.monitor_indexes = {}
 
     def get_dataset_choice(self):
         print("Choose a dataset from the following options:")
@@ -44,24 +80,293 @@ class EDA:
             except ValueError:
                 print("Invalid input. Please enter a number.")
 
-    # load data from table parameter into dataframe
-    def load_data(self, table_name):
+    # Categorical names, datetime64 dates, float32 measures and downcast integers
+    def compact_frame(self, df):
+        columns = {}
+        for col in df.columns:
+            series = df[col]
+            if col in self.compact_dates and series.dtype == object:
+                columns[col] = pd.to_datetime(series, format='%Y-%m-%d')
+            elif col in self.compact_categories:
+                columns[col] = series.astype('category')
+            elif pd.api.types.is_float_dtype(series):
+                columns[col] = series.astype('float32')
+            elif pd.api.types.is_integer_dtype(series):
+                columns[col] = pd.to_numeric(series, downcast='integer')
+        return df.assign(**columns) if columns else df
+
+    # Per-column dtype and deep memory of a frame before and after compaction, with a total row
+    def memory_report(self, before, after):
+        report = pd.DataFrame({
+            'before dtype': before.dtypes.astype(str),
+            'after dtype': after.dtypes.astype(str),
+            'before bytes': before.memory_usage(index=False, deep=True),
+            'after bytes': after.memory_usage(index=False, deep=True),
+        })
+        report.loc['total'] = ['', '', report['before bytes'].sum(), report['after bytes'].sum()]
+        return report
+
+    # Compact a loaded frame and print how much memory it saved
+    def compact_loaded(self, df):
+        compacted = self.compact_frame(df)
+        self.last_memory_report = self.memory_report(df, compacted)
+        before, after = self.last_memory_report.loc['total', ['before bytes', 'after bytes']]
+        print(f"Compact dtypes: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({before / max(after, 1):.1f}x smaller)")
+        return compacted
+
+    # Run a query into a dataframe, through the shared query cache when the EDA has one.
+    # compact=True compacts the frame before it is cached. cache=False reads past the cache, for
+    # single-use queries such as preview pages that would only push reusable results out of it.
+    def read_query(self, query, params=(), compact=False, cache=True):
+        def load():
+            conn = sqlite3.connect(self.db_name)
+            try:
+                df = pd.read_sql_query(query, conn, params=list(params))
+            finally:
+                conn.close()
+            return self.compact_loaded(df) if compact else df
+
+        if self.cache is None or not cache:
+            return load()
+        return self.cache.get_or_load(('query', self.db_name, query, tuple(params), compact), load)
+
+    # SELECT and parameters for a table with the selected columns and the state, CBSA and date range
+    # filters as a parameterized WHERE clause. distinct=True returns each combination of the columns once.
+    def build_query(self, table_name, columns=None, state=None, cbsa=None, start_date=None, end_date=None,
+                    distinct=False):
 
         conn = sqlite3.connect(self.db_name)
-        df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
-        conn.close
-        return df
-    
+        try:
+            table_columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+        finally:
+            conn.close()
+        name_column = 'CBSA' if 'CBSA' in table_columns else 'CBSA Name'
+        date_column = 'Date' if 'Date' in table_columns else 'Date Local'
+
+        select = ', '.join(f'"{col}"' for col in columns) if columns else '*'
+        conditions = []
+        params = []
+        if state:
+            if 'State' in table_columns:
+                conditions.append('"State" = ?')
+                params.append(state)
+            else:
+                # older databases without the stored State column
+                conditions.append(f'"{name_column}" LIKE ?')
+                params.append(f'%, {state}')
+        if cbsa:
+            conditions.append(f'"{name_column}" = ?')
+            params.append(cbsa)
+        if start_date:
+            conditions.append(f'"{date_column}" >= ?')
+            params.append(str(start_date))
+        if end_date:
+            conditions.append(f'"{date_column}" <= ?')
+            params.append(str(end_date))
+
+        query = f'SELECT {"DISTINCT " if distinct else ""}{select} FROM "{table_name}"'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        return query, params
+
+    # load data from table parameter into dataframe. The selected columns and the state, CBSA and
+    # date range filters are pushed down into the query, so only matching rows are read.
+    def load_data(self, table_name, columns=None, state=None, cbsa=None, start_date=None, end_date=None,
+                  distinct=False):
+        query, params = self.build_query(table_name, columns, state, cbsa, start_date, end_date, distinct)
+        return self.read_query(query, params, compact=self.compact)
+
+    # Yield the rows load_data would return as chunk_size frames, one at a time. Nothing is
+    # concatenated or cached, so memory stays at one chunk whatever the size of the table.
+    def iter_data(self, table_name, columns=None, state=None, cbsa=None, start_date=None, end_date=None,
+                  chunk_size=100000):
+        query, params = self.build_query(table_name, columns, state, cbsa, start_date, end_date)
+        conn = sqlite3.connect(self.db_name)
+        try:
+            for chunk in pd.read_sql_query(query, conn, params=params, chunksize=chunk_size):
+                yield chunk
+        finally:
+            conn.close()
+
+    # describe()-style summary of the numeric columns of a stream of chunks, built from online
+    # aggregators (exact count/mean/std/min/max, sketched quartiles) so it runs in constant memory
+    def stream_describe(self, chunks):
+        stats = {}
+        sketches = {}
+        for chunk in chunks:
+            for col in chunk.select_dtypes('number').columns:
+                stats.setdefault(col, RunningStats()).update(chunk[col])
+                sketches.setdefault(col, QuantileSketch()).update(chunk[col])
+
+        summary = {}
+        for col, running in stats.items():
+            q25, q50, q75 = sketches[col].quantiles([0.25, 0.5, 0.75])
+            summary[col] = [running.count, running.mean, running.std, running.min, q25, q50, q75, running.max]
+        return pd.DataFrame(summary, index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'])
+
+    # One page of a state's (or CBSA's) rows by keyset pagination. after/before are the key of the row
+    # the page starts after or ends before, from the 'last'/'first' of the neighbouring page; neither
+    # gives the first page. Each page seeks into the page index and reads page_size + 1 rows, so
+    # any page costs the same whatever its depth. Returns the rows, the first and last keys and
+    # whether a previous and next page exist. Pages are ordered on the loader's page_key.
+    def load_page(self, table_name, state, cbsa=None, order='cbsa', descending=False, after=None, before=None,
+                  page_size=10):
+        key = page_key(table_name, order)
+        query, params = self.build_query(table_name, state=state, cbsa=cbsa)
+        key_columns = ', '.join(f'"{col}"' for col in key)
+
+        # a previous page is read backwards from its end and put back in order afterwards
+        backwards = before is not None
+        reverse = descending != backwards
+        cursor = before if backwards else after
+        if cursor is not None:
+            placeholders = ', '.join('?' for _ in key)
+            query += f' {"AND" if params else "WHERE"} ({key_columns}) {"<" if reverse else ">"} ({placeholders})'
+            params = list(params) + list(cursor)
+        direction = ' DESC' if reverse else ''
+        query += ' ORDER BY ' + ', '.join(f'"{col}"{direction}' for col in key) + ' LIMIT ?'
+        params.append(page_size + 1)
+
+        df = self.read_query(query, params, cache=False)
+        more = len(df) > page_size
+        df = df.head(page_size)
+        if backwards:
+            df = df.iloc[::-1].reset_index(drop=True)
+        return {
+            'rows': df,
+            'first': df.iloc[0][key].tolist() if len(df) else None,
+            'last': df.iloc[-1][key].tolist() if len(df) else None,
+            'has_previous': more if backwards else cursor is not None,
+            'has_next': True if backwards else more,
+        }
+
+    # Streamed summary of a table selection, through the query cache when there is one
+    def describe_table(self, table_name, state=None, cbsa=None):
+        def load():
+            return self.stream_describe(self.iter_data(table_name, state=state, cbsa=cbsa))
+
+        if self.cache is None:
+            return load()
+        return self.cache.get_or_load(('describe', self.db_name, table_name, state, cbsa), load)
+
+    # State and CBSA name columns of a table, State only exists in databases loaded with it
+    def location_columns(self, table_name):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            table_columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+        finally:
+            conn.close()
+        name_column = 'CBSA' if 'CBSA' in table_columns else 'CBSA Name'
+        return (['State'] if 'State' in table_columns else []) + [name_column]
+
+    # True when the database has the table, databases loaded by older versions lack the summary tables
+    def has_table(self, table_name):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            return conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+            ).fetchone() is not None
+        finally:
+            conn.close()
+
+    # True when the loader has built the location_lookup table
+    def has_location_lookup(self):
+        return self.has_table('location_lookup')
+
+    # Sorted states that have data in a table, from the small lookup table built at ingest
+    def get_states(self, table_name):
+        if self.has_location_lookup():
+            df = self.read_query(
+                'SELECT DISTINCT State FROM location_lookup WHERE table_name = ? ORDER BY State', (table_name,)
+            )
+            return df['State'].dropna().tolist()
+
+        # databases loaded before the lookup existed
+        df = self.load_data(table_name, columns=self.location_columns(table_name), distinct=True)
+        if 'State' not in df.columns:
+            df = df.assign(State=df.iloc[:, 0].apply(lambda x: x.split(', ')[-1]))
+        return sorted(df['State'].dropna().unique().tolist())
+
+    # Sorted CBSAs of one state that have data in a table
+    def get_cbsas(self, table_name, state_name):
+        if self.has_location_lookup():
+            df = self.read_query(
+                'SELECT CBSA FROM location_lookup WHERE table_name = ? AND State = ? ORDER BY CBSA',
+                (table_name, state_name)
+            )
+            return df['CBSA'].tolist()
+
+        name_column = self.location_columns(table_name)[-1]
+        df = self.load_data(table_name, columns=[name_column], state=state_name, distinct=True)
+        return sorted(df[name_column].dropna().tolist())
+
+    # Rollup rows of a table for one CBSA, else for one state, else for every state.
+    # period is 'daily', 'monthly' or 'yearly'.
+    def load_rollup(self, table_name, period='yearly', state=None, cbsa=None):
+        rollup_table, period_column = self.rollup_periods[period]
+        query = f'SELECT * FROM {rollup_table} WHERE table_name = ?'
+        params = [table_name]
+        if cbsa:
+            query += " AND level = 'cbsa' AND area = ?"
+            params.append(cbsa)
+        elif state:
+            query += " AND level = 'state' AND area = ?"
+            params.append(state)
+        else:
+            query += " AND level = 'state'"
+        query += f' ORDER BY area, {period_column}'
+        return self.read_query(query, params)
+
+    # Per-CBSA mean series of a state from the rollups, with the raw table's column names so the
+    # facet grid plots take it as is
+    def load_trend_data(self, table_name, state_name, period='monthly'):
+        rollup_table, period_column = self.rollup_periods[period]
+        df = self.read_query(f'''
+            SELECT area, {period_column}, mean FROM {rollup_table}
+            WHERE table_name = ? AND level = 'cbsa' AND State = ?
+            ORDER BY area, {period_column}
+        ''', (table_name, state_name))
+        if table_name == 'AQIdata':
+            columns = {'area': 'CBSA', period_column: 'Date', 'mean': 'AQI'}
+        else:
+            columns = {'area': 'CBSA Name', period_column: 'Date Local', 'mean': 'Arithmetic Mean'}
+        return df.rename(columns=columns)
+
+    # One row per monitoring site with its mean over all loaded years, from the site rollup
+    def load_site_rollup(self, table_name, state=None, cbsa=None):
+        if not self.has_table('rollup_site_yearly'):
+            # databases loaded before the rollups existed, averaged from the table itself
+            location = self.location_columns(table_name)
+            df = self.load_data(table_name, columns=['Latitude', 'Longitude', 'Arithmetic Mean'] + location,
+                                state=state, cbsa=cbsa)
+            return df.groupby(['Latitude', 'Longitude'], as_index=False, observed=True).agg(
+                **{col: (col, 'first') for col in location},
+                days=('Arithmetic Mean', 'size'), **{'Arithmetic Mean': ('Arithmetic Mean', 'mean')}
+            )
+
+        query = '''
+            SELECT Latitude, Longitude, MAX(State) AS State, MAX(CBSA) AS "CBSA Name", SUM(days) AS days,
+                   SUM(total) / SUM(days) AS "Arithmetic Mean"
+            FROM rollup_site_yearly WHERE table_name = ?
+        '''
+        params = [table_name]
+        if state:
+            query += ' AND State = ?'
+            params.append(state)
+        if cbsa:
+            query += ' AND CBSA = ?'
+            params.append(cbsa)
+        query += ' GROUP BY Latitude, Longitude'
+        return self.read_query(query, params)
+
     # user inputs state selection
     def get_state_choice(self, table_name):
         if table_name == 'AQIdata':
-            df_aqi = self.load_data(table_name)
-            df_aqi['State'] = df_aqi['CBSA'].apply(lambda x: x.split(', ')[-1])
-            states = df_aqi['State'].unique()
+            df_aqi = self.load_data(table_name, columns=['CBSA'], distinct=True)
+            states = df_aqi['CBSA'].apply(lambda x: x.split(', ')[-1]).unique()
         else:
-            df = self.load_data(table_name)
-            df['State'] = df['CBSA Name'].apply(lambda x: x.split(', ')[-1])
-            states = df['State'].unique()
+            df = self.load_data(table_name, columns=['CBSA Name'], distinct=True)
+            states = df['CBSA Name'].apply(lambda x: x.split(', ')[-1]).unique()
 
         print("Choose a state from the following options:")
         for i, state in enumerate(states):
@@ -79,8 +384,11 @@ class EDA:
 
     # filter the df by the state selection
     def filter_by_state(self, df, state_name):
+        # State column is materialized at load time, exact match instead of a string scan
+        if 'State' in df.columns:
+            filtered_df = df[df['State'] == state_name]
         # if CBSA is a df column then this is aqi df
-        if 'CBSA' in df.columns:
+        elif 'CBSA' in df.columns:
             # filter based on condition that the state in the CBSA matches state_name
             filtered_df = df[df['CBSA'].str.endswith(state_name)]
         # non aqi table has CBSA Name column not CBSA column
@@ -96,11 +404,16 @@ class EDA:
 
 
 
-    def print_summary_stats(self, df, table_name):
+    # Summary of a loaded frame, or with df=None of the table itself streamed chunk by chunk
+    def print_summary_stats(self, df, table_name, state=None, cbsa=None):
         print(f"Summary statistics for table: {table_name}")
-        print(df.describe())
+        if df is None:
+            print(self.describe_table(table_name, state, cbsa))
+        else:
+            print(self.stream_describe([df]))
 
-    def plot_histogram(self, df, dataset_name):
+    # Histogram of a loaded frame, or with df=None of the table streamed into fixed bins between its min and max
+    def plot_histogram(self, df, dataset_name, state=None, cbsa=None, bins=50):
         plt.figure(figsize=(8, 6))
         
         if dataset_name == 'AQIdata':
@@ -112,11 +425,26 @@ class EDA:
             plt.title('Histogram of Arithmetic Mean')
             plt.xlabel('Arithmetic Mean')
 
-            if column not in df.columns:
+            if df is not None and column not in df.columns:
                 print(f"Warning: '{column}' column not found in the dataset.")
                 return
         
-        sns.histplot(df[column], kde=True)
+        if df is None:
+            query, params = self.build_query(dataset_name, [column], state, cbsa)
+            conn = sqlite3.connect(self.db_name)
+            try:
+                low, high = conn.execute(f'SELECT MIN("{column}"), MAX("{column}") FROM ({query})', params).fetchone()
+            finally:
+                conn.close()
+            if low is None:
+                print(f"No data found for {dataset_name}.")
+                return
+            histogram = FixedHistogram(low, high, bins)
+            for chunk in self.iter_data(dataset_name, [column], state, cbsa):
+                histogram.update(chunk[column])
+            plt.stairs(histogram.counts, histogram.edges, fill=True)
+        else:
+            sns.histplot(df[column], kde=True)
         plt.ylabel('Frequency')
         plt.show()
         
@@ -126,7 +454,8 @@ class EDA:
             print("Date column not found in the dataset.")
             return
         
-        df[date_col] = pd.to_datetime(df[date_col])
+        # assign a converted copy, df may be a frame shared through the query cache
+        df = df.assign(**{date_col: pd.to_datetime(df[date_col])})
         unique_cbsa = df['CBSA'].unique() if 'CBSA' in df.columns else df['CBSA Name'].unique()
         num_pages = (len(unique_cbsa) + regions_per_page - 1) // regions_per_page
 
@@ -162,7 +491,62 @@ class EDA:
         fig.update_layout(title_font_size=16)
         fig.show()
 
-    def plot_spatial_heatmap(self, df, dataset_name, state_name):
+    # Map zoom level that fits the points' bounding box, clamped to the levels in heatmap_cell_degrees
+    def heatmap_zoom(self, latitudes, longitudes):
+        width = np.ptp(longitudes) * np.cos(np.radians(np.mean(latitudes)))
+        span = max(np.ptp(latitudes), width, 1e-6)
+        zoom = int(np.floor(np.log2(360 / span))) - 1
+        return min(max(zoom, min(self.heatmap_cell_degrees)), max(self.heatmap_cell_degrees))
+
+    # Aggregate points into square grid cells or pointy-top hexagons cell_degrees across. Each bin gets the
+    # mean of value_column, weighted by days when the frame has a days column (site rollups do).
+    # Returns bin centres and values as float32 arrays, centres rounded to heatmap_decimals.
+    def bin_points(self, df, value_column, cell_degrees, method='grid'):
+        latitudes = df['Latitude'].to_numpy('float64')
+        longitudes = df['Longitude'].to_numpy('float64')
+        values = df[value_column].to_numpy('float64')
+        weights = df['days'].to_numpy('float64') if 'days' in df.columns else np.ones(len(df))
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes) | np.isnan(values) | np.isnan(weights))
+        latitudes, longitudes, values, weights = latitudes[valid], longitudes[valid], values[valid], weights[valid]
+
+        if method == 'hex':
+            # axial hexagon coordinates, longitude scaled so a hexagon is about as wide as it is high
+            scale = np.cos(np.radians(np.mean(latitudes))) if len(latitudes) else 1.0
+            x = longitudes * scale / cell_degrees
+            y = latitudes / cell_degrees
+            q = np.sqrt(3) / 3 * x - y / 3
+            r = 2 / 3 * y
+            # round to the nearest hexagon in cube coordinates, fixing the component that rounded furthest
+            rq, rr, rs = np.round(q), np.round(r), np.round(-q - r)
+            dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs + q + r)
+            fix_q = (dq > dr) & (dq > ds)
+            fix_r = ~fix_q & (dr > ds)
+            rq[fix_q] = -rr[fix_q] - rs[fix_q]
+            rr[fix_r] = -rq[fix_r] - rs[fix_r]
+            keys = pd.DataFrame({'a': rq, 'b': rr})
+        else:
+            keys = pd.DataFrame({'a': np.floor(latitudes / cell_degrees), 'b': np.floor(longitudes / cell_degrees)})
+
+        sums = keys.assign(weighted=values * weights, weight=weights).groupby(['a', 'b'], sort=False).sum()
+        a = sums.index.get_level_values('a').to_numpy('float64')
+        b = sums.index.get_level_values('b').to_numpy('float64')
+        if method == 'hex':
+            bin_latitudes = 1.5 * b * cell_degrees
+            bin_longitudes = np.sqrt(3) * (a + b / 2) * cell_degrees / scale
+        else:
+            bin_latitudes = (a + 0.5) * cell_degrees
+            bin_longitudes = (b + 0.5) * cell_degrees
+
+        return pd.DataFrame({
+            'Latitude': np.round(bin_latitudes, self.heatmap_decimals).astype('float32'),
+            'Longitude': np.round(bin_longitudes, self.heatmap_decimals).astype('float32'),
+            value_column: (sums['weighted'] / sums['weight']).to_numpy().astype('float32'),
+        })
+
+    # Spatial heatmap of per-site means. binning='grid' or 'hex' aggregates sites server side into bins
+    # sized for the zoom level (fitted to the data when zoom is None), binning=None plots each site.
+    # Either way bins are doubled in size until the figure holds at most heatmap_max_points points.
+    def plot_spatial_heatmap(self, df, dataset_name, state_name, binning='grid', zoom=None):
         # Check for necessary columns
         if 'CBSA' in df.columns:
             location_col = 'CBSA'
@@ -185,29 +569,32 @@ class EDA:
             print("Arithmetic Mean column not found in the dataset.")
             return
 
-        # Ensure latitude and longitude data are numeric
-        # df['Latitude'] = pd.to_numeric(df['Latitude'], errors='coerce')
-        # df['Longitude'] = pd.to_numeric(df['Longitude'], errors='coerce')
-
         # Drop rows with invalid coordinates
-        df = df.dropna(subset=['Latitude', 'Longitude'])
-
-        # Aggregate data for the entire state
-        aggregated_df = df.groupby(['Latitude', 'Longitude']).agg({'Arithmetic Mean': 'mean'}).reset_index()
+        df = df.dropna(subset=['Latitude', 'Longitude', 'Arithmetic Mean'])
 
-        # Check if there is any data left after aggregation
-        if aggregated_df.empty:
+        # Check if there is any data left
+        if df.empty:
             print("No valid data available for heatmap.")
             return
-        
-        # # Print some of the data to verify
-        # print("Sample data for scatter plot:")
-        # print(aggregated_df[['Latitude', 'Longitude']].head(20))  # Print 20 rows
+
+        if zoom is None:
+            zoom = self.heatmap_zoom(df['Latitude'], df['Longitude'])
+        cell_degrees = self.heatmap_cell_degrees[min(max(zoom, min(self.heatmap_cell_degrees)),
+                                                     max(self.heatmap_cell_degrees))]
+        if binning is None and len(df) <= self.heatmap_max_points:
+            # one point per site, a vanishingly small grid only merges sites sharing coordinates
+            aggregated_df = self.bin_points(df, 'Arithmetic Mean', 1e-9)
+        else:
+            aggregated_df = self.bin_points(df, 'Arithmetic Mean', cell_degrees, binning or 'grid')
+            while len(aggregated_df) > self.heatmap_max_points:
+                cell_degrees *= 2
+                aggregated_df = self.bin_points(df, 'Arithmetic Mean', cell_degrees, binning or 'grid')
 
         # Plot heatmap
         fig = px.density_mapbox(aggregated_df, lat='Latitude', lon='Longitude', z='Arithmetic Mean', radius=10,
-                                center=dict(lat=df['Latitude'].mean(), lon=df['Longitude'].mean()), zoom=5,
-                                mapbox_style="open-street-map",
+                                center=dict(lat=round(float(df['Latitude'].mean()), self.heatmap_decimals),
+                                            lon=round(float(df['Longitude'].mean()), self.heatmap_decimals)),
+                                zoom=zoom, mapbox_style="open-street-map",
                                 title=f'Spatial Heatmap of Arithmetic Mean {dataset_name.upper()} ({state_name})')
         fig.update_layout(title_font_size=16)
         #fig.show()
@@ -217,147 +604,223 @@ class EDA:
 
     # reduce memory footprint by loading chunks
     def load_data_in_chunks(self, query, chunk_size=10000):
-        # empty list to store 10000 row chunks
-        chunks = []
-        # query chunks of data
-        conn = sqlite3.connect(self.db_name)
-        for chunk in pd.read_sql(query, conn, chunksize=chunk_size):
-            # append chunk to chunks list
-            chunks.append(chunk)
-        conn.close
-        # concat to get one dataframe, ignore index for continuous indexing
-        return pd.concat(chunks, ignore_index=True)
-
-    # load sql queries into df, merge component df into combined df
+        compact = self.compact
+
+        def load():
+            # empty list to store 10000 row chunks
+            chunks = []
+            before_bytes = 0
+            # query chunks of data
+            conn = sqlite3.connect(self.db_name)
+            for chunk in pd.read_sql(query, conn, chunksize=chunk_size):
+                if compact:
+                    # compact each chunk as it arrives so the full-size frame never exists
+                    before_bytes += chunk.memory_usage(index=False, deep=True).sum()
+                    chunk = self.compact_frame(chunk)
+                # append chunk to chunks list
+                chunks.append(chunk)
+            conn.close()
+            if compact and chunks:
+                # chunks have their own categories, give them the union so concat keeps categoricals
+                for col in chunks[0].columns:
+                    if isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+                        categories = union_categoricals([chunk[col] for chunk in chunks]).categories
+                        chunks = [chunk.assign(**{col: chunk[col].cat.set_categories(categories)}) for chunk in chunks]
+            # concat to get one dataframe, ignore index for continuous indexing
+            df = pd.concat(chunks, ignore_index=True)
+            if compact:
+                after_bytes = df.memory_usage(index=False, deep=True).sum()
+                print(f"Compact dtypes: {before_bytes / 1e6:.1f} MB -> {after_bytes / 1e6:.1f} MB "
+                      f"({before_bytes / max(after_bytes, 1):.1f}x smaller)")
+            return df
+
+        if self.cache is None:
+            return load()
+        return self.cache.get_or_load(('query', self.db_name, query, (), compact), load)
+
+    # load the combined AQI, temperature and pollutant data from the cbsa_daily wide table the loader
+    # maintains, one row per CBSA per day so nothing is merged here and all eight variables fit
     def load_combined_data(self, state_name=None, geometry=False):
+        variables = ['AQI', 'Temperature', 'SO2', 'Ozone', 'PM10', 'PM25', 'NO2', 'CO']
+        select = ', '.join(f'd."{col}"' for col in ['Date', 'CBSA'] + variables)
 
-        # Load AQI data in chunks
-        aqi_query = 'SELECT Date, CBSA, AQI FROM AQIdata'
-        aqi_df = self.load_data_in_chunks(aqi_query)
-        print("Loaded AQI data")
-
-        # initialize combined df with aqi df
-        combined_df = aqi_df
-
-        # Latitude and Longitude pulled from tables
+        # Latitude and Longitude are each CBSA's site centroid
         if geometry:
-            # Load other data in chunks and merge incrementally to prevent memory overload
-            queries = {
-                'Temperature': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS Temperature, Longitude, Latitude FROM temperatures',
-                'SO2': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS SO2, Longitude, Latitude FROM so2',
-                'Ozone': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS Ozone, Longitude, Latitude FROM ozone',
-                'PM10': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS PM10, Longitude, Latitude FROM pm10',
-                # ! df's not included because of memory pressure during merge
-                # 'NO2': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS NO2, Longitude, Latitude FROM no2',
-                # 'PM25': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS PM25, Longitude, Latitude FROM pm2.5',
-                # 'CO': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS CO, Longitude, Latitude FROM co'
-            } 
-            
-            # iterate over dictionary of queries 
-            for key, query in queries.items():
-                # chunk loading
-                df = self.load_data_in_chunks(query)
-                print(f"Loaded {key} data")
-
-                # filter df by state name
-                if state_name:
-                    df = self.filter_by_state(df, state_name)
-                    print(f"Filtered {key} data by state")
-
-                # Merge df on Date and CBSA with specific suffix handling
-                suffix = f'_{key.lower()}'
-                combined_df = combined_df.merge(df, on=['Date', 'CBSA'], how='left', suffixes=('', suffix))
-                print(f"Merged {key} data")
-
-                # Rename Latitude and Longitude columns with specific suffixes
-                latitude_col = f'Latitude{suffix}'
-                longitude_col = f'Longitude{suffix}'
-                
-                # Fill Latitude and Longitude only if they are currently NaN in combined_df
-                if latitude_col in combined_df.columns:
-                    combined_df['Latitude'] = combined_df['Latitude'].fillna(combined_df[latitude_col])
-                if longitude_col in combined_df.columns:
-                    combined_df['Longitude'] = combined_df['Longitude'].fillna(combined_df[longitude_col])
-
-                # Drop the columns with suffixes after merging
-                combined_df.drop(columns=[latitude_col, longitude_col], inplace=True, errors='ignore')
-                
-
-            # Filter the combined_df by state, long and lat introduce unfiltered data
-            if state_name:
-                combined_df = self.filter_by_state(combined_df, state_name)
-                print(f"Filtered final combined_df by state")
-
-
-            # Print sample of the combined df
-            print(f"{combined_df.sample(n=10)}")
-            # Count the number of unique CBSA values
-            unique_cbsa_count = combined_df['CBSA'].nunique()
-            # Print the count
-            print(f"Number of unique CBSAs: {unique_cbsa_count}")
-            
-            return combined_df
-        
-
-
-        # no location coords pulled from tables
+            query = f'''
+                SELECT {select}, c.Longitude, c.Latitude
+                FROM cbsa_daily d LEFT JOIN cbsa_centroids c ON c.CBSA = d.CBSA
+            '''
         else:
-            # Load other data in chunks and merge incrementally to prevent memory overload
-            queries = {
-                'Temperature': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS Temperature FROM temperatures',
-                'SO2': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS SO2 FROM so2',
-                'Ozone': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS Ozone FROM ozone',
-                'PM10': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS PM10 FROM pm10',
-                # ! df's not included because of memory pressure during merge
-                # 'NO2': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS NO2 FROM no2',
-                # 'PM25': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS PM25 FROM pm25',
-                # 'CO': 'SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS CO FROM co'
-            }
-
-            # iterate over dictionary of queries 
-            for key, query in queries.items():
-                # chunk loading
-                df = self.load_data_in_chunks(query)
-                print(f"Loaded {key} data")
-
-                # filter df by state name
-                if state_name:
-                    df = self.filter_by_state(df, state_name)
-                    print(f"Filtered {key} data by state")
-
-                # merge df on Date and CBSA and join left to keep all rows
-                combined_df = combined_df.merge(df, on=['Date', 'CBSA'], how='left')
-                print(f"Merged {key} data")
-
-            # Filter rows where all specified columns have values that are not negative and not null
-            combined_df = combined_df[
-                (combined_df["AQI"] >= 0) &
-                (combined_df["Temperature"] >= 0) &
-                (combined_df["SO2"] >= 0) &
-                (combined_df["Ozone"] >= 0) &
-                (combined_df["PM10"] >= 0) #&
-                # ! df's not inlcuded bc of memory pressure
-                # (combined_df["PM25"] >= 0) &
-                # (combined_df["NO2"] >= 0) &
-                # (combined_df["CO"] >= 0)
-            ]
-
-            # Print sample of the combined df
-            print(f"{combined_df.sample(n=10)}")
-            # Count the number of unique CBSA values
-            unique_cbsa_count = combined_df['CBSA'].nunique()
-            # Print the count
-            print(f"Number of unique CBSAs: {unique_cbsa_count}")
-
-            return combined_df
-    
-        df = self.load_data_in_chunks('SELECT "Date Local" AS Date, "CBSA Name" AS CBSA, "Arithmetic Mean" AS Ozone, Longitude, Latitude FROM ozone')
-        print(df.head(5))
-        return df
+            query = f'SELECT {select} FROM cbsa_daily d'
+
+        # filter by state name in the query
+        params = []
+        if state_name:
+            query += ' WHERE d.State = ?'
+            params.append(state_name)
+        combined_df = self.read_query(query, params, compact=self.compact)
+        print("Loaded combined data")
+
+        # no location coords, keep rows where every variable has a value that is not negative
+        if not geometry:
+            combined_df = combined_df[(combined_df[variables] >= 0).all(axis=1)]
+
+        # Print sample of the combined df
+        print(f"{combined_df.sample(n=min(10, len(combined_df)))}")
+        # Count the number of unique CBSA values
+        unique_cbsa_count = combined_df['CBSA'].nunique()
+        # Print the count
+        print(f"Number of unique CBSAs: {unique_cbsa_count}")
+
+        return combined_df
+
+    # Site-level modelling rows of one year: every reading of target_table with the readings of the
+    # k nearest sites (within radius_km) of each source table on the same date. Neighbours are found
+    # once per year with a KD-tree over that year's unique site coordinates, so memory is bounded by one year.
+    def nearest_site_year(self, conn, target_table, source_tables, year, k=1, radius_km=50.0):
+        year_range = (f'{year}-01-01', f'{year + 1}-01-01')
+        query = '''
+            SELECT Latitude, Longitude, "Date Local", "Arithmetic Mean" FROM "{}"
+            WHERE "Date Local" >= ? AND "Date Local" < ?
+        '''
+        joined = pd.read_sql_query(query.format(target_table), conn, params=year_range)
+        joined = joined.rename(columns={'Arithmetic Mean': self.correlation_variables[target_table]})
+        target_sites = joined[['Latitude', 'Longitude']].drop_duplicates().reset_index(drop=True)
+
+        for source_table in source_tables:
+            label = self.correlation_variables[source_table]
+            source = pd.read_sql_query(query.format(source_table), conn, params=year_range)
+            source_sites = source[['Latitude', 'Longitude']].drop_duplicates().reset_index(drop=True)
+            source_sites['site'] = np.arange(len(source_sites))
+            source = source.merge(source_sites, on=['Latitude', 'Longitude'])
+            values = source.set_index(['site', 'Date Local'])['Arithmetic Mean']
+
+            index = SiteIndex(source_sites['Latitude'], source_sites['Longitude'])
+            neighbours, distances = index.query_many(target_sites['Latitude'], target_sites['Longitude'], k, radius_km)
+
+            for rank in range(k):
+                column = label if k == 1 else f'{label} {rank + 1}'
+                pairs = target_sites.assign(site=neighbours[:, rank], **{f'{column} km': distances[:, rank]})
+                joined = joined.merge(pairs, on=['Latitude', 'Longitude'], how='left')
+                lookup = pd.MultiIndex.from_arrays([joined['site'], joined['Date Local']])
+                joined[column] = values.reindex(lookup).to_numpy()
+                # value first, then how far away the site it came from is
+                joined[f'{column} km'] = joined.pop(f'{column} km')
+                joined = joined.drop(columns='site')
+        return joined
+
+    # columns of the monitor lookups: the site, then one table's latest reading
+    monitor_columns = ['site_id', 'Latitude', 'Longitude', 'State', 'CBSA', 'table_name', 'Date',
+                       'Arithmetic Mean', '1st Max Value']
+
+    # Rows of sites with their latest reading per table, for sites matching a condition on monitor_sites s.
+    # With table_name only the sites that have a reading in that table, each with that reading.
+    # Plain execute() rows, a lookup builds a single frame at the end.
+    def monitor_readings(self, conn, condition, params, table_name=None):
+        join = 'LEFT JOIN monitor_latest l ON l.site_id = s.site_id'
+        if table_name:
+            join = 'JOIN monitor_latest l ON l.site_id = s.site_id AND l.table_name = ?'
+            params = [table_name] + list(params)
+        rows = conn.execute(f'''
+            SELECT s.site_id, s.Latitude, s.Longitude, s.State, s.CBSA, l.table_name, l.Date,
+                   l."Arithmetic Mean", l."1st Max Value"
+            FROM monitor_sites s {join}
+            WHERE {condition}
+        ''', params).fetchall()
+        return rows
+
+    # Every monitor inside a bounding box with its latest readings, through the R-tree when the
+    # loader could build one. The R-tree stores rounded float32 boxes, so positions are re-checked exactly.
+    def monitors_in_bbox(self, min_lat, min_lon, max_lat, max_lon, table_name=None):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            has_rtree = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'monitor_sites_rtree'"
+            ).fetchone() is not None
+            condition = 's.Latitude BETWEEN ? AND ? AND s.Longitude BETWEEN ? AND ?'
+            params = [min_lat, max_lat, min_lon, max_lon]
+            if has_rtree:
+                condition += ''' AND s.site_id IN (
+                    SELECT site_id FROM monitor_sites_rtree
+                    WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?
+                )'''
+                params += [min_lat, max_lat, min_lon, max_lon]
+            rows = self.monitor_readings(conn, condition, params, table_name)
+        finally:
+            conn.close()
+        return pd.DataFrame(rows, columns=self.monitor_columns)
+
+    # SiteIndex over monitor_sites, or only the sites with a reading in table_name, rebuilt when a load
+    # changed the data (PRAGMA user_version)
+    def get_monitor_index(self, conn, table_name=None):
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        cached = self.monitor_indexes.get(table_name)
+        if cached is None or cached[0] != version:
+            query = 'SELECT s.site_id, s.Latitude, s.Longitude FROM monitor_sites s'
+            params = []
+            if table_name:
+                query += ' JOIN monitor_latest l ON l.site_id = s.site_id AND l.table_name = ?'
+                params.append(table_name)
+            sites = conn.execute(query, params).fetchall()
+            site_ids = np.array([row[0] for row in sites], dtype='int64')
+            index = SiteIndex([row[1] for row in sites], [row[2] for row in sites])
+            cached = self.monitor_indexes[table_name] = (version, index, site_ids)
+        return cached[1], cached[2]
+
+    # The k monitors nearest a point (within radius_km when given) with their latest readings,
+    # nearest first with the distance in km. With table_name the k nearest monitors of that table.
+    # The KD-tree answers from memory, only those k sites are read.
+    def nearest_monitors(self, latitude, longitude, k=5, table_name=None, radius_km=None):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            index, site_ids = self.get_monitor_index(conn, table_name)
+            positions, distances = index.query(latitude, longitude, k, radius_km)
+            nearest = dict(zip(site_ids[positions].tolist(), distances.tolist()))
+            condition = f's.site_id IN ({", ".join("?" for _ in nearest)})'
+            rows = self.monitor_readings(conn, condition, list(nearest), table_name)
+        finally:
+            conn.close()
+
+        rows = sorted((row + (nearest[row[0]],) for row in rows), key=lambda row: (row[-1], row[5] or ''))
+        return pd.DataFrame(rows, columns=self.monitor_columns + ['distance km'])
+
+    # Yield the nearest-site join one year at a time. source_tables defaults to every other site table.
+    def iter_nearest_site_join(self, target_table, source_tables=None, k=1, radius_km=50.0, years=None):
+        if source_tables is None:
+            source_tables = [table for table in self.correlation_variables
+                             if table not in ('AQIdata', target_table)]
+
+        conn = sqlite3.connect(self.db_name)
+        try:
+            if years is None:
+                years = [int(year) for (year,) in conn.execute(
+                    'SELECT DISTINCT year FROM rollup_site_yearly WHERE table_name = ? ORDER BY year', (target_table,)
+                )]
+            for year in years:
+                df = self.nearest_site_year(conn, target_table, source_tables, year, k, radius_km)
+                print(f"Joined {len(df)} {target_table} rows for {year}")
+                yield year, df
+        finally:
+            conn.close()
+
+    # Whole nearest-site join, appended year by year to output_csv when given (the frame is not kept then)
+    # or returned as one frame
+    def nearest_site_join(self, target_table, source_tables=None, k=1, radius_km=50.0, years=None, output_csv=None):
+        frames = []
+        header = True
+        for year, df in self.iter_nearest_site_join(target_table, source_tables, k, radius_km, years):
+            if output_csv:
+                df.to_csv(output_csv, mode='w' if header else 'a', header=header, index=False)
+                header = False
+            else:
+                frames.append(df)
+        if output_csv:
+            return None
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
     def plot_correlation_matrix(self, df, state_name):
         # Select only numeric columns for correlation analysis
-        numeric_df = df.select_dtypes(include=['float64', 'int64'])
+        numeric_df = df.select_dtypes('number')
 
         # Exclude 'longitude' and 'latitude' columns if they exist in the DataFrame
         columns_to_exclude = ['Longitude', 'Latitude']
@@ -366,6 +829,10 @@ class EDA:
         # Compute the correlation matrix
         corr_matrix = numeric_df.corr()
 
+        return self.plot_correlation_heatmap(corr_matrix, state_name)
+
+    # Plotly heatmap of a computed correlation matrix
+    def plot_correlation_heatmap(self, corr_matrix, state_name):
         # Use Plotly Express to create a heatmap
         fig = px.imshow(
             corr_matrix,  # Correlation matrix
@@ -379,12 +846,64 @@ class EDA:
         return fig
     
 
-    # get combined df and pass to plot correlation matrix
-    def analyze_correlations(self, state_name):
-        # Load the combined data
-        combined_df = self.load_combined_data(state_name=state_name, geometry=True)
-
-        return self.plot_correlation_matrix(combined_df, state_name=state_name)
+    # Pearson correlations of all eight variables for a state or CBSA, assembled from the pairwise
+    # sufficient statistics the loader keeps, so nothing has to be loaded or merged.
+    # Each pair uses the CBSA-days where both variables have a daily mean.
+    def correlation_from_stats(self, state_name=None, cbsa=None):
+        query = '''
+            SELECT table_x, table_y, SUM(n) AS n, SUM(sx) AS sx, SUM(sy) AS sy,
+                   SUM(sxx) AS sxx, SUM(syy) AS syy, SUM(sxy) AS sxy
+            FROM correlation_stats WHERE level = ? AND area = ?
+            GROUP BY table_x, table_y
+        '''
+        stats = self.read_query(query, ('cbsa', cbsa) if cbsa else ('state', state_name))
+
+        variables = list(self.correlation_variables.values())
+        corr_matrix = pd.DataFrame(np.nan, index=variables, columns=variables)
+        for row in stats.itertuples(index=False):
+            covariance = row.n * row.sxy - row.sx * row.sy
+            variance_x = row.n * row.sxx - row.sx ** 2
+            variance_y = row.n * row.syy - row.sy ** 2
+            if row.n < 2 or variance_x <= 0 or variance_y <= 0:
+                continue
+            r = covariance / np.sqrt(variance_x * variance_y)
+            x = self.correlation_variables[row.table_x]
+            y = self.correlation_variables[row.table_y]
+            corr_matrix.loc[x, y] = corr_matrix.loc[y, x] = r
+
+        # a variable with any data correlates perfectly with itself
+        for variable in variables:
+            if corr_matrix[variable].notna().any():
+                corr_matrix.loc[variable, variable] = 1.0
+        return corr_matrix
+
+    # The same correlations from the tables themselves, for databases loaded before correlation_stats
+    # existed: each table is averaged per CBSA-day in SQL and the pairs use the CBSA-days both have
+    def correlation_from_tables(self, state_name=None, cbsa=None):
+        combined_df = None
+        for table_name, variable in self.correlation_variables.items():
+            name_column = self.location_columns(table_name)[-1]
+            date = date_column(table_name)
+            value_column = 'AQI' if table_name == 'AQIdata' else 'Arithmetic Mean'
+            query, params = self.build_query(table_name, [name_column, date, value_column],
+                                             state=state_name, cbsa=cbsa)
+            df = self.read_query(f'''
+                SELECT "{name_column}" AS CBSA, "{date}" AS Date, AVG("{value_column}") AS "{variable}"
+                FROM ({query}) WHERE "{name_column}" IS NOT NULL GROUP BY 1, 2
+            ''', params)
+            combined_df = df if combined_df is None else combined_df.merge(df, on=['CBSA', 'Date'], how='outer')
+
+        variables = list(self.correlation_variables.values())
+        return combined_df[variables].astype('float64').corr().reindex(index=variables, columns=variables)
+
+    # get correlation matrix and pass to plot correlation matrix
+    def analyze_correlations(self, state_name, cbsa=None):
+        if not self.has_table('correlation_stats'):
+            # databases loaded before the statistics existed
+            corr_matrix = self.correlation_from_tables(state_name, cbsa)
+            return self.plot_correlation_heatmap(corr_matrix, state_name=cbsa or state_name)
+        corr_matrix = self.correlation_from_stats(state_name, cbsa)
+        return self.plot_correlation_heatmap(corr_matrix, state_name=cbsa or state_name)
 
 
     def create_geodataframe(self, df):
@@ -397,9 +916,7 @@ class EDA:
     
     def create_layers(self, gdf):
         layers = {}
-        variables = ['AQI', 'Temperature', 'SO2', 'Ozone', 'PM10']
-        # ! if memory pressue is solved use full variables list
-        #variables = ['AQI', 'Temperature', 'SO2', 'Ozone', 'PM10', 'PM25', 'NO2', 'CO']
+        variables = ['AQI', 'Temperature', 'SO2', 'Ozone', 'PM10', 'PM25', 'NO2', 'CO']
 
         for variable in variables:
             # Create a layer for each variable
@@ -430,36 +947,32 @@ class EDA:
         if state_name in state_abbreviation_map:
             state_name = state_abbreviation_map[state_name]
 
-        # Load the shapefile for US CBSA boundaries
-        shapefile_path = 'tl_2023_us_state/tl_2023_us_state.shp'
-        state_boundaries = gpd.read_file(shapefile_path)
-        
-        # Print valid state names in shapefile (for debugging)
-        print("Valid state names in shapefile:")
-        print(state_boundaries['NAME'].unique())
-        
-        # # Extract CBSA codes from the GeoDataFrame
-        # cbsa_codes = geo_df['CBSA'].unique()
-        # print("cbsa names in the geo df: \n")
-        # print(cbsa_codes.unique())
-
-        # Filter the boundaries for the selected state or region
-        if '-' in state_name:
-            states = state_name.split('-')
-            state_boundaries = state_boundaries[state_boundaries['NAME'].isin(states)]
+        # Simplified boundaries from the cache the loader builds, the shapefile is only parsed
+        # for databases without it
+        states = state_name.split('-') if '-' in state_name else [state_name]
+        state_boundaries = self.load_boundaries('state', states)
+        if not state_boundaries.empty:
+            fig, base = plt.subplots(figsize=(10, 10))
+            for rings in state_boundaries['rings']:
+                for ring in rings:
+                    base.fill(ring[:, 0], ring[:, 1], facecolor='white', edgecolor='black')
         else:
-            state_boundaries = state_boundaries[state_boundaries['NAME'] == state_name]
+            # Load the shapefile for US state boundaries
+            shapefile_path = 'tl_2023_us_state/tl_2023_us_state.shp'
+            state_boundaries = gpd.read_file(shapefile_path)
 
-        if state_boundaries.empty:
-            raise ValueError(f"State(s) '{state_name}' not found in shapefile.")
-        
-        
-        # Plot the boundaries
-        base = state_boundaries.plot(color='white', edgecolor='black', figsize=(10, 10))
+            # Filter the boundaries for the selected state or region
+            state_boundaries = state_boundaries[state_boundaries['NAME'].isin(states)]
+
+            if state_boundaries.empty:
+                raise ValueError(f"State(s) '{state_name}' not found in shapefile.")
+
+            # Plot the boundaries
+            base = state_boundaries.plot(color='white', edgecolor='black', figsize=(10, 10))
         
         # Define the layers to plot
-        variables = ['AQI', 'Temperature', 'SO2', 'PM10', 'Ozone']
-        colors = ['viridis', 'coolwarm', 'plasma', 'magma', 'cividis']  # Different color maps for variety
+        variables = ['AQI', 'Temperature', 'SO2', 'PM10', 'Ozone', 'PM25', 'NO2', 'CO']
+        colors = ['viridis', 'coolwarm', 'plasma', 'magma', 'cividis', 'inferno', 'cool', 'spring']  # Different color maps for variety
         
         # Plot each layer
         for variable, color in zip(variables, colors):
@@ -471,6 +984,75 @@ class EDA:
         plt.legend(loc='upper left')
         plt.show()
 
+    # Cached boundaries of a kind ('state' or 'cbsa') as a frame of name, label, code, bounds and packed
+    # rings, plus their ring arrays in 'rings'. names match either the name or the label, None returns all.
+    def load_boundaries(self, kind, names=None):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            cached = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'boundaries'"
+            ).fetchone() is not None
+        finally:
+            conn.close()
+        if not cached:
+            return pd.DataFrame(columns=['name', 'label', 'code', 'rings'])
+
+        query = 'SELECT * FROM boundaries WHERE kind = ?'
+        params = [kind]
+        if names is not None:
+            placeholders = ', '.join('?' for _ in names)
+            query += f' AND (name IN ({placeholders}) OR label IN ({placeholders}))'
+            params += list(names) * 2
+        df = self.read_query(query, params)
+        return df.assign(rings=[split_rings(*unpack_rings(coords, offsets))
+                                for coords, offsets in zip(df['coords'], df['offsets'])])
+
+    # Name of the cached boundary of a kind containing each point, None outside them all
+    def assign_boundaries(self, latitudes, longitudes, kind='state'):
+        df = self.load_boundaries(kind)
+        boundaries = [
+            (name, coords, offsets, bounds) for name, coords, offsets, bounds in zip(
+                df['name'], df['coords'], df['offsets'],
+                df[['min_lon', 'min_lat', 'max_lon', 'max_lat']].itertuples(index=False, name=None)
+            )
+        ] if not df.empty else []
+        return assign_points(latitudes, longitudes, boundaries)
+
+    # Choropleth of the mean of a table's daily values per CBSA of a state over all years, drawn on the
+    # cached CBSA boundaries. AQIdata has no site coordinates, this is its map. None when the boundaries
+    # or the rollups are not in the database.
+    def plot_cbsa_choropleth(self, state_name, table_name='AQIdata'):
+        if not self.has_table('rollup_yearly'):
+            return None
+        values = self.read_query('''
+            SELECT area AS CBSA, SUM(mean * days) / SUM(days) AS mean, SUM(days) AS days,
+                   SUM(exceedance_days) AS exceedance_days
+            FROM rollup_yearly WHERE table_name = ? AND level = 'cbsa' AND State = ?
+            GROUP BY area
+        ''', (table_name, state_name))
+        boundaries = self.load_boundaries('cbsa', values['CBSA'].tolist())
+        if values.empty or boundaries.empty:
+            return None
+
+        features = [
+            {'type': 'Feature', 'id': name, 'geometry': geojson_geometry(coords, offsets, parts)}
+            for name, coords, offsets, parts in zip(boundaries['name'], boundaries['coords'],
+                                                    boundaries['offsets'], boundaries['parts'])
+        ]
+        values = values[values['CBSA'].isin(boundaries['name'])]
+        latitudes = boundaries[['min_lat', 'max_lat']].to_numpy().ravel()
+        longitudes = boundaries[['min_lon', 'max_lon']].to_numpy().ravel()
+        label = self.correlation_variables[table_name]
+        fig = px.choropleth_mapbox(values, geojson={'type': 'FeatureCollection', 'features': features},
+                                   locations='CBSA', color='mean', hover_data=['days', 'exceedance_days'],
+                                   labels={'mean': f'Mean {label}'}, opacity=0.6,
+                                   center=dict(lat=round(float(latitudes.mean()), self.heatmap_decimals),
+                                               lon=round(float(longitudes.mean()), self.heatmap_decimals)),
+                                   zoom=self.heatmap_zoom(latitudes, longitudes), mapbox_style="open-street-map",
+                                   title=f'Mean {label} by CBSA ({state_name})')
+        fig.update_layout(title_font_size=16)
+        return fig
+
     def create_overlay(self, state_name):
         # Load the combined df with geometry
         df = self.load_combined_data(state_name=state_name, geometry=True)
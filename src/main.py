@@ -1,17 +1,20 @@
 
 from matplotlib import pyplot as plt
 import os
+import sys
 import pandas as pd
 from shiny import App, ui, render, reactive
 from eda import EDA
 from FileCleaner import FileCleaner
 from DatabaseManager import DatabaseManager
+from QueryCache import QueryCache
+from BackgroundTask import BackgroundTask
+from FigureCache import FigureCache
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+from concurrent.futures import ThreadPoolExecutor
 import webbrowser
 
 
-# Instantiate EDA class
-eda = EDA()
-
 # Define the actual directory paths
 aqi_directory = "data/daily_aqi"
 temp_directory = "data/daily_temp"
@@ -30,20 +33,101 @@ file_cleaner = FileCleaner(
 )
 
 
-# Check if the database file exists
 db_file_path = 'air.db'
 
-if not os.path.exists(db_file_path):
-    # Clean the data if database doesn't exist
-    file_cleaner.clean_all_files()
-    
-    # Instantiate DatabaseManager class
-    db_manager = DatabaseManager(db_file_path)
-    
-    # Load cleaned data into the database if database doesn't exist
-    db_manager.load_all_data()
-else:
-    print("Database already exists.")
+# Raw files are cleaned in chunks and streamed straight into the database, without writing
+# cleaned_*.csv files. The ingestion manifest skips files that are already loaded, so this
+# only loads new or changed years and resumes a load that was interrupted. State and CBSA
+# shapefiles, when present, are simplified into the database once for the maps.
+def load_database():
+    """Clean and load the raw files into air.db, a failed load leaves the existing database in place"""
+    try:
+        db_manager = DatabaseManager(db_file_path)
+        db_manager.load_all_raw_data(file_cleaner)
+    except Exception as e:
+        print(f"Loading failed, the dashboard serves {db_file_path} as it is: {e}")
+
+
+# The dashboard only loads on its own when air.db doesn't exist yet. Refresh it with
+# `python main.py --load`, or AQI_LOAD=1 when the app is started through `shiny run`.
+if not os.path.exists(db_file_path) or os.environ.get('AQI_LOAD') == '1' or '--load' in sys.argv:
+    load_database()
+
+# Query results are cached once per process and shared by every session,
+# dropped least recently used first past the memory budget or when air.db changes
+query_cache = QueryCache(db_file_path, max_bytes=512 * 1024 * 1024)
+
+# Instantiate EDA class
+# Frames use compact dtypes (categorical names, datetime64 dates, float32 values) so more of them fit in memory
+eda = EDA(db_file_path, cache=query_cache, compact=True)
+
+
+# Rendered heatmap and correlation HTML per selection, kept until a load changes the data.
+# figure_cache/ next to air.db keeps them across restarts, whatever directory the app is started from.
+figure_cache = FigureCache(
+    db_file_path, max_bytes=64 * 1024 * 1024,
+    directory=os.path.join(os.path.dirname(os.path.abspath(db_file_path)), 'figure_cache')
+)
+
+# plotly.js is written to static/ beside this file once and loaded by the page, the figure fragments leave it out
+static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+plotly_js = f'plotly-{get_plotlyjs_version()}.min.js'
+if not os.path.exists(os.path.join(static_dir, plotly_js)):
+    os.makedirs(static_dir, exist_ok=True)
+    with open(os.path.join(static_dir, plotly_js), 'w', encoding='utf-8') as f:
+        f.write(get_plotlyjs())
+
+
+# Heatmaps and correlation matrices are built in this pool, shared by every session, so a slow
+# build never blocks the server. Threads rather than processes: the builds mostly wait on SQLite
+# and share the query cache.
+executor = ThreadPoolExecutor(max_workers=4)
+
+
+def build_heatmap(dataset_name, selected_state, selected_cbsa, binning):
+    """Spatial heatmap HTML for a selection, runs in the executor"""
+    if dataset_name == "AQIdata":
+        # AQIdata has no site coordinates, it is mapped as a CBSA choropleth on the cached boundaries
+        fig = eda.plot_cbsa_choropleth(selected_state)
+        if fig is None:
+            return ("<p>No cached CBSA boundaries or rollups to map AQIdata with, "
+                    "reload the database with <code>python main.py --load</code>.</p>")
+        return fig.to_html(full_html=False, include_plotlyjs=False)
+
+    # one row per site with its mean over all years, from the site rollup (from the table on older databases)
+    df = eda.load_site_rollup(dataset_name, state=selected_state, cbsa=selected_cbsa)
+
+    if df.empty:
+        return "<p>No data available to generate heatmap.</p>"
+
+    # Generate the heatmap Plotly figure
+    # sites are binned server side and capped, so the figure stays small for large states
+    fig = eda.plot_spatial_heatmap(df, dataset_name, selected_state, binning=None if binning == "sites" else binning)
+
+    if fig is None:
+        # Handle cases where heatmap cannot be generated
+        return "<p>Spatial heatmaps are not available for AQIdata due to lack of latitude and longitude data.</p>"
+
+    # Convert the figure to an HTML div string
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+def build_correlation_matrix(selected_state, selected_cbsa):
+    """Correlation matrix HTML for a selection, runs in the executor"""
+    # Generate the correlation matrix plotly figure from the precomputed statistics
+    fig = eda.analyze_correlations(selected_state, cbsa=selected_cbsa)
+
+    # Convert the Plotly figure to an HTML div string
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+def render_figure(key, build, *args):
+    """Build a figure's HTML and keep it in the figure cache, runs in the executor"""
+    # a load that finishes while the figure builds makes it stale, put() drops it then
+    version = figure_cache.database_signature()
+    fig_html = build(*args)
+    figure_cache.put(key, fig_html, version)
+    return fig_html
 
 
 # Define table options
@@ -51,6 +135,7 @@ table_options = ["AQIdata", "temperatures", "ozone", "co", "so2", "no2", "pm2.5"
 
 # Define the UI
 app_ui = ui.page_fluid(
+    ui.head_content(ui.tags.script(src=plotly_js)),
     ui.h2("Air Quality Dashboard"),
     ui.row(
         ui.column(3,
@@ -72,15 +157,31 @@ app_ui = ui.page_fluid(
             ),
             ui.input_numeric(
                 "rows_to_show",
-                "Number of rows to display",
+                "Rows per page",
                 value=10,
                 min=1,
-                max=100
+                max=500
+            ),
+            ui.input_select(
+                "page_order",
+                "Sort preview by",
+                {"cbsa": "CBSA, then date", "date": "Date, then CBSA"}
+            ),
+            ui.input_checkbox("page_descending", "Descending", value=False),
+            ui.input_select(
+                "heatmap_binning",
+                "Heatmap bins",
+                {"grid": "Grid", "hex": "Hexagons", "sites": "Individual sites"}
             )
         ),
         ui.column(9,
             ui.h3("Data Preview"),
             ui.output_data_frame("filtered_data"),
+            ui.row(
+                ui.column(2, ui.input_action_button("previous_page", "Previous")),
+                ui.column(2, ui.input_action_button("next_page", "Next")),
+                ui.column(8, ui.output_text("page_status"))
+            ),
             ui.h3("Summary Statistics"),
             ui.output_text_verbatim("summary_stats"),
             ui.h3("Spatial Heatmap"),
@@ -94,14 +195,6 @@ app_ui = ui.page_fluid(
 # Define the server logic
 def server(input, output, session):
     
-    @reactive.Calc
-    def get_base_data():
-        """Load the current table's data"""
-        selected_table = input.selected_table()
-        if selected_table:
-            return eda.load_data(selected_table)
-        return pd.DataFrame()
-
     @reactive.Effect
     @reactive.event(input.selected_table)
     def clear_selections():
@@ -116,15 +209,9 @@ def server(input, output, session):
         # Get the current state before updating
         current_state = input.selected_state()
         
-        df = get_base_data()
-        if not df.empty:
-            if "CBSA" in df.columns:
-                df['State'] = df['CBSA'].apply(lambda x: x.split(', ')[-1])
-            elif "CBSA Name" in df.columns:
-                df['State'] = df['CBSA Name'].apply(lambda x: x.split(', ')[-1])
-            
-            states = sorted(df['State'].dropna().unique().tolist())
-            
+        # State choices come from the lookup table the loader maintains
+        states = eda.get_states(input.selected_table())
+        if states:
             # Update the state selection list
             ui.update_select("selected_state", choices=states)
             
@@ -139,18 +226,11 @@ def server(input, output, session):
     @reactive.event(input.selected_state, input.selected_table)
     def update_cbsa_options():
         """Update CBSA options based on selected state and table"""
-        df = get_base_data()
+        selected_table = input.selected_table()
         selected_state = input.selected_state()
         
-        if not df.empty and selected_state:
-            if "CBSA" in df.columns:
-                df = df[df['CBSA'].str.endswith(selected_state)]
-                cbsa_column = "CBSA"
-            elif "CBSA Name" in df.columns:
-                df = df[df['CBSA Name'].str.endswith(selected_state)]
-                cbsa_column = "CBSA Name"
-            
-            cbsa_options = sorted(df[cbsa_column].dropna().unique().tolist())
+        if selected_table and selected_state:
+            cbsa_options = eda.get_cbsas(selected_table, selected_state)
             ui.update_select("selected_cbsa", 
                            choices=["All CBSAs"] + cbsa_options,
                            selected="All CBSAs")
@@ -158,95 +238,179 @@ def server(input, output, session):
             ui.update_select("selected_cbsa", choices=[], selected=None)
 
 
+    # Where the preview is: (after, before) keys for EDA.load_page and the page number shown
+    page_cursor = reactive.Value((None, None))
+    page_number = reactive.Value(1)
+
+    @reactive.Effect
+    @reactive.event(input.selected_table, input.selected_state, input.selected_cbsa,
+                    input.page_order, input.page_descending, input.rows_to_show)
+    def reset_page():
+        """Go back to the first page when the selection, sort or page size changes"""
+        page_cursor.set((None, None))
+        page_number.set(1)
+
     @reactive.Calc
-    def get_filtered_data():
-        """Get filtered data based on all selections"""
-        df = get_base_data()
+    def current_page():
+        """Fetch only the rows of the current preview page"""
+        selected_table = input.selected_table()
         selected_state = input.selected_state()
         selected_cbsa = input.selected_cbsa()
         
-        if df.empty or not selected_state:
-            return pd.DataFrame()
-            
-        # Filter by state
-        if "CBSA" in df.columns:
-            df = df[df['CBSA'].str.endswith(selected_state)]
-            cbsa_column = "CBSA"
-        elif "CBSA Name" in df.columns:
-            df = df[df['CBSA Name'].str.endswith(selected_state)]
-            cbsa_column = "CBSA Name"
+        if not selected_table or not selected_state:
+            return None
             
-        # Filter by CBSA if specifically selected
-        if selected_cbsa and selected_cbsa != "All CBSAs":
-            df = df[df[cbsa_column] == selected_cbsa]
-                
-        return df
-    
+        # State and CBSA filters and the page seek run in SQL, only the displayed rows are read
+        if selected_cbsa == "All CBSAs":
+            selected_cbsa = None
+        after, before = page_cursor()
+        return eda.load_page(selected_table, selected_state, cbsa=selected_cbsa, order=input.page_order(),
+                             descending=input.page_descending(), after=after, before=before,
+                             page_size=input.rows_to_show() or 10)
+
+    @reactive.Effect
+    @reactive.event(input.next_page)
+    def go_next_page():
+        page = current_page()
+        if page is not None and page['has_next']:
+            page_cursor.set((page['last'], None))
+            page_number.set(page_number() + 1)
+
+    @reactive.Effect
+    @reactive.event(input.previous_page)
+    def go_previous_page():
+        page = current_page()
+        if page is not None and page['has_previous']:
+            page_cursor.set((None, page['first']))
+            page_number.set(page_number() - 1)
 
     @output
     @render.data_frame
     def filtered_data():
-        df = get_filtered_data()
-        if not df.empty:
-            return df.head(input.rows_to_show())
+        page = current_page()
+        if page is not None:
+            return page['rows']
         return pd.DataFrame()
 
+    @output
+    @render.text
+    def page_status():
+        page = current_page()
+        if page is None or page['rows'].empty:
+            return "No rows"
+        status = f"Page {page_number()}"
+        if not page['has_next']:
+            status += " (last page)"
+        return status
+
     @output
     @render.text
     def summary_stats():
-        df = get_filtered_data()
-        if not df.empty:
-            return str(df.describe())
-        return "No data selected"
+        """Streamed summary of the selection plus yearly mean, max, percentiles and exceedance days from the rollups"""
+        selected_table = input.selected_table()
+        selected_state = input.selected_state()
+        selected_cbsa = input.selected_cbsa()
+        if not selected_table or not selected_state:
+            return "No data selected"
+
+        if selected_cbsa == "All CBSAs":
+            selected_cbsa = None
+        # count/mean/std/min/max and quartiles from online aggregators, the selection is never loaded whole
+        summary = eda.describe_table(selected_table, state=selected_state, cbsa=selected_cbsa)
+        if summary.empty:
+            return "No data selected"
+        if not eda.has_table('rollup_yearly'):
+            # databases loaded before the rollups existed
+            return (f"{summary}\n\nThe yearly summary needs the rollup tables, "
+                    f"reload {db_file_path} with `python main.py --load`.")
+        df = eda.load_rollup(selected_table, 'yearly', state=selected_state, cbsa=selected_cbsa)
+        columns = ['year', 'days', 'mean', 'max', 'p50', 'p90', 'exceedance_days']
+        return (f"{summary}\n\nYearly summary for {selected_cbsa or selected_state}\n"
+                f"{df[columns].to_string(index=False)}")
     
 
 
+    # One background job per heavy output, a new selection supersedes the job of the previous one
+    heatmap_task = BackgroundTask(executor, delay=0.5)
+    correlation_task = BackgroundTask(executor, delay=0.5)
+    progress = {}  # task -> ui.Progress shown while it is pending
+
+    def task_output(task, label):
+        """Placeholder while a background job is pending, its HTML once it is done"""
+        status = task.poll()
+        if status in ('waiting', 'running'):
+            if task not in progress:
+                progress[task] = ui.Progress()
+                progress[task].set(message=f"Computing {label}...")
+            # check again shortly, the server handles other inputs and sessions in between
+            reactive.invalidate_later(0.25)
+            return ui.HTML(f"<p>Computing {label}...</p>")
+
+        if task in progress:
+            progress.pop(task).close()
+        if status == 'failed':
+            print(f"Error computing {label}: {task.error}")
+            return ui.HTML(f"<p>Could not generate {label}.</p>")
+        return ui.HTML(task.result)
+
+    def stop_task(task):
+        """Drop a background job when its output has nothing to compute"""
+        task.cancel()
+        if task in progress:
+            progress.pop(task).close()
+
     @output
     @render.ui
     def heatmap():
         """Generate and display the spatial heatmap"""
-        df = get_filtered_data()
         selected_state = input.selected_state()
+        selected_cbsa = input.selected_cbsa()
         dataset_name = input.selected_table()
 
-        if df.empty or selected_state is None:
+        if not dataset_name or selected_state is None:
+            stop_task(heatmap_task)
             return ui.HTML("<p>No data available to generate heatmap.</p>")
 
-        # Generate the heatmap Plotly figure
-        fig = eda.plot_spatial_heatmap(df, dataset_name, selected_state)
-
-        if fig is None:
-            # Handle cases where heatmap cannot be generated
-            return ui.HTML("<p>Spatial heatmaps are not available for AQIdata due to lack of latitude and longitude data.</p>")
-
-        # Convert the figure to an HTML div string
-        fig_html = fig.to_html(full_html=False, include_plotlyjs="cdn")
-
-        # Return the HTML string to embed the figure
-        return ui.HTML(fig_html)
+        if selected_cbsa == "All CBSAs":
+            selected_cbsa = None
+        binning = input.heatmap_binning()
+        key = (f"heatmap-{binning}", dataset_name, selected_state, selected_cbsa)
+        fig_html = figure_cache.get(key)
+        if fig_html is not None:
+            stop_task(heatmap_task)
+            return ui.HTML(fig_html)
+        heatmap_task.start(key, render_figure, key, build_heatmap, dataset_name, selected_state, selected_cbsa, binning)
+        return task_output(heatmap_task, "heatmap")
     
 
     @output
     @render.ui
     def correlation_matrix():
         """Generate and display the correlation matrix as a Plotly heatmap."""
-        df = get_filtered_data()
         selected_state = input.selected_state()
+        selected_cbsa = input.selected_cbsa()
 
-        if df.empty or selected_state is None:
+        if not selected_state:
+            stop_task(correlation_task)
             return ui.HTML("<p>No data available to generate correlation matrix.</p>")
 
-        # Generate the correlation matrix plotly figure
-        fig = eda.analyze_correlations(selected_state)
-
-        # Convert the Plotly figure to an HTML div string
-        fig_html = fig.to_html(full_html=False, include_plotlyjs="cdn")
-
-        # Return the HTML string to embed the figure in the UI
-        return ui.HTML(fig_html)
+        if selected_cbsa == "All CBSAs":
+            selected_cbsa = None
+        key = ("correlation", None, selected_state, selected_cbsa)
+        fig_html = figure_cache.get(key)
+        if fig_html is not None:
+            stop_task(correlation_task)
+            return ui.HTML(fig_html)
+        correlation_task.start(key, render_figure, key, build_correlation_matrix, selected_state, selected_cbsa)
+        return task_output(correlation_task, "correlation matrix")
+
+    @session.on_ended
+    def cancel_tasks():
+        heatmap_task.cancel()
+        correlation_task.cancel()
 
 # Create the app
-app = App(app_ui, server)
+app = App(app_ui, server, static_assets=static_dir)
 
 if __name__ == "__main__":
     webbrowser.open_new("http://127.0.0.1:8000")
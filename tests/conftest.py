@@ -0,0 +1,78 @@
+import csv
+import os
+import random
+import sys
+import pytest
+
+# The modules live flat in src/ and import each other by name, as they do when the app runs from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from FileCleaner import FileCleaner  # noqa: E402
+
+SITE_HEADER = [
+    'State Code', 'County Code', 'Site Num', 'Parameter Code', 'POC', 'Latitude', 'Longitude', 'Datum',
+    'Parameter Name', 'Sample Duration', 'Pollutant Standard', 'Date Local', 'Units of Measure', 'Event Type',
+    'Observation Count', 'Observation Percent', 'Arithmetic Mean', '1st Max Value', '1st Max Hour', 'AQI',
+    'Method Code', 'Method Name', 'Local Site Name', 'Address', 'State Name', 'County Name', 'City Name',
+    'CBSA Name', 'Date of Last Change',
+]
+AQI_HEADER = ['CBSA', 'CBSA Code', 'Date', 'AQI', 'Category', 'Defining Parameter', 'Defining Site',
+              'Number of Sites Reporting']
+CBSAS = [('Birmingham-Hoover, AL', '13820'), ('Fresno, CA', '23420')]
+YEARS = [2022, 2023]
+# site positions in each CBSA, the temperature sites share their first position with ozone
+OZONE_SITES = [(0, 0), (0.1, 0.1)]
+TEMPERATURE_SITES = [(0, 0), (0.3, -0.2), (-0.2, 0.3)]
+
+
+# Raw EPA rows of one site file: sites per CBSA at (latitude offset, longitude offset), 20 days,
+# and two monitors (POCs) per site-day
+def site_rows(year, rng, parameter, sites):
+    rows = []
+    for i, (cbsa, _) in enumerate(CBSAS):
+        for site, (lat_offset, lon_offset) in enumerate(sites):
+            for day in range(1, 21):
+                for poc in (1, 2):
+                    mean = round(rng.uniform(0.01, 0.06), 4)
+                    rows.append([
+                        '01', '073', f'{site:04d}', parameter, poc, 33 + i + lat_offset, -86 - i - lon_offset,
+                        'WGS84', 'name', '24 HOUR', 'standard', f'{year}-02-{day:02d}', 'unit', 'None', 17, 100.0,
+                        mean, round(mean * 1.3, 4), rng.randint(0, 23), 40, '', 'method', 'site',
+                        f'{site} Main St', 'State', 'County', 'City', cbsa, '2024-01-01',
+                    ])
+    return rows
+
+
+def aqi_rows(year, rng):
+    return [[cbsa, code, f'{year}-02-{day:02d}', rng.randint(10, 150), 'Good', 'Ozone', '01-073-0000', 2]
+            for cbsa, code in CBSAS for day in range(1, 21)]
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+# A working directory with raw AQI, ozone and temperature files for YEARS under data/, laid out as
+# the loader expects.
+# Returns a function making a FileCleaner over it.
+@pytest.fixture
+def raw_data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(5)
+    os.makedirs('data/daily_aqi')
+    os.makedirs('data/daily_ozone')
+    os.makedirs('data/daily_temp')
+    for year in YEARS:
+        write_csv(f'data/daily_aqi/daily_aqi_by_cbsa_{year}.csv', AQI_HEADER, aqi_rows(year, rng))
+        write_csv(f'data/daily_ozone/daily_44201_{year}.csv', SITE_HEADER,
+                  site_rows(year, rng, '44201', OZONE_SITES))
+        write_csv(f'data/daily_temp/daily_TEMP_{year}.csv', SITE_HEADER,
+                  site_rows(year, rng, '62101', TEMPERATURE_SITES))
+
+    def file_cleaner():
+        return FileCleaner('data/daily_aqi', 'data/daily_temp', 'data/daily_ozone', 'data/daily_pm2.5',
+                           'data/daily_pm10', 'data/daily_no2', 'data/daily_so2', 'data/daily_co')
+    return file_cleaner
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from Boundaries import (assign_points, geojson_geometry, geometry_polygons, pack_polygons, points_in_rings,
+                        split_rings, unpack_rings)
+
+shapely = pytest.importorskip('shapely')
+from shapely.geometry import MultiPolygon, Point, Polygon, shape  # noqa: E402
+
+# A square with a hole, a concave star and a two-part multipolygon, in (longitude, latitude)
+SQUARE_WITH_HOLE = Polygon([(-100, 30), (-90, 30), (-90, 40), (-100, 40)], [[(-97, 33), (-93, 33), (-93, 37), (-97, 37)]])
+STAR = Polygon([
+    (-80 + r * np.cos(a), 35 + r * np.sin(a))
+    for a, r in zip(np.linspace(0, 2 * np.pi, 10, endpoint=False), [5, 2] * 5)
+])
+ISLANDS = MultiPolygon([
+    Polygon([(-125, 45), (-120, 45), (-122, 49)]),
+    Polygon([(-118, 45), (-114, 45), (-114, 47), (-116, 46), (-118, 47)]),
+])
+
+
+# (coords, offsets, parts) bytes of a shapely geometry, as the boundaries table stores them
+def packed(geometry):
+    return pack_polygons(geometry_polygons(geometry))
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(11)
+    return rng.uniform(25, 52, 3000), rng.uniform(-128, -72, 3000)
+
+
+@pytest.mark.parametrize('geometry', [SQUARE_WITH_HOLE, STAR, ISLANDS])
+def test_points_in_rings_matches_shapely(geometry, points):
+    latitudes, longitudes = points
+    coords, offsets, _ = packed(geometry)
+    # max_pairs small enough that the points are tested in several steps
+    inside = points_in_rings(latitudes, longitudes, *unpack_rings(coords, offsets), max_pairs=5000)
+    # the packed float32 coordinates move edges slightly, points that close may go either way
+    boundary = geometry.boundary
+    expected = np.array([geometry.contains(Point(lon, lat)) for lat, lon in zip(latitudes, longitudes)])
+    on_edge = np.array([boundary.distance(Point(lon, lat)) < 1e-4 for lat, lon in zip(latitudes, longitudes)])
+    np.testing.assert_array_equal(inside[~on_edge], expected[~on_edge])
+    assert expected.any() and not expected.all()
+
+
+def test_hole_is_outside():
+    coords, offsets, _ = packed(SQUARE_WITH_HOLE)
+    inside = points_in_rings([35, 31, 45], [-95, -95, -95], *unpack_rings(coords, offsets))
+    assert inside.tolist() == [False, True, False]
+
+
+def test_pack_round_trip():
+    coords, offsets, parts = packed(ISLANDS)
+    rings = split_rings(*unpack_rings(coords, offsets))
+    original = [ring for polygon in geometry_polygons(ISLANDS) for ring in polygon]
+    assert len(rings) == len(original)
+    for ring, expected in zip(rings, original):
+        np.testing.assert_allclose(ring, expected, atol=1e-5)
+    assert shape(geojson_geometry(coords, offsets, parts)).equals_exact(ISLANDS, 1e-4)
+
+
+def test_assign_points_first_match_and_outside(points):
+    latitudes, longitudes = points
+    # the last one overlaps the square, points in both keep the first name
+    boundaries = [(name, *packed(geometry)[:2], geometry.bounds) for name, geometry in [
+        ('square', SQUARE_WITH_HOLE), ('star', STAR), ('islands', ISLANDS), ('overlap', SQUARE_WITH_HOLE)
+    ]]
+    names = assign_points(latitudes, longitudes, boundaries)
+    for name, geometry in [('square', SQUARE_WITH_HOLE), ('star', STAR), ('islands', ISLANDS)]:
+        far_from_edge = [geometry.boundary.distance(Point(lon, lat)) > 1e-4 for lat, lon in zip(latitudes, longitudes)]
+        expected = np.array([geometry.contains(Point(lon, lat)) for lat, lon in zip(latitudes, longitudes)])
+        np.testing.assert_array_equal((names == name)[far_from_edge], expected[far_from_edge])
+    assert 'overlap' not in set(names)
+    assert (names == None).any()  # noqa: E711
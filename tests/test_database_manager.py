@@ -0,0 +1,177 @@
+import os
+import random
+import shutil
+import sqlite3
+import pandas as pd
+import pytest
+from conftest import CBSAS, OZONE_SITES, SITE_HEADER, site_rows, write_csv
+from DatabaseManager import DatabaseManager
+
+
+def count_year(table_name, year, db_name='air.db'):
+    conn = sqlite3.connect(db_name)
+    try:
+        return conn.execute(
+            f'SELECT COUNT(*) FROM "{table_name}" WHERE "Date Local" LIKE ?', (f'{year}-%',)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+
+# Put a non-numeric Arithmetic Mean into the middle of a raw file
+def corrupt(path):
+    with open(path) as f:
+        lines = f.readlines()
+    fields = lines[len(lines) // 2].split(',')
+    fields[16] = 'invalid'
+    lines[len(lines) // 2] = ','.join(fields)
+    with open(path, 'w') as f:
+        f.writelines(lines)
+
+
+def test_failed_raw_file_keeps_year_from_cleaned_csv(raw_data):
+    raw_data().clean_all_files()
+    DatabaseManager('air.db').load_all_data()
+    loaded = count_year('ozone', 2023)
+    assert loaded > 0
+
+    corrupt('data/daily_ozone/daily_44201_2023.csv')
+    db_manager = DatabaseManager('air.db')
+    db_manager.load_all_raw_data(raw_data())
+    assert list(db_manager.load_failures) == ['data/daily_ozone/daily_44201_2023.csv']
+    # the raw file failed, the year comes back from its cleaned CSV and stays there on the next run
+    assert count_year('ozone', 2023) == loaded
+    DatabaseManager('air.db').load_all_raw_data(raw_data())
+    assert count_year('ozone', 2023) == loaded
+
+
+# Every row of a table in a fixed order, to compare two databases. Sums may add up in another order,
+# so floats are rounded.
+def contents(table_name, db_name='air.db'):
+    conn = sqlite3.connect(db_name)
+    try:
+        rows = conn.execute(f'SELECT * FROM "{table_name}"').fetchall()
+        return sorted((tuple(round(value, 9) if isinstance(value, float) else value for value in row)
+                       for row in rows), key=repr)
+    finally:
+        conn.close()
+
+
+# A FileCleaner whose ozone file for year stops after rows rows, as if the process were killed there
+def interrupted_cleaner(raw_data, year, rows):
+    file_cleaner = raw_data()
+    clean_chunks = file_cleaner.clean_chunks
+
+    def chunks(kind, filepath, output_file=None):
+        if kind != 'ozone' or not filepath.endswith(f'_{year}.csv'):
+            yield from clean_chunks(kind, filepath, output_file)
+            return
+        yield next(iter(clean_chunks(kind, filepath, output_file))).head(rows)
+        raise KeyboardInterrupt
+
+    file_cleaner.clean_chunks = chunks
+    return file_cleaner
+
+
+def test_interrupted_load_resumes_to_the_same_contents(raw_data, monkeypatch):
+    DatabaseManager('reference.db').load_all_raw_data(raw_data())
+
+    # an earlier load of 2022 only, so the database already has rollups
+    os.rename('data', 'data_all')
+    shutil.copytree('data_all', 'data', ignore=shutil.ignore_patterns('*_2023.csv'))
+    DatabaseManager('air.db').load_all_raw_data(raw_data())
+    shutil.rmtree('data')
+    os.rename('data_all', 'data')
+
+    # checkpoints every 40 rows, the ozone 2023 file stops at row 100 after AQIdata and temperatures 2023 loaded
+    monkeypatch.setattr(DatabaseManager, 'CHECKPOINT_ROWS', 40)
+    monkeypatch.setattr(DatabaseManager, 'BATCH_SIZE', 15)
+    db_manager = DatabaseManager('air.db')
+    with pytest.raises(KeyboardInterrupt):
+        db_manager.load_all_raw_data(interrupted_cleaner(raw_data, 2023, 100))
+    db_manager.conn.close()
+    assert 0 < count_year('ozone', 2023) < count_year('ozone', 2023, 'reference.db')
+
+    DatabaseManager('air.db').load_all_raw_data(raw_data())
+    for table_name in ['AQIdata', 'temperatures', 'ozone', 'rollup_daily', 'rollup_yearly', 'rollup_site_yearly',
+                       'location_lookup', 'correlation_stats', 'cbsa_daily', 'monitor_latest']:
+        assert contents(table_name) == contents(table_name, 'reference.db'), table_name
+
+
+def test_reloading_the_same_files_adds_no_rows(raw_data):
+    DatabaseManager('air.db').load_all_raw_data(raw_data())
+    loaded = {table_name: contents(table_name) for table_name in ['AQIdata', 'temperatures', 'ozone', 'rollup_daily']}
+
+    db_manager = DatabaseManager('air.db')
+    db_manager.load_all_raw_data(raw_data())
+    assert sum(stats['rows'] for stats in db_manager.load_stats.values()) == 0
+    for table_name, rows in loaded.items():
+        assert contents(table_name) == rows, table_name
+
+
+# The reading the loader keeps for each site-day of a raw file: highest 1st Max Value, then highest
+# Arithmetic Mean, then the earliest 1st Max Hour
+def kept_readings(path):
+    df = pd.read_csv(path)
+    df = df.sort_values(['1st Max Value', 'Arithmetic Mean', '1st Max Hour'], ascending=[False, False, True])
+    df = df.drop_duplicates(['Latitude', 'Longitude', 'Date Local'])
+    return sorted(df[['Latitude', 'Longitude', 'Date Local', 'Arithmetic Mean', '1st Max Value',
+                      '1st Max Hour']].itertuples(index=False, name=None))
+
+
+def stored_readings(table_name, year):
+    conn = sqlite3.connect('air.db')
+    try:
+        return sorted(conn.execute(f'''
+            SELECT Latitude, Longitude, "Date Local", "Arithmetic Mean", "1st Max Value", "1st Max Hour"
+            FROM "{table_name}" WHERE "Date Local" LIKE ?
+        ''', (f'{year}-%',)).fetchall())
+    finally:
+        conn.close()
+
+
+def test_changed_file_replaces_its_year(raw_data):
+    DatabaseManager('air.db').load_all_raw_data(raw_data())
+    assert stored_readings('ozone', 2023) == kept_readings('data/daily_ozone/daily_44201_2023.csv')
+    year_before = stored_readings('ozone', 2022)
+
+    # the new file only has the first CBSA, with other readings
+    path = 'data/daily_ozone/daily_44201_2023.csv'
+    rows = [row for row in site_rows(2023, random.Random(11), '44201', OZONE_SITES) if row[27] == CBSAS[0][0]]
+    write_csv(path, SITE_HEADER, rows)
+    DatabaseManager('air.db').load_all_raw_data(raw_data())
+
+    assert stored_readings('ozone', 2023) == kept_readings(path)
+    assert stored_readings('ozone', 2022) == year_before
+
+
+@pytest.mark.parametrize('table_name', ['AQIdata', 'ozone', 'temperatures'])
+def test_daily_rollup_matches_the_table(raw_data, table_name):
+    DatabaseManager('air.db').load_all_raw_data(raw_data())
+    conn = sqlite3.connect('air.db')
+    try:
+        df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
+        rollup = pd.read_sql_query('SELECT * FROM rollup_daily WHERE table_name = ?', conn, params=(table_name,))
+        yearly = pd.read_sql_query("SELECT * FROM rollup_yearly WHERE table_name = ? AND level = 'cbsa'", conn,
+                                   params=(table_name,))
+    finally:
+        conn.close()
+
+    if table_name == 'AQIdata':
+        df = df.rename(columns={'CBSA': 'area', 'Date': 'day', 'AQI': 'value'}).assign(max=lambda d: d['value'])
+    else:
+        df = df.rename(columns={'CBSA Name': 'area', 'Date Local': 'day', 'Arithmetic Mean': 'value',
+                                '1st Max Value': 'max'})
+    for level, area in (('cbsa', 'area'), ('state', 'State')):
+        expected = df.groupby([area, 'day']).agg(mean=('value', 'mean'), max=('max', 'max'))
+        actual = rollup[rollup['level'] == level].set_index(['area', 'day'])[['mean', 'max']]
+        expected.index.names = actual.index.names
+        pd.testing.assert_frame_equal(actual.sort_index(), expected.sort_index(), check_dtype=False)
+
+    daily_max = df.groupby(['area', 'day'])['max'].max().reset_index()
+    daily_max['year'] = daily_max['day'].str[:4]
+    threshold = DatabaseManager.EXCEEDANCE_THRESHOLDS[table_name]
+    expected = daily_max.assign(exceeded=daily_max['max'] > threshold).groupby(['area', 'year'])['exceeded'].sum()
+    actual = yearly.set_index(['area', 'year'])['exceedance_days']
+    assert actual.sort_index().tolist() == expected.sort_index().tolist()
+    assert actual.sum() > 0 or table_name == 'temperatures'
@@ -0,0 +1,93 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+from DatabaseManager import DatabaseManager, page_key
+from eda import EDA
+
+
+@pytest.fixture
+def eda(raw_data):
+    DatabaseManager('air.db').load_all_raw_data(raw_data())
+    return EDA('air.db')
+
+
+@pytest.mark.parametrize('table_name', ['ozone', 'temperatures'])
+def test_monitors_in_bbox_only_returns_the_tables_monitors(eda, table_name):
+    everything = eda.monitors_in_bbox(30, -90, 40, -80)
+    monitors = eda.monitors_in_bbox(30, -90, 40, -80, table_name=table_name)
+    assert 0 < len(monitors) < everything['site_id'].nunique()
+    assert (monitors['table_name'] == table_name).all()
+    assert monitors['Arithmetic Mean'].notna().all()
+
+
+@pytest.mark.parametrize('table_name', ['ozone', 'temperatures'])
+def test_nearest_monitors_only_returns_the_tables_monitors(eda, table_name):
+    nearest = eda.nearest_monitors(33.5, -86.5, k=3, table_name=table_name)
+    assert len(nearest) == 3
+    assert (nearest['table_name'] == table_name).all()
+    assert nearest['Arithmetic Mean'].notna().all()
+    assert nearest['distance km'].is_monotonic_increasing
+
+    # the three nearest of that table's monitors, whatever other tables have closer
+    sites = eda.monitors_in_bbox(-90, -180, 90, 180, table_name=table_name)
+    assert len(sites) > 3
+    assert set(nearest['site_id']) <= set(sites['site_id'])
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_site_rollup_falls_back_to_the_table(eda, compact):
+    eda.compact = compact
+    from_rollup = eda.load_site_rollup('ozone', state='AL').sort_values(['Latitude', 'Longitude'])
+    # a database loaded before the rollups existed
+    conn = sqlite3.connect('air.db')
+    conn.execute('DROP TABLE rollup_site_yearly')
+    conn.execute('DROP TABLE rollup_yearly')
+    conn.close()
+
+    from_table = eda.load_site_rollup('ozone', state='AL').sort_values(['Latitude', 'Longitude'])
+    assert len(from_table) == len(from_rollup) > 0
+    np.testing.assert_allclose(from_table['Arithmetic Mean'], from_rollup['Arithmetic Mean'], rtol=1e-5)
+    np.testing.assert_array_equal(from_table['days'], from_rollup['days'])
+    assert eda.plot_cbsa_choropleth('AL') is None
+
+
+@pytest.mark.parametrize('state, cbsa', [('AL', None), ('CA', 'Fresno, CA')])
+def test_correlations_fall_back_to_the_tables(eda, state, cbsa):
+    from_stats = eda.correlation_from_stats(state, cbsa)
+    from_tables = eda.correlation_from_tables(state, cbsa)
+    assert from_stats.loc['AQI', 'Ozone'] == pytest.approx(from_tables.loc['AQI', 'Ozone'])
+    np.testing.assert_allclose(from_tables.to_numpy(), from_stats.to_numpy(), atol=1e-9)
+
+    # a database loaded before the statistics existed still gets its matrix
+    conn = sqlite3.connect('air.db')
+    conn.execute('DROP TABLE correlation_stats')
+    conn.close()
+    fig = eda.analyze_correlations(state, cbsa)
+    np.testing.assert_allclose(fig.data[0].z, from_stats.to_numpy(), atol=1e-9)
+
+
+@pytest.mark.parametrize('table_name', ['AQIdata', 'ozone'])
+@pytest.mark.parametrize('order', ['cbsa', 'date'])
+@pytest.mark.parametrize('descending', [False, True])
+def test_paging_forward_then_back_returns_the_same_rows(eda, table_name, order, descending):
+    key = page_key(table_name, order)
+    pages = [eda.load_page(table_name, 'AL', order=order, descending=descending, page_size=7)]
+    while pages[-1]['has_next']:
+        pages.append(eda.load_page(table_name, 'AL', order=order, descending=descending, after=pages[-1]['last'],
+                                   page_size=7))
+    assert not pages[0]['has_previous'] and len(pages) > 2
+
+    # every row once, in key order
+    rows = pd.concat([page['rows'] for page in pages], ignore_index=True)
+    expected = eda.load_data(table_name, state='AL').sort_values(key, ascending=not descending,
+                                                                  ignore_index=True)
+    pd.testing.assert_frame_equal(rows, expected[rows.columns])
+
+    page = pages[-1]
+    for previous in reversed(pages[:-1]):
+        page = eda.load_page(table_name, 'AL', order=order, descending=descending, before=page['first'],
+                             page_size=7)
+        pd.testing.assert_frame_equal(page['rows'], previous['rows'])
+        assert page['has_next']
+    assert not page['has_previous']
@@ -0,0 +1,41 @@
+import os
+import sqlite3
+from FigureCache import FigureCache
+
+
+def bump_version(db_name):
+    conn = sqlite3.connect(db_name)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    conn.execute(f'PRAGMA user_version = {version + 1}')
+    conn.close()
+
+
+def test_fragments_belong_to_one_data_version(tmp_path):
+    db_name = str(tmp_path / 'air.db')
+    sqlite3.connect(db_name).close()
+    cache = FigureCache(db_name, directory=str(tmp_path / 'figure_cache'))
+
+    cache.put('heatmap', '<div>v0</div>', cache.database_signature())
+    assert cache.get('heatmap') == '<div>v0</div>'
+    # a restarted process finds it on disk
+    assert FigureCache(db_name, directory=str(tmp_path / 'figure_cache')).get('heatmap') == '<div>v0</div>'
+
+    bump_version(db_name)
+    assert cache.get('heatmap') is None
+    # the next fragment written clears out the old version's
+    cache.put('heatmap', '<div>v1</div>', cache.database_signature())
+    assert os.listdir(tmp_path / 'figure_cache') == [os.path.basename(cache.path_for('heatmap'))]
+
+
+def test_fragment_built_across_a_load_is_dropped(tmp_path):
+    db_name = str(tmp_path / 'air.db')
+    sqlite3.connect(db_name).close()
+    cache = FigureCache(db_name, directory=str(tmp_path / 'figure_cache'))
+
+    version = cache.database_signature()
+    # the load finishes while the figure is being built
+    bump_version(db_name)
+    cache.put('heatmap', '<div>stale</div>', version)
+
+    assert cache.get('heatmap') is None
+    assert FigureCache(db_name, directory=str(tmp_path / 'figure_cache')).get('heatmap') is None
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from OnlineStats import FixedHistogram, QuantileSketch, RunningStats
+
+
+@pytest.fixture
+def data():
+    values = np.random.default_rng(3).lognormal(size=100000)
+    values[::997] = np.nan
+    return values
+
+
+def test_running_stats_matches_numpy(data):
+    stats = RunningStats()
+    for chunk in np.array_split(data, 37):
+        stats.update(chunk)
+    values = data[~np.isnan(data)]
+    assert stats.count == len(values)
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert stats.std == pytest.approx(values.std(ddof=1), rel=1e-10)
+    assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+def test_running_stats_merge(data):
+    left, right, whole = RunningStats(), RunningStats(), RunningStats()
+    left.update(data[:30000])
+    right.update(data[30000:])
+    whole.update(data)
+    left.merge(right)
+    assert left.count == whole.count
+    assert left.mean == pytest.approx(whole.mean, rel=1e-12)
+    assert left.variance == pytest.approx(whole.variance, rel=1e-10)
+
+
+# Every estimate lies between np.quantile at q - bound and q + bound, bound being twice the ~1/k rank error
+def assert_within_rank_error(sketch, values, bound):
+    qs = np.linspace(0.01, 0.99, 99)
+    for q, estimate in zip(qs, sketch.quantiles(qs)):
+        low, high = np.quantile(values, [max(q - bound, 0), min(q + bound, 1)])
+        assert low <= estimate <= high, q
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_quantile_sketch_within_error_bound(data, seed):
+    sketch = QuantileSketch(k=200, seed=seed)
+    for chunk in np.array_split(data, 37):
+        sketch.update(chunk)
+    values = data[~np.isnan(data)]
+    assert sketch.count == len(values)
+    assert_within_rank_error(sketch, values, 2 / sketch.k)
+    # memory stays bounded by k, not by the stream length
+    assert sum(len(items) for items in sketch.levels) < 4 * sketch.k
+
+
+def test_quantile_sketch_merge_within_error_bound(data):
+    sketches = [QuantileSketch(k=200, seed=seed) for seed in range(4)]
+    for sketch, chunk in zip(sketches, np.array_split(data, 4)):
+        sketch.update(chunk)
+    for sketch in sketches[1:]:
+        sketches[0].merge(sketch)
+    assert_within_rank_error(sketches[0], data[~np.isnan(data)], 2 / sketches[0].k)
+
+
+def test_quantile_sketch_small_input_is_exact():
+    sketch = QuantileSketch(k=200)
+    sketch.update([5, 1, 3, 2, 4])
+    assert sketch.quantiles([0, 0.5, 1]) == [1, 3, 5]
+    assert np.isnan(QuantileSketch().quantile(0.5))
+
+
+def test_fixed_histogram_matches_numpy(data):
+    histogram = FixedHistogram(0, 10, bins=20)
+    for chunk in np.array_split(data, 7):
+        histogram.update(chunk)
+    values = data[~np.isnan(data)]
+    counts, _ = np.histogram(values, bins=np.linspace(0, 10, 21))
+    np.testing.assert_array_equal(histogram.counts, counts)
+    assert histogram.overflow == (values > 10).sum()
+    assert histogram.underflow == 0
+
+
+def test_fixed_histogram_merge_needs_same_bins():
+    with pytest.raises(ValueError):
+        FixedHistogram(0, 10).merge(FixedHistogram(0, 5))
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from SiteIndex import SiteIndex, haversine_km
+
+
+# Random sites over the whole sphere, including both poles and the antimeridian
+@pytest.fixture
+def sites():
+    rng = np.random.default_rng(7)
+    latitudes = np.degrees(np.arcsin(rng.uniform(-1, 1, 500)))
+    longitudes = rng.uniform(-180, 180, 500)
+    latitudes[:4] = [90, -90, 10, 10]
+    longitudes[:4] = [0, 0, 179.9, -179.9]
+    return latitudes, longitudes
+
+
+# k nearest by computing every distance
+def brute_force(latitudes, longitudes, latitude, longitude, k, radius_km=None):
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    order = np.argsort(distances, kind='stable')
+    if radius_km is not None:
+        order = order[distances[order] <= radius_km]
+    return order[:k], distances[order[:k]]
+
+
+def test_haversine_known_distance():
+    # one degree of latitude along a meridian
+    assert haversine_km(0, 0, 1, 0) == pytest.approx(111.195, abs=0.01)
+    assert haversine_km(10, 179.9, 10, -179.9) == pytest.approx(haversine_km(10, 0, 10, 0.2))
+
+
+@pytest.mark.parametrize('k', [1, 5, 40])
+def test_query_matches_brute_force(sites, k):
+    latitudes, longitudes = sites
+    index = SiteIndex(latitudes, longitudes, leaf_size=8)
+    rng = np.random.default_rng(k)
+    for latitude, longitude in zip(rng.uniform(-90, 90, 50), rng.uniform(-180, 180, 50)):
+        found, distances = index.query(latitude, longitude, k=k)
+        expected, expected_distances = brute_force(latitudes, longitudes, latitude, longitude, k)
+        np.testing.assert_allclose(distances, expected_distances, atol=1e-6)
+        np.testing.assert_allclose(haversine_km(latitude, longitude, latitudes[found], longitudes[found]),
+                                   distances, atol=1e-6)
+
+
+def test_query_across_antimeridian(sites):
+    latitudes, longitudes = sites
+    index = SiteIndex(latitudes, longitudes)
+    found, distances = index.query(10, 179.95, k=2)
+    assert set(found) == {2, 3}
+    assert distances.max() < 20
+
+
+def test_query_radius_matches_brute_force(sites):
+    latitudes, longitudes = sites
+    index = SiteIndex(latitudes, longitudes)
+    for latitude, longitude, radius_km in [(35, -100, 1500), (89, 45, 800), (0, 180, 2000)]:
+        found, distances = index.query_radius(latitude, longitude, radius_km)
+        expected, _ = brute_force(latitudes, longitudes, latitude, longitude, len(latitudes), radius_km)
+        assert set(found) == set(expected)
+        assert np.all(np.diff(distances) >= 0)
+
+
+def test_query_many_pads_missing_neighbours(sites):
+    latitudes, longitudes = sites
+    index = SiteIndex(latitudes, longitudes)
+    found, distances = index.query_many([10, 0], [179.95, 0], k=3, radius_km=50)
+    assert set(found[0, :2]) == {2, 3}
+    assert found[0, 2] == -1 and np.isnan(distances[0, 2])
+
+
+def test_empty_index():
+    index = SiteIndex([], [])
+    found, distances = index.query(0, 0, k=3)
+    assert len(index) == 0 and len(found) == 0 and len(distances) == 0